@@ -0,0 +1,143 @@
+#SPDX-License-Identifier: MIT
+"""Defines the DatasetCache class that shares the dataframes the report endpoints are built from."""
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+
+from typing import Callable, Optional
+
+import pandas as pd
+
+
+class DatasetCache():
+    """Size bounded cache of dataframes stored as parquet files on local disk.
+
+    The files are shared by every gunicorn worker on the host, so a report page whose charts are
+    served by different workers still runs the query behind them once.
+    When the files take more than max_bytes the least recently used ones are removed.
+
+    Attributes:
+        logger (logging.Logger): handles logging
+        directory (str): directory the parquet files are stored in
+        max_bytes (int): total size the files may take before the least recently used are evicted
+        expire (int): seconds a dataset stays valid
+    """
+
+    def __init__(self, logger: logging.Logger, directory: str, max_bytes: int, expire: int = 604800):
+
+        self.logger = logger
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.expire = expire
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Get a cached dataset.
+
+        Returns:
+            the dataframe or None on a miss
+        """
+
+        path = self._path(key)
+
+        try:
+            if os.path.getmtime(path) + self.expire < time.time():
+                self._remove(path)
+                return None
+
+            data = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Unable to read cached dataset {key}: {e}")
+            self._remove(path)
+            return None
+
+        # the access time is not reliable on noatime mounts, so the modification time tracks recent use
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return data
+
+    def set(self, key: str, data: pd.DataFrame) -> None:
+        """Store a dataset and evict the least recently used datasets if the cache is too large."""
+
+        path = self._path(key)
+
+        # written to a unique file first so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        try:
+            data.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f"Unable to cache dataset {key}: {e}")
+            self._remove(tmp_path)
+            return
+
+        self._evict()
+
+    def get_or_create(self, key: str, createfunc: Callable[[], pd.DataFrame], cacheable: Optional[Callable[[], bool]] = None) -> pd.DataFrame:
+        """Get a cached dataset or create and cache it.
+
+        Args:
+            key: key of the dataset
+            createfunc: function that creates the dataset on a miss
+            cacheable: called before createfunc on a miss, the dataset is only cached if it returns True
+        """
+
+        data = self.get(key)
+        if data is not None:
+            self.logger.debug(f"Dataset cache hit for {key}")
+            return data
+
+        # checked before the dataset is created, a check after it can't tell what the dataset read
+        store = cacheable is None or cacheable()
+
+        data = createfunc()
+
+        if store:
+            self.set(key, data)
+
+        return data
+
+    def _path(self, key: str) -> str:
+
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".parquet")
+
+    def _evict(self) -> None:
+
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".parquet"):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
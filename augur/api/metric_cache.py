@@ -0,0 +1,242 @@
+#SPDX-License-Identifier: MIT
+"""Defines the MetricCache class that caches the responses of the standard metric endpoints."""
+
+import time
+import logging
+import threading
+
+from collections import OrderedDict, Counter
+from typing import Any, Callable, Optional
+
+from redis import exceptions
+
+from augur import instance_id
+
+# seconds the hits and misses are counted in process before they are added to the stats in redis
+STATS_FLUSH_INTERVAL = 10
+
+
+class MetricCache():
+    """Two tier cache for the serialized responses (json, arrow or parquet) of metric endpoints.
+
+    The first tier is an in-process LRU so repeated calls to the same gunicorn worker don't leave the process.
+    The second tier is redis, so every gunicorn worker benefits from a response that any of them computed.
+
+    Attributes:
+        logger (logging.Logger): handles logging
+        redis: connection to the shared redis cache that does not decode responses, None to only use the in-process tier
+        max_entries (int): number of responses the in-process tier keeps
+        expire (int): seconds a cached response stays valid
+        stats_redis_key (str): key of the redis hash that counts the hits and misses of each metric
+
+    Note:
+        The hits and misses are counted in process and added to the redis hash at most
+            every STATS_FLUSH_INTERVAL seconds, so a local hit doesn't go over the network
+    """
+
+    def __init__(self, logger: logging.Logger, redis=None, max_entries: int = 512, expire: int = 3600):
+
+        self.logger = logger
+        self.redis = redis
+        self.max_entries = max_entries
+        self.expire = expire
+
+        self.redis_key_prefix = f"{instance_id}_metric_cache"
+        self.stats_redis_key = f"{instance_id}_metric_cache_stats"
+
+        # maps keys to (expires_at, body) in least recently used order
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+        # hits and misses that were not added to redis yet
+        self._pending_stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._stats_flushed_at = time.monotonic()
+
+    @staticmethod
+    def make_key(metric_name: str, path_args: dict, query_args: dict, data_versions: Optional[dict] = None) -> str:
+        """Build a normalized cache key for a metric request.
+
+        Args:
+            metric_name: name of the metric function
+            path_args: arguments taken from the route e.g. repo_id
+            query_args: query parameters of the request
+            data_versions: data versions of the repos the request covers, so the key changes when their data does
+
+        Returns:
+            key that is the same for requests that only differ in the order of their query parameters
+        """
+
+        path = "&".join(f"{key}={value}" for key, value in sorted(path_args.items()))
+        query = "&".join(f"{key}={value}" for key, value in sorted(query_args.items()))
+        versions = "&".join(f"{key}={value}" for key, value in sorted((data_versions or {}).items()))
+
+        return f"{metric_name}|{path}|{query}|{versions}"
+
+    def get(self, key: str, metric_name: str = "") -> Optional[bytes]:
+        """Get a cached response, checking the in-process tier before redis.
+
+        Returns:
+            the cached body or None on a miss
+        """
+
+        now = time.time()
+        body = None
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                expires_at, body = entry
+                if expires_at > now:
+                    self._local.move_to_end(key)
+                else:
+                    body = None
+                    del self._local[key]
+
+        if body is not None:
+            self._record(metric_name, "local_hit")
+            return body
+
+        if self.redis is not None:
+            try:
+                body = self.redis.get(f"{self.redis_key_prefix}_{key}")
+            except exceptions.RedisError as e:
+                self.logger.debug(f"Unable to read metric cache from redis: {e}")
+                body = None
+
+            if body is not None:
+                if isinstance(body, str):
+                    body = body.encode()
+
+                self._set_local(key, body)
+                self._record(metric_name, "redis_hit")
+                return body
+
+        self._record(metric_name, "miss")
+        return None
+
+    def set(self, key: str, body: bytes) -> None:
+        """Store a response in both tiers."""
+
+        self._set_local(key, body)
+
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{self.redis_key_prefix}_{key}", body, ex=self.expire)
+            except exceptions.RedisError as e:
+                self.logger.debug(f"Unable to write metric cache to redis: {e}")
+
+    def get_or_create(self, key: str, createfunc: Callable[[], Any], metric_name: str = "", cacheable: Optional[Callable[[], bool]] = None) -> Any:
+        """Get a cached response or create and cache it.
+
+        Args:
+            key: key of the response
+            createfunc: function that creates the response on a miss
+            metric_name: name the hit or miss is counted under
+            cacheable: called before createfunc on a miss, the response is only cached if it returns True
+
+        Note:
+            Only str and bytes results are cached, anything else is returned as is.
+        """
+
+        body = self.get(key, metric_name)
+        if body is not None:
+            return body
+
+        # checked before the response is created, a check after it can't tell what the response read
+        store = cacheable is None or cacheable()
+
+        result = createfunc()
+
+        if isinstance(result, str):
+            result = result.encode()
+
+        if isinstance(result, bytes) and store:
+            self.set(key, result)
+
+        return result
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+
+        with self._lock:
+            self._local.clear()
+
+        if self.redis is not None:
+            try:
+                keys = list(self.redis.scan_iter(f"{self.redis_key_prefix}_*"))
+                if keys:
+                    self.redis.delete(*keys)
+            except exceptions.RedisError as e:
+                self.logger.debug(f"Unable to clear metric cache in redis: {e}")
+
+    def get_stats(self) -> dict:
+        """Get the hits and misses of each metric.
+
+        Returns:
+            dict that maps metric names to their local_hit, redis_hit and miss counts
+        """
+
+        stats = {}
+
+        if self.redis is None:
+            return stats
+
+        self.flush_stats()
+
+        try:
+            counts = self.redis.hgetall(self.stats_redis_key)
+        except exceptions.RedisError as e:
+            self.logger.debug(f"Unable to read metric cache stats from redis: {e}")
+            return stats
+
+        for field, count in counts.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+
+            metric_name, outcome = field.rsplit(":", 1)
+            stats.setdefault(metric_name, {"local_hit": 0, "redis_hit": 0, "miss": 0})[outcome] = int(count)
+
+        return stats
+
+    def _set_local(self, key: str, body: bytes) -> None:
+
+        with self._lock:
+            self._local[key] = (time.time() + self.expire, body)
+            self._local.move_to_end(key)
+
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def flush_stats(self) -> None:
+        """Add the hits and misses counted in process to the stats in redis."""
+
+        with self._stats_lock:
+            pending = self._pending_stats
+            self._pending_stats = Counter()
+            self._stats_flushed_at = time.monotonic()
+
+        if self.redis is None or not pending:
+            return
+
+        try:
+            pipeline = self.redis.pipeline()
+            for field, count in pending.items():
+                pipeline.hincrby(self.stats_redis_key, field, count)
+            pipeline.execute()
+        except exceptions.RedisError as e:
+            self.logger.debug(f"Unable to record metric cache stats: {e}")
+
+    def _record(self, metric_name: str, outcome: str) -> None:
+
+        self.logger.debug(f"Metric cache {outcome} for {metric_name}")
+
+        if self.redis is None or not metric_name:
+            return
+
+        with self._stats_lock:
+            self._pending_stats[f"{metric_name}:{outcome}"] += 1
+            flush = time.monotonic() - self._stats_flushed_at >= STATS_FLUSH_INTERVAL
+
+        if flush:
+            self.flush_stats()
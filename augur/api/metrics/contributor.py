@@ -9,8 +9,8 @@ import pandas as pd
 from augur.api.util import register_metric
 import uuid 
 
-from augur.application.db.engine import create_database_engine
-engine = create_database_engine()
+from augur.application.db.engine import get_read_database_engine
+engine = get_read_database_engine()
 
 @register_metric()
 def contributors(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
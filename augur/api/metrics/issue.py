@@ -8,8 +8,8 @@ import sqlalchemy as s
 import pandas as pd
 from augur.api.util import register_metric
 
-from augur.application.db.engine import create_database_engine
-engine = create_database_engine()
+from augur.application.db.engine import get_read_database_engine
+engine = get_read_database_engine()
 
 @register_metric()
 def issues_first_time_opened(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
@@ -147,8 +147,8 @@ def issues_first_time_closed(repo_group_id, repo_id=None, period='day', begin_da
 
     return results
 
-@register_metric()
-def issues_new(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
+@register_metric(multi_repo=True)
+def issues_new(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None, repo_ids=None):
     """Returns a timeseries of new issues opened.
 
     :param repo_group_id: The repository's repo_group_id
@@ -156,6 +156,7 @@ def issues_new(repo_group_id, repo_id=None, period='day', begin_date=None, end_d
     :param period: To set the periodicity to 'day', 'week', 'month' or 'year', defaults to 'day'
     :param begin_date: Specifies the begin date, defaults to '1970-1-1 00:00:00'
     :param end_date: Specifies the end date, defaults to datetime.now()
+    :param repo_ids: List of repo_ids that are evaluated in one query, defaults to None
     :return: DataFrame of new issues/period
     """
     if not begin_date:
@@ -163,48 +164,65 @@ def issues_new(repo_group_id, repo_id=None, period='day', begin_date=None, end_d
     if not end_date:
         end_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    issues_new_SQL = ''
+    # the daily counts are kept in repo_daily_activity by collection, so only the days in the range are aggregated
+    if repo_ids:
+        issues_new_SQL = s.sql.text("""
+            SELECT
+                repo_daily_activity.repo_id,
+                repo_name,
+                date_trunc(:period, day) as date,
+                SUM(issues_opened) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = ANY(:repo_ids)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_opened > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
+        """)
+
+        results = pd.read_sql(issues_new_SQL, engine, params={'repo_ids': list(repo_ids), 'period': period,
+                                                              'begin_date': begin_date, 'end_date': end_date})
+        return results
 
     if not repo_id:
         issues_new_SQL = s.sql.text("""
             SELECT
-                issues.repo_id,
+                repo_daily_activity.repo_id,
                 repo_name,
-                date_trunc(:period, issues.created_at::DATE) as date,
-                COUNT(issue_id) as issues
-            FROM issues JOIN repo ON issues.repo_id = repo.repo_id
-            WHERE issues.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
-            AND issues.created_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            AND issues.pull_request IS NULL
-            GROUP BY issues.repo_id, date, repo_name
-            ORDER BY issues.repo_id, date
+                date_trunc(:period, day) as date,
+                SUM(issues_opened) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_opened > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
         """)
 
         results = pd.read_sql(issues_new_SQL, engine, params={'repo_group_id': repo_group_id, 'period': period,
-                                                               'begin_date': begin_date, 'end_date': end_date})
-
+                                                              'begin_date': begin_date, 'end_date': end_date})
         return results
 
     else:
         issues_new_SQL = s.sql.text("""
             SELECT
                 repo_name,
-                date_trunc(:period, issues.created_at::DATE) as date,
-                COUNT(issue_id) as issues
-            FROM issues JOIN repo ON issues.repo_id = repo.repo_id
-            WHERE issues.repo_id = :repo_id
-            AND issues.created_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            AND issues.pull_request IS NULL
+                date_trunc(:period, day) as date,
+                SUM(issues_opened) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = :repo_id
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_opened > 0
             GROUP BY date, repo_name
-            ORDER BY date;
+            ORDER BY date
         """)
 
         results = pd.read_sql(issues_new_SQL, engine, params={'repo_id': repo_id, 'period': period,
-                                                               'begin_date': begin_date, 'end_date': end_date})
+                                                              'begin_date': begin_date, 'end_date': end_date})
         return results
 
-@register_metric()
-def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
+@register_metric(multi_repo=True)
+def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None, repo_ids=None):
     """Returns a timeseries of issues active.
 
     :param repo_group_id: The repository's repo_group_id
@@ -212,6 +230,7 @@ def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, en
     :param period: To set the periodicity to 'day', 'week', 'month' or 'year', defaults to 'day'
     :param begin_date: Specifies the begin date, defaults to '1970-1-1 00:00:00'
     :param end_date: Specifies the end date, defaults to datetime.now()
+    :param repo_ids: List of repo_ids that are evaluated in one query, defaults to None
     :return: DataFrame of issues active/period
     """
     if not begin_date:
@@ -219,21 +238,39 @@ def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, en
     if not end_date:
         end_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    # the daily issue event counts are kept in repo_daily_activity by collection, so only the days in the range are aggregated
+    if repo_ids:
+        issues_active_SQL = s.sql.text("""
+            SELECT
+                repo_daily_activity.repo_id,
+                repo_name,
+                date_trunc(:period, day) as date,
+                SUM(issue_events) AS issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = ANY(:repo_ids)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issue_events > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
+        """)
+
+        results = pd.read_sql(issues_active_SQL, engine, params={'repo_ids': list(repo_ids), 'period': period,
+                                                                 'begin_date': begin_date, 'end_date': end_date})
+        return results
+
     if not repo_id:
         issues_active_SQL = s.sql.text("""
             SELECT
-                issues.repo_id,
+                repo_daily_activity.repo_id,
                 repo_name,
-                date_trunc(:period, issue_events.created_at) as date,
-                COUNT(issues.issue_id) AS issues
-            FROM issues, repo, issue_events
-            WHERE issues.issue_id = issue_events.issue_id
-            AND issues.repo_id = repo.repo_id
-            AND issues.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
-            AND issue_events.created_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            and issues.pull_request IS NULL
-            GROUP BY issues.repo_id, date, repo_name
-            ORDER BY issues.repo_id, date
+                date_trunc(:period, day) as date,
+                SUM(issue_events) AS issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issue_events > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
         """)
 
         results = pd.read_sql(issues_active_SQL, engine, params={'repo_group_id': repo_group_id, 'period':period,
@@ -244,14 +281,12 @@ def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, en
         issues_active_SQL = s.sql.text("""
             SELECT
                 repo_name,
-                date_trunc(:period, issue_events.created_at) as date,
-                COUNT(issues.issue_id) AS issues
-            FROM issues, repo, issue_events
-            WHERE issues.issue_id = issue_events.issue_id
-            AND issues.repo_id = repo.repo_id
-            AND issues.repo_id = :repo_id
-            AND issue_events.created_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            AND issues.pull_request IS NULL
+                date_trunc(:period, day) as date,
+                SUM(issue_events) AS issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = :repo_id
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issue_events > 0
             GROUP BY date, repo_name
             ORDER BY date
         """)
@@ -260,8 +295,8 @@ def issues_active(repo_group_id, repo_id=None, period='day', begin_date=None, en
                                                                   'begin_date': begin_date, 'end_date':end_date})
         return results
 
-@register_metric()
-def issues_closed(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
+@register_metric(multi_repo=True)
+def issues_closed(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None, repo_ids=None):
     """Returns a timeseries of issues closed.
 
     :param repo_group_id: The repository's repo_group_id
@@ -269,6 +304,7 @@ def issues_closed(repo_group_id, repo_id=None, period='day', begin_date=None, en
     :param period: To set the periodicity to 'day', 'week', 'month' or 'year', defaults to 'day'
     :param begin_date: Specifies the begin date, defaults to '1970-1-1 00:00:00'
     :param end_date: Specifies the end date, defaults to datetime.now()
+    :param repo_ids: List of repo_ids that are evaluated in one query, defaults to None
     :return: DataFrame of issues closed/period
     """
     if not begin_date:
@@ -276,44 +312,61 @@ def issues_closed(repo_group_id, repo_id=None, period='day', begin_date=None, en
     if not end_date:
         end_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+    # the daily counts are kept in repo_daily_activity by collection, so only the days in the range are aggregated
+    if repo_ids:
+        issues_closed_SQL = s.sql.text("""
+            SELECT
+                repo_daily_activity.repo_id,
+                repo_name,
+                date_trunc(:period, day) as date,
+                SUM(issues_closed) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = ANY(:repo_ids)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_closed > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
+        """)
+
+        results = pd.read_sql(issues_closed_SQL, engine, params={'repo_ids': list(repo_ids), 'period': period,
+                                                                 'begin_date': begin_date, 'end_date': end_date})
+        return results
+
     if not repo_id:
         issues_closed_SQL = s.sql.text("""
             SELECT
-                issues.repo_id,
+                repo_daily_activity.repo_id,
                 repo_name,
-                date_trunc(:period, closed_at::DATE) as date,
-                COUNT(issue_id) as issues
-            FROM issues JOIN repo ON issues.repo_id = repo.repo_id
-            WHERE issues.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
-            AND closed_at IS NOT NULL
-            AND closed_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            AND issues.pull_request IS NULL
-            GROUP BY issues.repo_id, date, repo_name
-            ORDER BY issues.repo_id, date
+                date_trunc(:period, day) as date,
+                SUM(issues_closed) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_closed > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
         """)
 
         results = pd.read_sql(issues_closed_SQL, engine, params={'repo_group_id': repo_group_id, 'period': period,
-                                                                   'begin_date': begin_date, 'end_date': end_date})
-
+                                                                 'begin_date': begin_date, 'end_date': end_date})
         return results
 
     else:
         issues_closed_SQL = s.sql.text("""
             SELECT
                 repo_name,
-                date_trunc(:period, closed_at::DATE) as date,
-                COUNT(issue_id) as issues
-            FROM issues JOIN repo ON issues.repo_id = repo.repo_id
-            WHERE issues.repo_id = :repo_id
-            AND closed_at IS NOT NULL
-            AND closed_at BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS') AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
-            AND issues.pull_request IS NULL
+                date_trunc(:period, day) as date,
+                SUM(issues_closed) as issues
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = :repo_id
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')::DATE
+            AND issues_closed > 0
             GROUP BY date, repo_name
-            ORDER BY date;
+            ORDER BY date
         """)
 
         results = pd.read_sql(issues_closed_SQL, engine, params={'repo_id': repo_id, 'period': period,
-                                                                'begin_date': begin_date, 'end_date': end_date})
+                                                                 'begin_date': begin_date, 'end_date': end_date})
         return results
 
 @register_metric()
@@ -8,8 +8,8 @@ import sqlalchemy as s
 import pandas as pd
 from augur.api.util import register_metric
 
-from augur.application.db.engine import create_database_engine
-engine = create_database_engine()
+from augur.application.db.engine import get_read_database_engine
+engine = get_read_database_engine()
 
 @register_metric()
 def pull_requests_merge_contributor_new(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
@@ -110,8 +110,8 @@ def pull_requests_closed_no_merge(repo_group_id, repo_id=None, period='day', beg
                                       'end_date': end_date})
     return results
 
-@register_metric()
-def reviews(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None):
+@register_metric(multi_repo=True)
+def reviews(repo_group_id, repo_id=None, period='day', begin_date=None, end_date=None, repo_ids=None):
     """ Returns a timeseris of new reviews or pull requests opened
 
     :param repo_group_id: The repository's repo_group_id
@@ -119,6 +119,7 @@ def reviews(repo_group_id, repo_id=None, period='day', begin_date=None, end_date
     :param period: To set the periodicity to 'day', 'week', 'month' or 'year', defaults to 'day'
     :param begin_date: Specifies the begin date, defaults to '1970-1-1 00:00:00'
     :param end_date: Specifies the end date, defaults to datetime.now()
+    :param repo_ids: List of repo_ids that are evaluated in one query, defaults to None
     :return: DataFrame of new reviews/period
     """
     if not begin_date:
@@ -126,46 +127,61 @@ def reviews(repo_group_id, repo_id=None, period='day', begin_date=None, end_date
     if not end_date:
         end_date = datetime.datetime.now().strftime('%Y-%m-%d')
 
+    # the daily counts are kept in repo_daily_activity by collection, so only the days in the range are aggregated
+    if repo_ids:
+        reviews_SQL = s.sql.text("""
+            SELECT
+                repo_daily_activity.repo_id,
+                repo_name,
+                date_trunc(:period, day) as date,
+                SUM(pull_requests_opened) as pull_requests
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = ANY(:repo_ids)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD')::DATE
+            AND pull_requests_opened > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
+        """)
+
+        results = pd.read_sql(reviews_SQL, engine, params={'repo_ids': list(repo_ids), 'period': period,
+                                                           'begin_date': begin_date, 'end_date': end_date})
+        return results
+
     if not repo_id:
         reviews_SQL = s.sql.text("""
             SELECT
-                pull_requests.repo_id,
+                repo_daily_activity.repo_id,
                 repo_name,
-                DATE_TRUNC(:period, pull_requests.pr_created_at) AS date,
-                COUNT(pr_src_id) AS pull_requests
-            FROM pull_requests JOIN repo ON pull_requests.repo_id = repo.repo_id
-            WHERE pull_requests.repo_id IN
-                (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
-            AND pull_requests.pr_created_at
-                BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD')
-                AND to_timestamp(:end_date, 'YYYY-MM-DD')
-            GROUP BY pull_requests.repo_id, repo_name, date
-            ORDER BY pull_requests.repo_id, date
+                date_trunc(:period, day) as date,
+                SUM(pull_requests_opened) as pull_requests
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD')::DATE
+            AND pull_requests_opened > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
         """)
 
-        results = pd.read_sql(reviews_SQL, engine,
-                              params={'period': period, 'repo_group_id': repo_group_id,
-                                      'begin_date': begin_date, 'end_date': end_date })
+        results = pd.read_sql(reviews_SQL, engine, params={'repo_group_id': repo_group_id, 'period': period,
+                                                           'begin_date': begin_date, 'end_date': end_date})
         return results
 
     else:
         reviews_SQL = s.sql.text("""
             SELECT
                 repo_name,
-                DATE_TRUNC(:period, pull_requests.pr_created_at) AS date,
-                COUNT(pr_src_id) AS pull_requests
-            FROM pull_requests JOIN repo ON pull_requests.repo_id = repo.repo_id
-            WHERE pull_requests.repo_id = :repo_id
-            AND pull_requests.pr_created_at
-                BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD HH24:MI:SS')
-                AND to_timestamp(:end_date, 'YYYY-MM-DD HH24:MI:SS')
+                date_trunc(:period, day) as date,
+                SUM(pull_requests_opened) as pull_requests
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = :repo_id
+            AND day BETWEEN to_timestamp(:begin_date, 'YYYY-MM-DD')::DATE AND to_timestamp(:end_date, 'YYYY-MM-DD')::DATE
+            AND pull_requests_opened > 0
             GROUP BY date, repo_name
             ORDER BY date
         """)
 
-        results = pd.read_sql(reviews_SQL, engine,
-                              params={'period': period, 'repo_id': repo_id,
-                                      'begin_date': begin_date, 'end_date': end_date})
+        results = pd.read_sql(reviews_SQL, engine, params={'repo_id': repo_id, 'period': period,
+                                                           'begin_date': begin_date, 'end_date': end_date})
         return results
 
 @register_metric()
@@ -11,8 +11,8 @@ import logging
 
 from augur.api.util import register_metric
 
-from augur.application.db.engine import create_database_engine
-engine = create_database_engine()
+from augur.application.db.engine import get_read_database_engine
+engine = get_read_database_engine()
 
 logger = logging.getLogger("augur")
 
@@ -96,19 +96,21 @@ def code_changes_lines(repo_group_id, repo_id=None, period='day', begin_date=Non
 
     code_changes_lines_SQL = ''
 
+    # the daily line counts are kept in repo_daily_activity by collection
     if not repo_id:
         code_changes_lines_SQL = s.sql.text("""
             SELECT
-                commits.repo_id,
+                repo_daily_activity.repo_id,
                 repo_name,
-                date_trunc(:period, cmt_author_date::DATE) as date,
-                SUM(cmt_added) as added,
-                SUM(cmt_removed) as removed
-            FROM commits JOIN repo ON commits.repo_id = repo.repo_id
-            WHERE commits.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
-            AND cmt_author_date BETWEEN :begin_date AND :end_date
-            GROUP BY commits.repo_id, date, repo_name
-            ORDER BY commits.repo_id, date
+                date_trunc(:period, day) as date,
+                SUM(lines_added)::BIGINT as added,
+                SUM(lines_removed)::BIGINT as removed
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
+            AND day BETWEEN CAST(:begin_date AS DATE) AND CAST(:end_date AS DATE)
+            AND commits > 0
+            GROUP BY repo_daily_activity.repo_id, date, repo_name
+            ORDER BY repo_daily_activity.repo_id, date
         """)
 
         results = pd.read_sql(code_changes_lines_SQL, engine, params={'repo_group_id': repo_group_id, 'period': period,
@@ -120,12 +122,13 @@ def code_changes_lines(repo_group_id, repo_id=None, period='day', begin_date=Non
         code_changes_lines_SQL = s.sql.text("""
             SELECT
                 repo_name,
-                date_trunc(:period, cmt_author_date::DATE) as date,
-                SUM(cmt_added) AS added,
-                SUM(cmt_removed) as removed
-            FROM commits JOIN repo ON commits.repo_id = repo.repo_id
-            WHERE commits.repo_id = :repo_id
-            AND cmt_author_date BETWEEN :begin_date AND :end_date
+                date_trunc(:period, day) as date,
+                SUM(lines_added)::BIGINT AS added,
+                SUM(lines_removed)::BIGINT as removed
+            FROM repo_daily_activity JOIN repo ON repo_daily_activity.repo_id = repo.repo_id
+            WHERE repo_daily_activity.repo_id = :repo_id
+            AND day BETWEEN CAST(:begin_date AS DATE) AND CAST(:end_date AS DATE)
+            AND commits > 0
             GROUP BY date, repo_name
             ORDER BY date;
         """)
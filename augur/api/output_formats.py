@@ -0,0 +1,93 @@
+#SPDX-License-Identifier: MIT
+"""Defines the formats metric endpoints can return their dataframes in."""
+
+import io
+
+from typing import Optional
+
+import pandas as pd
+
+JSON_FORMAT = "json"
+ARROW_FORMAT = "arrow"
+PARQUET_FORMAT = "parquet"
+
+FORMAT_MIMETYPES = {
+    JSON_FORMAT: "application/json",
+    ARROW_FORMAT: "application/vnd.apache.arrow.stream",
+    PARQUET_FORMAT: "application/vnd.apache.parquet"
+}
+
+MIMETYPE_FORMATS = {mimetype: output_format for output_format, mimetype in FORMAT_MIMETYPES.items()}
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised when a format is requested that the metric endpoints can't return."""
+
+
+def get_requested_format(format_arg: Optional[str], accept_mimetypes) -> str:
+    """Get the format a client asked for.
+
+    Args:
+        format_arg: value of the format query parameter, it takes precedence over the Accept header
+        accept_mimetypes: the Accept header of the request (request.accept_mimetypes)
+
+    Returns:
+        json, arrow or parquet
+
+    Raises:
+        UnsupportedFormatError: if the format query parameter is not a supported format
+    """
+
+    if format_arg:
+        output_format = format_arg.lower()
+        if output_format not in FORMAT_MIMETYPES:
+            raise UnsupportedFormatError(f"Unsupported format {format_arg}, supported formats are {', '.join(FORMAT_MIMETYPES)}")
+
+        return output_format
+
+    # json is listed first so it wins when the client accepts anything
+    best = accept_mimetypes.best_match(list(FORMAT_MIMETYPES.values()))
+
+    return MIMETYPE_FORMATS.get(best, JSON_FORMAT)
+
+
+def dataframe_to_bytes(data: pd.DataFrame, output_format: str) -> bytes:
+    """Serialize a dataframe to Arrow IPC stream or Parquet bytes.
+
+    Args:
+        data: dataframe returned by a metric
+        output_format: arrow or parquet
+
+    Returns:
+        the serialized dataframe
+
+    Raises:
+        UnsupportedFormatError: if the format is not arrow or parquet, or arrow can't infer the type of a column,
+            like an object column that mixes strings and numbers
+    """
+
+    # pyarrow is only imported when a columnar format is requested
+    import pyarrow as pa
+
+    # the index is only a row number for metric dataframes, unless the result was resampled
+    try:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid) as e:
+        raise UnsupportedFormatError(f"The result can't be returned as {output_format}, request it as json: {e}") from e
+
+    if output_format == ARROW_FORMAT:
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return sink.getvalue().to_pybytes()
+
+    if output_format == PARQUET_FORMAT:
+        import pyarrow.parquet as pq
+
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+
+        return buffer.getvalue()
+
+    raise UnsupportedFormatError(f"Unsupported format {output_format}")
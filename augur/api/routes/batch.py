@@ -9,7 +9,11 @@ import requests
 import sqlalchemy as s
 from sqlalchemy import exc
 from flask import request, Response
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from augur.api.util import metric_metadata
+from augur.application.db.instrumentation import get_current_query_context
+from urllib.parse import urlsplit, parse_qs
+from augur.api.output_formats import JSON_FORMAT
 import json
 
 AUGUR_API_VERSION = 'api/unstable'
@@ -18,78 +22,176 @@ logger = logging.getLogger(__name__)
 
 def create_routes(server):
 
-        @server.app.route('/{}/batch'.format(AUGUR_API_VERSION), methods=['GET', 'POST'])
-        def batch():
-            """
-            Execute multiple requests, submitted as a batch.
-            :statuscode 207: Multi status
+        app = server.app
+
+        # bounded pool shared by all the batches of this worker so a burst of batches can't exhaust the database pool
+        batch_workers = int(server.config.get_value('Server', 'batch_workers') or 8)
+        # seconds a whole batch may take before the unfinished sub-requests are reported as timed out
+        batch_deadline = int(server.config.get_value('Server', 'batch_timeout') or 60)
+
+        executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix="augur_batch")
+
+        batch_path = '/{}/batch'.format(AUGUR_API_VERSION)
+        batch_metadata_path = '/{}/batch/metadata'.format(AUGUR_API_VERSION)
+
+        def dispatch_sub_request(method, path, body, deadline):
+            """Run one sub-request of a batch through the flask app in its own request context.
+
+            Sub-requests that start after the deadline of their batch are not run, and the statements of the
+            ones that run are cancelled by postgres when the deadline passes, so they don't hold a worker
+            and a database connection after their batch reported them as timed out.
             """
 
-            if request.method == 'GET':
-                """this will return sensible defaults in the future"""
-                return app.make_response('{"status": "501", "response": "Defaults for batch requests not implemented. Please POST a JSON array of requests to this endpoint for now."}')
+            if time.monotonic() >= deadline:
+                return 504, deadline_exceeded_message()
+
+            logger.debug('batch-internal-loop: %s %s' % (method, path))
 
             try:
-                requests = json.loads(request.data.decode('utf-8'))
-            except ValueError as e:
-                request.abort(400)
+                with app.test_request_context(path,
+                                              method=method,
+                                              data=body):
+                    try:
+                        # Can modify flask.g here without affecting
+                        # flask.g of the root request for the batch
+
+                        # Pre process Request
+                        rv = app.preprocess_request()
+
+                        # the connections checked out by the sub-request get at most the time left until the deadline
+                        context = get_current_query_context()
+                        if context is not None:
+                            remaining_ms = max(int((deadline - time.monotonic()) * 1000), 1)
+                            context.statement_timeout = min(context.statement_timeout or remaining_ms, remaining_ms)
+
+                        if rv is None:
+                            # Main Dispatch
+                            rv = app.dispatch_request()
+
+                    except Exception as e:
+                        rv = app.handle_user_exception(e)
+
+                    response = app.make_response(rv)
+
+                    # Post process Request
+                    response = app.process_response(response)
+
+                # Response is a Flask response object.
+                # response.get_data() returns the bytes of the response.
+                # If your endpoints return JSON object,
+                # this string would be the response as a JSON string.
+                return response.status_code, str(response.get_data(), 'utf8')
+
+            except Exception as e:
+                return 500, str(e)
+
+        def reject_sub_request(path):
+            """Get the status and message of a sub-request that is answered without running it, None if it can run."""
+
+            url = urlsplit(path)
+
+            # a nested batch would wait for its sub-requests on the executor that is running it, which can deadlock
+            if url.path.rstrip('/') in (batch_path, batch_metadata_path):
+                return 400, "Batch sub-requests can't be batches themselves"
 
-            responses = []
+            # the sub-responses are embedded as text in the json body of the batch, which can't hold arrow or parquet bytes
+            formats = parse_qs(url.query).get('format', [])
+            if any(output_format.lower() != JSON_FORMAT for output_format in formats):
+                return 406, "Batch sub-requests can only return json"
 
-            for index, req in enumerate(requests):
+            return None
 
+        def deadline_exceeded_message():
 
+            return f"Request did not complete within the batch deadline of {batch_deadline} seconds"
+
+        def run_batch(sub_requests):
+            """Run the sub-requests of a batch concurrently and yield the 207 body as they complete.
+
+            Identical sub-requests (same method, path and body) are only executed once.
+            """
+
+            # maps each distinct sub-request to its arguments and the paths that asked for it
+            distinct_requests = {}
+            rejected_requests = []
+            for req in sub_requests:
                 method = req['method']
                 path = req['path']
                 body = req.get('body', None)
 
-                try:
+                rejection = reject_sub_request(path)
+                if rejection is not None:
+                    rejected_requests.append((path, *rejection))
+                    continue
 
-                    logger.debug('batch-internal-loop: %s %s' % (method, path))
+                key = (method, path, body if body is None or isinstance(body, str) else json.dumps(body, sort_keys=True))
+                distinct_requests.setdefault(key, {"args": (method, path, body), "paths": []})["paths"].append(path)
 
-                    with app.server.app.context():
-                        with app.test_request_context(path,
-                                                      method=method,
-                                                      data=body):
-                            try:
-                                # Can modify flask.g here without affecting
-                                # flask.g of the root request for the batch
+            deadline = time.monotonic() + batch_deadline
 
-                                # Pre process Request
-                                rv = app.preprocess_request()
+            futures = {executor.submit(dispatch_sub_request, *value["args"], deadline): key for key, value in distinct_requests.items()}
 
-                                if rv is None:
-                                    # Main Dispatch
-                                    rv = app.dispatch_request()
+            yield '['
+
+            first = True
+            for path, status, response in rejected_requests:
+                yield ('' if first else ',') + json.dumps({
+                    "path": path,
+                    "status": status,
+                    "response": response,
+                })
+                first = False
+
+            try:
+                for future in as_completed(futures, timeout=batch_deadline):
 
-                            except Exception as e:
-                                rv = app.handle_user_exception(e)
+                    status, response = future.result()
 
-                            response = app.make_response(rv)
+                    for path in distinct_requests[futures[future]]["paths"]:
+                        yield ('' if first else ',') + json.dumps({
+                            "path": path,
+                            "status": status,
+                            "response": response,
+                        })
+                        first = False
 
-                            # Post process Request
-                            response = app.process_response(response)
+            except FuturesTimeoutError:
 
-                    # Response is a Flask response object.
-                    # _read_response(response) reads response.response
-                    # and returns a string. If your endpoints return JSON object,
-                    # this string would be the response as a JSON string.
-                    responses.append({
-                        "path": path,
-                        "status": response.status_code,
-                        "response": str(response.get_data(), 'utf8'),
-                    })
+                for future, key in futures.items():
+                    if future.done():
+                        continue
 
-                except Exception as e:
+                    future.cancel()
+                    for path in distinct_requests[key]["paths"]:
+                        yield ('' if first else ',') + json.dumps({
+                            "path": path,
+                            "status": 504,
+                            "response": deadline_exceeded_message(),
+                        })
+                        first = False
+
+            yield ']'
+
+        @server.app.route(batch_path, methods=['GET', 'POST'])
+        def batch():
+            """
+            Execute multiple requests, submitted as a batch.
+            The sub-requests are executed concurrently and the results are streamed back in the order they complete.
+            :statuscode 207: Multi status
+            """
 
-                    responses.append({
-                        "path": path,
-                        "status": 500,
-                        "response": str(e)
-                    })
+            if request.method == 'GET':
+                """this will return sensible defaults in the future"""
+                return app.make_response('{"status": "501", "response": "Defaults for batch requests not implemented. Please POST a JSON array of requests to this endpoint for now."}')
 
+            try:
+                requests = json.loads(request.data.decode('utf-8'))
+            except ValueError as e:
+                return Response(response='{"status": "400", "response": "Batch requests must be a JSON array"}',
+                                status=400,
+                                mimetype="application/json")
 
-            return Response(response=json.dumps(responses),
+            return Response(response=run_batch(requests),
                             status=207,
                             mimetype="application/json")
 
@@ -101,7 +203,7 @@ def create_routes(server):
         @apiDescription Returns metadata of batch requests
         POST JSON of API requests metadata
         """
-        @server.app.route('/{}/batch/metadata'.format(AUGUR_API_VERSION), methods=['GET', 'POST'])
+        @server.app.route(batch_metadata_path, methods=['GET', 'POST'])
         def batch_metadata():
             """
             Returns endpoint metadata in batch format
@@ -114,44 +216,10 @@ def create_routes(server):
             try:
                 requests = json.loads(request.data.decode('utf-8'))
             except ValueError as e:
-                request.abort(400)
+                return Response(response='{"status": "400", "response": "Batch requests must be a JSON array"}',
+                                status=400,
+                                mimetype="application/json")
 
-            responses = []
-
-            for index, req in enumerate(requests):
-                method = req['method']
-                path = req['path']
-                body = req.get('body', None)
-
-                try:
-                    logger.info('batch endpoint: ' + path)
-                    with app.server.app.context():
-                        with app.test_request_context(path,
-                                                      method=method,
-                                                      data=body):
-                            try:
-                                rv = app.preprocess_request()
-                                if rv is None:
-                                    rv = app.dispatch_request()
-                            except Exception as e:
-                                rv = app.handle_user_exception(e)
-                            response = app.make_response(rv)
-                            response = app.process_response(response)
-
-                    responses.append({
-                        "path": path,
-                        "status": response.status_code,
-                        "response": str(response.get_data(), 'utf8'),
-                    })
-
-                except Exception as e:
-                    responses.append({
-                        "path": path,
-                        "status": 500,
-                        "response": str(e)
-                    })
-
-            return Response(response=json.dumps(responses),
+            return Response(response=run_batch(requests),
                             status=207,
                             mimetype="application/json")
-
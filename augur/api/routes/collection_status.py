@@ -34,7 +34,7 @@ def create_routes(server):
             WHERE
                 repo_status = 'Complete'
         """)
-        results = pd.read_sql(commit_collection_sql,  server.engine)
+        results = pd.read_sql(commit_collection_sql,  server.read_engine)
         data = results.to_json(
             orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
@@ -95,7 +95,7 @@ def create_routes(server):
                 ) D
             WHERE d.issues_enabled = 'true';
         """)
-        results = pd.read_sql(issue_collection_sql,  server.engine)
+        results = pd.read_sql(issue_collection_sql,  server.read_engine)
         data = results.to_json(
             orient="records", date_format='iso', date_unit='ms')
         parsed_data = json.loads(data)
@@ -165,7 +165,7 @@ def create_routes(server):
             ORDER BY
                 ratio_abs;
         """)
-        results = pd.read_sql(pull_request_collection_sql,  server.engine)
+        results = pd.read_sql(pull_request_collection_sql,  server.read_engine)
         data = results.to_json(
             orient="records", date_format='iso', date_unit='ms')
         parsed_data = json.loads(data)
@@ -70,6 +70,8 @@ def create_routes(server):
 
             session.commit()
 
+            session.config.snapshot.bump_version(logger)
+
         return jsonify({"status": "success"}), 200
 
 
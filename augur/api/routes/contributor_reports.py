@@ -6,11 +6,11 @@ import warnings
 import datetime
 import pandas as pd
 import json
+import functools
 from math import pi
-from flask import request, send_file, Response
+from flask import request, Response
 
 # import visualization libraries
-from bokeh.io import export_png
 from bokeh.embed import json_item
 from bokeh.plotting import figure
 from bokeh.models import Label, LabelSet, ColumnDataSource, Legend
@@ -18,6 +18,8 @@ from bokeh.palettes import Colorblind
 from bokeh.layouts import gridplot
 from bokeh.transform import cumsum
 
+from augur.api.routes.report_images import report_image, render_report_image
+
 AUGUR_API_VERSION = 'api/unstable'
 
 warnings.filterwarnings('ignore')
@@ -35,6 +37,14 @@ def create_routes(server):
 
     def new_contributor_data_collection(repo_id, required_contributions):
 
+        # the bar, stacked bar and pie charts all filter the same contributors,
+        # so the dataframe is only queried again when collection commits new data for the repo
+        return server.get_repo_dataset("new_contributor_data_collection", repo_id,
+                                       lambda: query_new_contributor_data(repo_id, required_contributions),
+                                       required_contributions=required_contributions)
+
+    def query_new_contributor_data(repo_id, required_contributions):
+
         rank_list = []
         for num in range(1, required_contributions + 1):
             rank_list.append(num)
@@ -294,7 +304,7 @@ def create_routes(server):
                 WHERE RANK IN {rank_tuple}
 
          """)
-        df = pd.read_sql(contributor_query,  server.engine)
+        df = pd.read_sql(contributor_query,  server.read_engine)
 
         df = df.loc[~df['full_name'].str.contains('bot', na=False)]
         df = df.loc[~df['login'].str.contains('bot', na=False)]
@@ -319,6 +329,13 @@ def create_routes(server):
 
     def months_data_collection(start_date, end_date):
 
+        # copied so the charts can't change the memoized dataframe
+        return query_months_data(start_date, end_date).copy()
+
+    # the months only depend on the date range
+    @functools.lru_cache(maxsize=128)
+    def query_months_data(start_date, end_date):
+
         # months_query makes a df of years and months, this is used to fill
         # the months with no data in the visualizations
         months_query = salc.sql.text(f"""        
@@ -335,7 +352,7 @@ def create_routes(server):
                         FROM generate_series (TIMESTAMP '{start_date}', TIMESTAMP '{end_date}', INTERVAL '1 month' ) created_month ) d ) x 
             ) y
         """)
-        months_df = pd.read_sql(months_query,  server.engine)
+        months_df = pd.read_sql(months_query,  server.read_engine)
 
         # add yearmonths to months_df
         months_df[['year', 'month']] = months_df[['year', 'month']].astype(float).astype(int).astype(str)
@@ -589,6 +606,7 @@ def create_routes(server):
             return df
 
     @server.app.route('/{}/contributor_reports/new_contributors_bar/'.format(AUGUR_API_VERSION), methods=["GET"])
+    @report_image
     def new_contributors_bar():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -755,12 +773,11 @@ def create_routes(server):
         # puts plots together into a grid
         grid = gridplot([row_1, row_2, row_3, row_4])
 
-        filename = export_png(grid)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/contributor_reports/new_contributors_stacked_bar/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def new_contributors_stacked_bar():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -958,12 +975,11 @@ def create_routes(server):
         # puts plots together into a grid
         grid = gridplot([row_1, row_2, row_3, row_4])
 
-        filename = export_png(grid)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/contributor_reports/returning_contributors_pie_chart/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def returning_contributors_pie_chart():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1090,12 +1106,11 @@ def create_routes(server):
         # put graph and caption plot together into one grid
         grid = gridplot([[plot], [caption_plot]])
 
-        filename = export_png(grid)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/contributor_reports/returning_contributors_stacked_bar/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def returning_contributors_stacked_bar():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1264,6 +1279,4 @@ def create_routes(server):
         # put graph and caption plot together into one grid
         grid = gridplot([[plot], [caption_plot]])
 
-        filename = export_png(grid)
-
-        return send_file(filename)
+        return render_report_image(grid)
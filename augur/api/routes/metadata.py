@@ -48,7 +48,7 @@ def create_routes(server):
             ORDER BY
                 repo.repo_name;
         """)
-        results = pd.read_sql(repo_info_sql,  server.engine)
+        results = pd.read_sql(repo_info_sql,  server.read_engine)
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         parsed_data = json.loads(data)
         return Response(response=data,
@@ -62,7 +62,7 @@ def create_routes(server):
             group by repo_git 
             order by contributions desc;
         """)
-        results = pd.read_sql(repo_info_sql,  server.engine)
+        results = pd.read_sql(repo_info_sql,  server.read_engine)
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         parsed_data = json.loads(data)
         return Response(response=data,
@@ -76,7 +76,7 @@ def create_routes(server):
             group by repo_git 
             order by contributors desc;  
         """)
-        results = pd.read_sql(repo_info_sql,  server.engine)
+        results = pd.read_sql(repo_info_sql,  server.read_engine)
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         parsed_data = json.loads(data)
         return Response(response=data,
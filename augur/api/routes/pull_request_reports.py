@@ -6,13 +6,13 @@ import warnings
 import datetime
 import json
 # from scipy import stats
-from flask import request, send_file, Response
+from flask import request, Response
 import math
 
 from bokeh.palettes import Colorblind, mpl, Category20
 from bokeh.layouts import gridplot, column
 from bokeh.models.annotations import Title
-from bokeh.io import export_png, show   # get_screenshot_as_png
+from bokeh.io import show   # get_screenshot_as_png
 # from bokeh.io.export import get_screenshot_as_png
 from bokeh.embed import json_item
 from bokeh.models import ColumnDataSource, Legend, LabelSet, Range1d, Label, FactorRange, BasicTicker, ColorBar, \
@@ -21,6 +21,8 @@ from bokeh.plotting import figure
 from bokeh.models.glyphs import Rect
 from bokeh.transform import dodge, factor_cmap, transform
 
+from augur.api.routes.report_images import report_image, render_report_image
+
 warnings.filterwarnings('ignore')
 
 AUGUR_API_VERSION = 'api/unstable'
@@ -140,7 +142,10 @@ def create_routes(server):
                     ORDER BY
                        merged_count DESC
                         """)
-        pr_all = pd.read_sql(pr_query,  server.engine)
+
+        # every chart of a report page needs the same prs, so the query result of a repo is shared by all of them
+        pr_all = server.get_repo_dataset("pull_request_data_collection", repo_id,
+                                         lambda: pd.read_sql(pr_query,  server.read_engine))
 
         pr_all[['assigned_count',
                 'review_requested_count',
@@ -461,6 +466,7 @@ def create_routes(server):
             return None, None, None, error
 
     @server.app.route('/{}/pull_request_reports/average_commits_per_PR/'.format(AUGUR_API_VERSION), methods=["GET"])
+    @report_image
     def average_commits_per_PR():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -601,11 +607,10 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/average_comments_per_PR/'.format(AUGUR_API_VERSION), methods=["GET"])
+    @report_image
     def average_comments_per_PR():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -782,12 +787,11 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/PR_counts_by_merged_status/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def PR_counts_by_merged_status():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -974,12 +978,11 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/mean_response_times_for_PR/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def mean_response_times_for_PR():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1273,12 +1276,11 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/mean_days_between_PR_comments/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def mean_days_between_PR_comments():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1441,11 +1443,10 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/PR_time_to_first_response/'.format(AUGUR_API_VERSION), methods=["GET"])
+    @report_image
     def PR_time_to_first_response():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1576,12 +1577,11 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(grid, timeout=180)
-
-        return send_file(filename)
+        return render_report_image(grid)
 
     @server.app.route('/{}/pull_request_reports/average_PR_events_for_closed_PRs/'.format(AUGUR_API_VERSION),
                       methods=["GET"])
+    @report_image
     def average_PR_events_for_closed_PRs():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1765,11 +1765,10 @@ def create_routes(server):
             # opts = FirefoxOptions()
         # opts.add_argument("--headless")
         # driver = webdriver.Firefox(firefox_options=opts)
-        filename = export_png(layout, timeout=181)  # , webdriver=selenium.webdriver.firefox.webdriver)
-
-        return send_file(filename)
+        return render_report_image(layout)
 
     @server.app.route('/{}/pull_request_reports/Average_PR_duration/'.format(AUGUR_API_VERSION), methods=["GET"])
+    @report_image
     def Average_PR_duration():
 
         repo_id, start_date, end_date, error = get_repo_id_start_date_and_end_date()
@@ -1910,7 +1909,4 @@ def create_routes(server):
         # driver = webdriver.Firefox(firefox_options=opts)
         # newt = get_screenshot_as_png(grid, timeout=180, webdriver=selenium.webdriver.firefox.webdriver)
         # filename = export_png(grid, timeout=180, webdriver=selenium.webdriver.firefox.webdriver)
-        filename = export_png(grid, timeout=180)
-
-        # return sendfile(newt)
-        return send_file(filename)
+        return render_report_image(grid)
@@ -0,0 +1,117 @@
+#SPDX-License-Identifier: MIT
+"""
+Serves the png images of the report endpoints, which are rendered by the celery workers so api workers never wait on a browser
+"""
+import io
+import json
+import uuid
+import functools
+
+from flask import request, send_file, Response, g
+
+from augur.api.util import statement_timeout
+from augur.application.db.engine import read_engine_has_replayed
+from augur.tasks.util.repo_data_versions import get_data_versions, get_data_lsn
+from augur.tasks.util.report_images import get_report_image_id, get_report_image, start_rendering, is_rendering
+
+AUGUR_API_VERSION = 'api/unstable'
+
+# seconds a client should wait before asking for an image that is being rendered again
+RENDER_RETRY_AFTER = 5
+
+# milliseconds the statements of a report may take, reports aggregate the whole history of a repo so they get more than other routes
+REPORT_STATEMENT_TIMEOUT = 120000
+
+def report_image(function):
+    """
+    Decorator for report endpoints that returns the rendered image of a request if it is cached
+
+    Otherwise the endpoint is called to build the bokeh layout, which it passes to render_report_image.
+    Requests with return_json=true are not affected.
+    """
+    @statement_timeout(REPORT_STATEMENT_TIMEOUT)
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+
+        g.report_image_id = None
+
+        if request.args.get('return_json', "false") == "true":
+            return function(*args, **kwargs)
+
+        repo_id = request.args.get('repo_id')
+        data_versions = get_data_versions(repo_ids=[repo_id]) if repo_id else {}
+
+        # without the data versions redis can't be reached, so the image could neither be cached nor rendered
+        if None in data_versions.values():
+            return function(*args, **kwargs)
+
+        image_id = get_report_image_id(request.path, request.args.to_dict(), data_versions)
+
+        png = get_report_image(image_id)
+        if png is not None:
+            return send_file(io.BytesIO(png), mimetype='image/png')
+
+        if is_rendering(image_id):
+            return rendering_response(image_id)
+
+        # a layout read from a replica that didn't replay the current version may miss its data, so its image only goes to this request
+        if not read_engine_has_replayed(get_data_lsn(data_versions)):
+            image_id = uuid.uuid4().hex
+
+        g.report_image_id = image_id
+        return function(*args, **kwargs)
+
+    return wrapper
+
+def render_report_image(layout):
+    """
+    Queues the rendering of a bokeh layout and returns the response that tells the client where the image will be
+
+    :param layout: bokeh layout of the report
+    """
+    # the task module imports bokeh and the celery app, which only the report endpoints need
+    from bokeh.document import Document
+    from augur.tasks.reports.tasks import render_report_image as render_report_image_task
+
+    image_id = g.get('report_image_id')
+
+    if image_id is None:
+        return Response(response=json.dumps({"status": "Report images can't be rendered while redis is unavailable"}),
+                        status=503,
+                        mimetype='application/json')
+
+    if start_rendering(image_id):
+        document = Document()
+        document.add_root(layout)
+
+        render_report_image_task.si(image_id, document.to_json_string()).apply_async()
+
+    return rendering_response(image_id)
+
+def rendering_response(image_id):
+
+    image_url = '/{}/report-images/{}'.format(AUGUR_API_VERSION, image_id)
+
+    response = Response(response=json.dumps({"status": "rendering", "image_id": image_id, "image_url": image_url}),
+                        status=202,
+                        mimetype='application/json')
+    response.headers['Location'] = image_url
+    response.headers['Retry-After'] = str(RENDER_RETRY_AFTER)
+
+    return response
+
+def create_routes(server):
+
+    @server.app.route('/{}/report-images/<image_id>'.format(AUGUR_API_VERSION), methods=["GET"])
+    def get_rendered_report_image(image_id):
+
+        png = get_report_image(image_id)
+        if png is not None:
+            return send_file(io.BytesIO(png), mimetype='image/png')
+
+        if is_rendering(image_id):
+            return rendering_response(image_id)
+
+        return Response(response=json.dumps({"status": "Image not found, request the report again to render it"}),
+                        status=404,
+                        mimetype='application/json')
@@ -20,8 +20,8 @@ from augur.application.db.models import User, UserRepo
 from augur.application.config import get_development_flag
 logger = logging.getLogger(__name__)
 development = get_development_flag()
-from augur.application.db.engine import create_database_engine
-Session = sessionmaker(bind=create_database_engine())
+from augur.application.db.engine import get_database_engine
+Session = sessionmaker(bind=get_database_engine())
 
 AUGUR_API_VERSION = 'api/unstable'
 
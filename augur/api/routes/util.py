@@ -1,9 +1,11 @@
 #SPDX-License-Identifier: MIT
 import base64
+import datetime
+import decimal
 import sqlalchemy as s
 import pandas as pd
 import json
-from flask import Response
+from flask import Response, request, stream_with_context
 import logging
 
 from augur.application.db.session import DatabaseSession
@@ -13,6 +15,140 @@ logger = AugurLogger("augur").get_logger()
 
 AUGUR_API_VERSION = 'api/unstable'
 
+# largest page that can be requested with ?limit=
+MAX_PAGE_LIMIT = 10000
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def get_page_args():
+    """
+    Returns the limit and the after cursor of a paginated request, (None, None) if the request is not paginated
+
+    :raises ValueError: if limit or after are not integers or limit is less than 1
+    """
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+
+    if limit is None and after is None:
+        return None, None
+
+    limit = min(int(limit), MAX_PAGE_LIMIT) if limit is not None else MAX_PAGE_LIMIT
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+
+    if after is not None:
+        after = int(after)
+
+    return limit, after
+
+def get_page_clauses(key_column, default_order, limit, after):
+    """
+    Returns the sql fragments that page a query by key_column
+
+    Pages are read with keyset pagination, so the query only reads the rows after the cursor instead of skipping an offset.
+
+    :param key_column: unique integer column the query is ordered by when it is paginated
+    :param default_order: order by clause of the query when it is not paginated
+    :param limit: number of rows per page, None if the query is not paginated
+    :param after: value of key_column of the last row of the previous page
+    """
+    return {
+        'page_filter': f"AND {key_column} > :after" if after is not None else "",
+        'order_by': key_column if limit else default_order,
+        'page_limit': "LIMIT :limit" if limit else ""
+    }
+
+def wants_ndjson():
+    """
+    Returns whether the client asked for newline delimited json with ?format=ndjson or the Accept header
+    """
+    if request.args.get('format') == 'ndjson':
+        return True
+
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def json_default(value):
+    """
+    Serializes the values the database returns that json can't, like pandas does for the json responses
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec='milliseconds')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    return str(value)
+
+def stream_ndjson(engine, sql, params, transform_row=None):
+    """
+    Returns a response that writes the rows of a query as newline delimited json while they are fetched
+
+    The rows are read with a server side cursor, so neither the worker nor the client has to hold the whole result.
+
+    :param engine: engine the query is executed on
+    :param sql: query
+    :param params: parameters of the query
+    :param transform_row: function that is applied to the dict of every row before it is written
+    """
+    def generate():
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(sql, params)
+            for row in result:
+                row = dict(row)
+                if transform_row:
+                    row = transform_row(row)
+                yield json.dumps(row, default=json_default) + "\n"
+
+    return Response(stream_with_context(generate()),
+                    status=200,
+                    mimetype=NDJSON_MIMETYPE)
+
+def paged_json_response(results, key_column, limit):
+    """
+    Returns the json response of a page of results
+
+    A full page sets the X-Next-Cursor header to the value that is passed as ?after= to get the next page.
+
+    :param results: dataframe of the page
+    :param key_column: name of the column the results are paged by
+    :param limit: number of rows per page, None if the results are not paginated
+    """
+    data = results.to_json(orient="records", date_format='iso', date_unit='ms')
+    response = Response(response=data,
+                        status=200,
+                        mimetype="application/json")
+
+    if limit and len(results) == limit:
+        response.headers['X-Next-Cursor'] = str(results[key_column].iloc[-1])
+
+    return response
+
+def invalid_page_args_response(error):
+
+    return Response(response=json.dumps({"status": f"Invalid pagination arguments: {error}"}),
+                    status=400,
+                    mimetype="application/json")
+
+def strip_url_scheme(url):
+
+    return url.split('//')[1]
+
+def get_base64_url(url):
+    """
+    Returns the base64 encoding of a url as a str, so the json and ndjson responses return the same value
+    """
+    return base64.b64encode(url.encode()).decode()
+
+def add_repo_urls(row):
+    """
+    Strips the scheme of the url of a repo row and adds its base64_url
+    """
+    row['url'] = strip_url_scheme(row['url'])
+    row['base64_url'] = get_base64_url(row['url'])
+    return row
+
 def create_routes(server):
 
     @server.app.route('/{}/repo-groups'.format(AUGUR_API_VERSION))
@@ -22,7 +158,7 @@ def create_routes(server):
             FROM repo_groups
             ORDER BY rg_name
         """)
-        results = pd.read_sql(repoGroupsSQL,  server.engine)
+        results = pd.read_sql(repoGroupsSQL,  server.read_engine)
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
                         status=200,
@@ -31,6 +167,11 @@ def create_routes(server):
     @server.app.route('/{}/repos'.format(AUGUR_API_VERSION))
     def get_all_repos():
 
+        try:
+            limit, after = get_page_args()
+        except ValueError as e:
+            return invalid_page_args_response(e)
+
         get_all_repos_sql = s.sql.text("""
             SELECT
                 repo.repo_id,
@@ -56,23 +197,29 @@ def create_routes(server):
                 (select * from api_get_all_repo_prs) c 
                 on repo.repo_id=c.repo_id 
                 JOIN repo_groups ON repo_groups.repo_group_id = repo.repo_group_id
-            order by repo_name
-        """)
-        results = pd.read_sql(get_all_repos_sql,  server.engine)
-        results['url'] = results['url'].apply(lambda datum: datum.split('//')[1])
+            WHERE TRUE {page_filter}
+            order by {order_by}
+            {page_limit}
+        """.format(**get_page_clauses('repo.repo_id', 'repo_name', limit, after)))
+        params = {'limit': limit, 'after': after}
 
-        b64_urls = []
-        for i in results.index:
-            b64_urls.append(base64.b64encode((results.at[i, 'url']).encode()))
-        results['base64_url'] = b64_urls
+        if wants_ndjson():
+            return stream_ndjson(server.read_engine, get_all_repos_sql, params, add_repo_urls)
 
-        data = results.to_json(orient="records", date_format='iso', date_unit='ms')
-        return Response(response=data,
-                        status=200,
-                        mimetype="application/json")
+        results = pd.read_sql(get_all_repos_sql,  server.read_engine, params=params)
+        results['url'] = results['url'].map(strip_url_scheme)
+        results['base64_url'] = results['url'].map(get_base64_url)
+
+        return paged_json_response(results, 'repo_id', limit)
 
     @server.app.route('/{}/repo-groups/<repo_group_id>/repos'.format(AUGUR_API_VERSION))
     def get_repos_in_repo_group(repo_group_id):
+
+        try:
+            limit, after = get_page_args()
+        except ValueError as e:
+            return invalid_page_args_response(e)
+
         repos_in_repo_groups_SQL = s.sql.text("""
             SELECT
                 repo.repo_id,
@@ -98,14 +245,17 @@ def create_routes(server):
                 JOIN repo_groups ON repo_groups.repo_group_id = repo.repo_group_id
             WHERE
                 repo_groups.repo_group_id = :repo_group_id
-            ORDER BY repo.repo_git
-        """)
+                {page_filter}
+            ORDER BY {order_by}
+            {page_limit}
+        """.format(**get_page_clauses('repo.repo_id', 'repo.repo_git', limit, after)))
+        params = {'repo_group_id': repo_group_id, 'limit': limit, 'after': after}
 
-        results = pd.read_sql(repos_in_repo_groups_SQL, server.engine, params={'repo_group_id': repo_group_id})
-        data = results.to_json(orient="records", date_format='iso', date_unit='ms')
-        return Response(response=data,
-                        status=200,
-                        mimetype="application/json")
+        if wants_ndjson():
+            return stream_ndjson(server.read_engine, repos_in_repo_groups_SQL, params)
+
+        results = pd.read_sql(repos_in_repo_groups_SQL, server.read_engine, params=params)
+        return paged_json_response(results, 'repo_id', limit)
 
     @server.app.route('/{}/owner/<owner>/repo/<repo>'.format(AUGUR_API_VERSION))
     def get_repo_by_git_name(owner, repo):
@@ -117,7 +267,7 @@ def create_routes(server):
             GROUP BY repo_id, rg_name
         """)
 
-        results = pd.read_sql(get_repo_by_git_name_sql, server.engine, params={'owner': '%{}_'.format(owner), 'repo': repo,})
+        results = pd.read_sql(get_repo_by_git_name_sql, server.read_engine, params={'owner': '%{}_'.format(owner), 'repo': repo,})
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
                         status=200,
@@ -133,7 +283,7 @@ def create_routes(server):
             AND LOWER(rg_name) = LOWER(:rg_name)
             AND LOWER(repo_name) = LOWER(:repo_name)
         """)
-        results = pd.read_sql(get_repo_by_name_sql, server.engine, params={'rg_name': rg_name, 'repo_name': repo_name})
+        results = pd.read_sql(get_repo_by_name_sql, server.read_engine, params={'rg_name': rg_name, 'repo_name': repo_name})
         results['url'] = results['url'].apply(lambda datum: datum.split('//')[1])
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
@@ -147,7 +297,7 @@ def create_routes(server):
             FROM repo_groups
             WHERE lower(rg_name) = lower(:rg_name)
         """)
-        results = pd.read_sql(groupSQL, server.engine, params={'rg_name': rg_name})
+        results = pd.read_sql(groupSQL, server.read_engine, params={'rg_name': rg_name})
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
                         status=200,
@@ -161,7 +311,7 @@ def create_routes(server):
             WHERE a.setting='repo_directory'
         """)
 
-        results = pd.read_sql(get_repos_for_dosocs_SQL,  server.engine)
+        results = pd.read_sql(get_repos_for_dosocs_SQL,  server.read_engine)
         data = results.to_json(orient="records", date_format='iso', date_unit='ms')
         return Response(response=data,
                         status=200,
@@ -169,7 +319,15 @@ def create_routes(server):
 
     @server.app.route('/{}/repo-groups/<repo_group_id>/get-issues'.format(AUGUR_API_VERSION))
     @server.app.route('/{}/repos/<repo_id>/get-issues'.format(AUGUR_API_VERSION))
-    def get_issues(repo_group_id, repo_id=None):
+    def get_issues(repo_group_id=None, repo_id=None):
+
+        try:
+            limit, after = get_page_args()
+        except ValueError as e:
+            return invalid_page_args_response(e)
+
+        page_clauses = get_page_clauses('issues.issue_id', 'OPEN_DAY DESC', limit, after)
+
         if not repo_id:
             get_issues_sql = s.sql.text("""
                 SELECT issue_title,
@@ -186,10 +344,12 @@ def create_routes(server):
                 WHERE issues.repo_id IN (SELECT repo_id FROM repo WHERE repo_group_id = :repo_group_id)
                 AND issues.issue_id = issue_events.issue_id
                 AND issues.pull_request is NULL
+                {page_filter}
                 GROUP BY issues.issue_id
-                ORDER by OPEN_DAY DESC
-            """)
-            results = pd.read_sql(get_issues_sql, server.engine, params={'repo_group_id': repo_group_id})
+                ORDER by {order_by}
+                {page_limit}
+            """.format(**page_clauses))
+            params = {'repo_group_id': repo_group_id, 'limit': limit, 'after': after}
         else:
             get_issues_sql = s.sql.text("""
                 SELECT issue_title,
@@ -206,14 +366,18 @@ def create_routes(server):
                 WHERE issues.repo_id = :repo_id
                 AND issues.pull_request IS NULL
                 AND issues.issue_id = issue_events.issue_id
+                {page_filter}
                 GROUP BY issues.issue_id, repo_name
-                ORDER by OPEN_DAY DESC
-            """)
-            results = pd.read_sql(get_issues_sql, server.engine, params={'repo_id': repo_id})
-        data = results.to_json(orient="records", date_format='iso', date_unit='ms')
-        return Response(response=data,
-                        status=200,
-                        mimetype='application/json')
+                ORDER by {order_by}
+                {page_limit}
+            """.format(**page_clauses))
+            params = {'repo_id': repo_id, 'limit': limit, 'after': after}
+
+        if wants_ndjson():
+            return stream_ndjson(server.read_engine, get_issues_sql, params)
+
+        results = pd.read_sql(get_issues_sql, server.read_engine, params=params)
+        return paged_json_response(results, 'issue_id', limit)
 
     @server.app.route('/{}/api-port'.format(AUGUR_API_VERSION))
     def api_port():
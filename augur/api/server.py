@@ -10,10 +10,11 @@ import os
 import base64
 import logging
 import importlib
+import tempfile
 
 from typing import Optional, List, Any, Tuple
 
-from flask import Flask, request, Response, redirect
+from flask import Flask, request, Response, redirect, g
 from flask_cors import CORS
 import pandas as pd
 from beaker.util import parse_cache_config_options
@@ -21,11 +22,23 @@ from beaker.cache import CacheManager, Cache
 
 
 from augur.application.db.session import DatabaseSession
+from augur.application.db.engine import get_pool_stats, get_read_database_engine, read_engine_has_replayed
+from augur.application.db.instrumentation import query_context, get_query_stats, get_task_query_stats, SLOW_QUERY_LOGGER
+from augur.application.db.statement_timeout import get_statement_timeout_stats
 from augur.application.logs import AugurLogger
+from augur.api.metric_cache import MetricCache
+from augur.api.dataset_cache import DatasetCache
+from augur.api.util import parse_repo_ids
+from augur.api.output_formats import JSON_FORMAT, FORMAT_MIMETYPES, UnsupportedFormatError, get_requested_format, dataframe_to_bytes
+from augur.tasks.util.repo_data_versions import get_data_versions, get_data_lsn
+from augur.tasks.util.retry import RetryableError, STATEMENT_TIMEOUT
 from metadata import __version__ as augur_code_version
 
 AUGUR_API_VERSION = 'api/unstable'
 
+# milliseconds the statements of a route may take if the Server section of the config has no statement_timeout
+DEFAULT_STATEMENT_TIMEOUT = 30000
+
 
 
 class Server():
@@ -36,8 +49,12 @@ class Server():
         session (DatabaseSession): used to create the config
         config (AugurConfig): used to access the config in the database
         engine: Sqlalchemy database connection engine
+        read_engine: Sqlalchemy engine the routes read through, which uses the read replica if one is configured
         cache: ?
         server_cache: ?
+        metric_cache (MetricCache): caches the json of the standard metric endpoints
+        dataset_cache (DatasetCache): caches the dataframes the report endpoints are built from
+        statement_timeout (int): milliseconds the statements of a route may take unless the route sets its own budget, 0 for no budget
         app: Flask application
         show_metadata (bool): ?
     """
@@ -46,12 +63,18 @@ class Server():
         """Initialize the Server class."""
 
         self.logger = AugurLogger("server").get_logger()
+        # writes the sampled slow statements of the routes to their own log file
+        AugurLogger(SLOW_QUERY_LOGGER)
         self.session = DatabaseSession(self.logger)
         self.config = self.session.config
         self.engine = self.session.engine
+        self.read_engine = get_read_database_engine()
 
         self.cache_manager = self.create_cache_manager()
         self.server_cache = self.get_server_cache()
+        self.metric_cache = self.create_metric_cache()
+        self.dataset_cache = self.create_dataset_cache()
+        self.statement_timeout = self.get_default_statement_timeout()
         self.app = None
         self.show_metadata = False
 
@@ -73,6 +96,22 @@ class Server():
         self.app.config['WTF_CSRF_ENABLED'] = False
 
 
+        @self.app.before_request
+        def start_query_context():
+            """
+            Attributes the statements of the request to its route and sets the statement_timeout budget of the route
+            """
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+
+            g.query_context = query_context(route=route, statement_timeout=self.get_statement_timeout(request.endpoint))
+            g.query_context.__enter__()
+
+        @self.app.teardown_request
+        def end_query_context(exception):
+
+            if "query_context" in g:
+                g.query_context.__exit__(None, None, None)
+
         self.logger.debug("Creating API routes...")
         self.create_all_routes()
         self.create_metrics()
@@ -101,7 +140,98 @@ class Server():
                             status=200,
                             mimetype="application/json")
 
+        @self.app.errorhandler(RetryableError)
+        def retryable_error(error):
+            """
+            Tells the client when to retry a request that failed because the database could not be reached or its query exceeded the budget of the route
+            """
+            status = str(error) if error.reason == STATEMENT_TIMEOUT else "Service temporarily unavailable, retry later"
+
+            response = Response(response=json.dumps({"status": status, "reason": error.reason}),
+                                status=503,
+                                mimetype="application/json")
+            response.headers['Retry-After'] = str(error.countdown)
+
+            return response
+
+        @self.app.route(f'/{self.app.augur_api_version}/metric-cache/stats')
+        def metric_cache_stats():
+            """
+            Hits and misses of the metric cache per metric
+            """
+            return Response(response=json.dumps(self.metric_cache.get_stats()),
+                            status=200,
+                            mimetype="application/json")
+
+        @self.app.route(f'/{self.app.augur_api_version}/database-pool/stats')
+        def database_pool_stats():
+            """
+            Checkout wait and saturation of the database pool of the worker that serves the request
+            """
+            return Response(response=json.dumps(get_pool_stats()),
+                            status=200,
+                            mimetype="application/json")
+
+        @self.app.route(f'/{self.app.augur_api_version}/query/stats')
+        def query_stats():
+            """
+            Statements, rows and database time per route of the worker that serves the request, per task across all workers,
+            and the statements that were cancelled for exceeding the budget of their route across all workers
+            """
+            stats = {
+                "process": get_query_stats(),
+                "tasks": get_task_query_stats(),
+                "statement_timeouts": get_statement_timeout_stats()
+            }
+            return Response(response=json.dumps(stats),
+                            status=200,
+                            mimetype="application/json")
+
+        @self.app.route(f'/{self.app.augur_api_version}/materialized-views/stats')
+        def materialized_view_stats():
+            """
+            Duration of the last refresh of each materialized view, and how often it was refreshed and skipped
+            """
+            from augur.tasks.util.materialized_views import get_materialized_view_stats
+
+            return Response(response=json.dumps(get_materialized_view_stats()),
+                            status=200,
+                            mimetype="application/json")
+
    
+    def get_default_statement_timeout(self) -> int:
+        """Get the statement_timeout budget of the routes that don't set their own.
+
+        Returns:
+            the budget in milliseconds, 0 for no budget
+        """
+
+        statement_timeout = self.config.get_value("Server", "statement_timeout")
+
+        return int(statement_timeout) if statement_timeout is not None else DEFAULT_STATEMENT_TIMEOUT
+
+
+    def get_statement_timeout(self, endpoint: Optional[str]) -> int:
+        """Get the statement_timeout budget of an endpoint.
+
+        Note:
+            Routes set their own budget with the augur.api.util.statement_timeout decorator
+                and metrics with register_metric(statement_timeout=...)
+
+        Args:
+            endpoint: name of the endpoint of the request
+
+        Returns:
+            the budget in milliseconds, 0 for no budget
+        """
+
+        view_function = self.app.view_functions.get(endpoint) if endpoint else None
+
+        statement_timeout = getattr(view_function, "statement_timeout", None)
+
+        return statement_timeout if statement_timeout is not None else self.statement_timeout
+
+
     def get_app(self) -> Optional[Flask]:
         """Get flask app.
 
@@ -227,7 +357,7 @@ class Server():
         
     # NOTE: Paramater on=None removed, since it is not used in the function Aug 18, 2022 - Andrew Brain
     def transform(self, func: Any, args: Any=None, kwargs: dict=None, repo_url_base: str=None, orient: str ='records',
-        group_by: str=None, aggregate: str='sum', resample=None, date_col: str='date') -> str:
+        group_by: str=None, aggregate: str='sum', resample=None, date_col: str='date', output_format: str=JSON_FORMAT) -> Any:
         """Call a metric function and apply data transformations.
 
         Note:
@@ -245,9 +375,13 @@ class Server():
             aggregate:
             resample:
             date_col:
+            output_format: json, or arrow or parquet to return the dataframe as bytes
 
         Returns:
             The result of calling the function and applying the data transformations
+
+        Raises:
+            UnsupportedFormatError: if arrow or parquet is requested for a result that is not tabular
         """
         # this defines the way a pandas dataframe is converted to json
         if orient is None:
@@ -268,6 +402,13 @@ class Server():
 
             # calls the function that was passed to get the data
             data = func(*args, **kwargs)
+
+            # the columnar formats need a dataframe, so results like lists of dicts are converted
+            if output_format != JSON_FORMAT and not hasattr(data, 'to_json'):
+                try:
+                    data = pd.DataFrame(data)
+                except ValueError as e:
+                    raise UnsupportedFormatError(f"The result of {func.__name__} can't be returned as {output_format}") from e
             
             # most metrics return a pandas dataframe, which has the attribute to_json
             # so basically this is checking if it is a pandas dataframe
@@ -286,8 +427,12 @@ class Server():
                     data = data.resample(resample).aggregate(aggregate)
                     data['date'] = data.index
                 
-                # converts pandas dataframe to json
-                result = data.to_json(orient=orient, date_format='iso', date_unit='ms')
+                if output_format != JSON_FORMAT:
+                    # converts pandas dataframe to arrow or parquet bytes
+                    result = dataframe_to_bytes(data, output_format)
+                else:
+                    # converts pandas dataframe to json
+                    result = data.to_json(orient=orient, date_format='iso', date_unit='ms')
             else:
                 # trys to convert dict to json
                 try:
@@ -344,25 +489,101 @@ class Server():
             if 'repo_group_id' not in kwargs and func.metadata["type"] != "toss":
                 kwargs['repo_group_id'] = 1
 
+            # the repos endpoint evaluates the metric for a comma separated list of repo_ids in one query
+            if endpoint_type == 'repos' or 'repo_ids' in kwargs:
+                repo_ids = parse_repo_ids(kwargs.get('repo_ids'))
+                if not repo_ids:
+                    return Response(response=json.dumps({"status": "repo_ids must be a comma separated list of integers"}),
+                                    status=400,
+                                    mimetype="application/json")
+
+                kwargs['repo_ids'] = repo_ids
+
+            # the format is negotiated with ?format= or the Accept header
+            try:
+                output_format = get_requested_format(kwargs.pop('format', None), request.accept_mimetypes)
+            except UnsupportedFormatError as e:
+                return Response(response=json.dumps({"status": str(e)}),
+                                status=406,
+                                mimetype="application/json")
+
+            if self.show_metadata:
+                output_format = JSON_FORMAT
+
 
             # this function call takes the arguments specified when the endpoint is pinged
             # and calls the actual function in the metrics folder and then returns the result
             # NOTE: This also converts the data into json if the function returns a pandas dataframe or dict
-            data =  self.transform(func, args, kwargs)
-
+            def heavy_lifting():
+                return self.transform(func, args, kwargs, output_format=output_format)
+
+            # the key includes the data versions of the repos the request covers,
+            # so cached responses are only used until collection commits new data for them
+            data_versions = self.get_data_versions(kwargs)
+
+            try:
+                if self.show_metadata or None in data_versions.values():
+                    data = heavy_lifting()
+                else:
+                    # the path args are everything in kwargs that did not come from the query string (including the default repo_group_id)
+                    query_args = request.args.to_dict()
+                    path_args = {key: value for key, value in kwargs.items() if key not in query_args}
+
+                    # normalized so the order of the ids does not change the key
+                    if 'repo_ids' in query_args:
+                        query_args['repo_ids'] = ",".join(str(repo_id) for repo_id in kwargs['repo_ids'])
+
+                    # each format is cached next to the others, the json keys stay the same as before formats existed
+                    query_args.pop('format', None)
+                    if output_format != JSON_FORMAT:
+                        query_args['format'] = output_format
+
+                    # a response read from a replica that didn't replay the current versions may miss their data, so it is not cached under them
+                    key = self.metric_cache.make_key(func.__name__, path_args, query_args, data_versions)
+                    data = self.metric_cache.get_or_create(key, heavy_lifting, metric_name=func.__name__,
+                                                           cacheable=lambda: read_engine_has_replayed(get_data_lsn(data_versions)))
+            except UnsupportedFormatError as e:
+                return Response(response=json.dumps({"status": str(e)}),
+                                status=406,
+                                mimetype="application/json")
 
             # this is where the Response is created for all the metrics 
-            return Response(response=data,
-                            status=200,
-                            mimetype="application/json")
+            response = Response(response=data,
+                                status=200,
+                                mimetype=FORMAT_MIMETYPES[output_format])
+            response.vary.add('Accept')
+            return response
 
         # this sets the name of the endpoint function
         # so that the repo_endpoint, repo_group_endpoint, and deprecated_repo_endpoint
         # don't create endpoint funcitons with the same name
         endpoint_function.__name__ = f"{endpoint_type}_" + func.__name__
+        # metrics register their own budget with register_metric(statement_timeout=...)
+        endpoint_function.statement_timeout = func.metadata.get("statement_timeout")
         return endpoint_function
 
-        
+
+    def get_data_versions(self, kwargs: dict) -> dict:
+        """Get the data versions of the repos a metric request covers.
+
+        Args:
+            kwargs: the path and query arguments of the request
+
+        Returns:
+            the data versions of the repos if repo_ids or a repo_id is given, otherwise the data version of the repo group
+        """
+
+        if 'repo_ids' in kwargs:
+            return get_data_versions(repo_ids=kwargs['repo_ids'])
+
+        if 'repo_id' in kwargs:
+            return get_data_versions(repo_ids=[kwargs['repo_id']])
+
+        if 'repo_group_id' in kwargs:
+            return get_data_versions(repo_group_ids=[kwargs['repo_group_id']])
+
+        return {}
+
     def add_standard_metric(self, function: Any, endpoint: str) -> None:
         """Add standard metric routes to the flask app.
         
@@ -387,6 +608,11 @@ class Server():
         self.app.route(repo_group_endpoint)(self.routify(function, 'repo_group'))
         self.app.route(deprecated_repo_endpoint )(self.routify(function, 'deprecated_repo'))
 
+        # metrics that accept a list of repo_ids can be evaluated for many repos in one query
+        if function.metadata.get('multi_repo'):
+            repos_endpoint = f'/{self.app.augur_api_version}/repos/{endpoint}'
+            self.app.route(repos_endpoint)(self.routify(function, 'repos'))
+
     def add_toss_metric(self, function: Any, endpoint: str) -> None:
         """Add toss metric routes to the flask app.
         
@@ -432,6 +658,63 @@ class Server():
 
         return server_cache
 
+    def create_metric_cache(self) -> MetricCache:
+        """Create the cache for the standard metric endpoints.
+
+        Note:
+            The redis tier is shared by all the gunicorn workers. If redis can't be reached only the in-process tier is used.
+
+        Returns:
+            metric cache
+        """
+
+        # entries are invalidated by the repo data versions in their keys, so they can live much longer than cache_expire
+        expire = int(self.config.get_value('Server', 'metric_cache_expire') or self.config.get_value('Server', 'cache_expire'))
+        max_entries = self.config.get_value('Server', 'metric_cache_size') or 512
+
+        try:
+            # arrow and parquet bodies are binary, so they can't go through the connection that decodes responses
+            from augur.tasks.init.redis_connection import redis_binary_connection
+        except Exception as e:
+            self.logger.warning(f"Unable to connect to redis, the metric cache will only be kept in process: {e}")
+            redis_binary_connection = None
+
+        return MetricCache(self.logger, redis=redis_binary_connection, max_entries=int(max_entries), expire=expire)
+
+    def create_dataset_cache(self) -> DatasetCache:
+        """Create the cache for the dataframes of the report endpoints.
+
+        Returns:
+            dataset cache
+        """
+
+        directory = self.config.get_value('Server', 'dataset_cache_directory') or os.path.join(tempfile.gettempdir(), "augur", "dataset_cache")
+        max_megabytes = self.config.get_value('Server', 'dataset_cache_size') or 1024
+        expire = int(self.config.get_value('Server', 'metric_cache_expire') or self.config.get_value('Server', 'cache_expire'))
+
+        return DatasetCache(self.logger, directory, max_bytes=int(max_megabytes) * 1024 * 1024, expire=expire)
+
+    def get_repo_dataset(self, name: str, repo_id: int, createfunc: Any, **params) -> pd.DataFrame:
+        """Get a dataframe of a repo from the dataset cache or create it.
+
+        Args:
+            name: name of the dataset
+            repo_id: repo the dataset is about
+            createfunc: function that creates the dataframe on a miss
+            params: other arguments the dataset depends on
+
+        Returns:
+            the dataframe, which is only reused until collection commits new data for the repo
+        """
+
+        data_versions = get_data_versions(repo_ids=[repo_id])
+
+        if None in data_versions.values():
+            return createfunc()
+
+        key = self.metric_cache.make_key(name, {"repo_id": repo_id}, params, data_versions)
+        return self.dataset_cache.get_or_create(key, createfunc, cacheable=lambda: read_engine_has_replayed(get_data_lsn(data_versions)))
+
 # this is where the flask app is defined and the server is insantiated
 server = Server()
 server.create_app()
@@ -37,11 +37,25 @@ def get_cache(namespace, cache_manager=None):
         cache_manager = __memory_cache
     return cache_manager.get_cache(namespace)
 
+def parse_repo_ids(repo_ids):
+    """
+    Returns the sorted unique repo ids of a comma separated string, or None if it is not a list of integers
+
+    :param repo_ids: comma separated repo ids e.g. '1,25,3'
+    """
+    if not repo_ids:
+        return None
+    try:
+        return sorted({int(repo_id) for repo_id in str(repo_ids).split(',') if repo_id.strip()})
+    except ValueError:
+        return None
+
 """
 This is a decorator that defines a metric. It adds is_metric and the type to the function meatadata.
 These is used by the loop in api/metrics/__init__.py to determine which wether a function should be added 
 to the metrics class. It is also used in api/routes/__init__.py to determine which method to call when it 
 is looping through the methods on the class Metrics.  
+Metrics that accept a repo_ids list register with multi_repo=True, which also adds a /repos/<endpoint>?repo_ids= route.
 """
 metric_metadata = []
 def register_metric(metadata=None, **kwargs):
@@ -73,4 +87,18 @@ def register_metric(metadata=None, **kwargs):
         function.metadata.update(metadata)
 
         return function
-    return decorate
\ No newline at end of file
+    return decorate
+
+
+def statement_timeout(milliseconds):
+    """
+    Sets the statement_timeout budget of a route, which replaces the statement_timeout of the Server section of the config
+
+    Must be applied below the app.route decorator. Metrics set their budget with register_metric(statement_timeout=...) instead.
+
+    :param milliseconds: milliseconds after which the statements of the route are cancelled, 0 for no budget
+    """
+    def decorate(function):
+        function.statement_timeout = int(milliseconds)
+        return function
+    return decorate
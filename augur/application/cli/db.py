@@ -22,6 +22,9 @@ from augur.application.cli import test_connection, test_db_connection
 from augur.application.db.session import DatabaseSession
 from augur.application.logs import AugurLogger
 from augur.application.db.engine import create_database_engine
+from augur.application.db.partitioning import PARTITIONED_TABLES, DEFAULT_CHUNK_SIZE, PartitioningError, install_mirror_trigger, copy_rows, swap_tables
+from augur.application.db.index_advisor import check_indexes
+from augur.application.db.models.base import Base
 
 logger = logging.getLogger(__name__)
 
@@ -213,6 +216,96 @@ def create_schema():
     call(["alembic", "upgrade", "head"])
 
 
+@cli.command("partition-tables")
+@click.option("--table", "tables", multiple=True, type=click.Choice(list(PARTITIONED_TABLES)), help="Table to partition, can be given multiple times. Defaults to all of them")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True, help="Number of rows copied in one transaction")
+@click.option("--skip-swap", is_flag=True, help="Only copy the rows, the tables can be swapped by running the command again later")
+@click.option("--force-swap", is_flag=True, help="Swap even if rows without a repo_id would be left behind, or foreign keys would be dropped or only check new rows")
+@test_connection
+@test_db_connection
+def partition_tables(tables, chunk_size, skip_swap, force_swap):
+    """
+    Move the commits, message, issue_events and pull_request_events tables into their repo_id partitioned copies while collection keeps running
+    """
+    tables = tables or list(PARTITIONED_TABLES)
+
+    engine = create_database_engine()
+
+    try:
+        for table in tables:
+
+            print(f"Mirroring the writes to {table} into its partitioned copy")
+            install_mirror_trigger(engine, table)
+
+            print(f"Copying the rows of {table}")
+            copied = copy_rows(engine, table, chunk_size,
+                               progress=lambda last_id, copied: print(f"Copied {copied} rows of {table} up to id {last_id}", end="\r"))
+            print(f"\nCopied {copied} rows of {table}")
+
+            if skip_swap:
+                continue
+
+            result = swap_tables(engine, table, force_swap)
+            for foreign_key in result["replaced_foreign_keys"]:
+                print(f"Replaced foreign key {foreign_key} with a foreign key on the primary key and repo_id of {table}")
+            for foreign_key in result["not_validated_foreign_keys"]:
+                print(f"Replaced foreign key {foreign_key} with a foreign key on the primary key and repo_id of {table}, it only checks new rows since existing rows don't match")
+            for foreign_key in result["dropped_foreign_keys"]:
+                print(f"Dropped foreign key {foreign_key}, since its table has no repo_id")
+
+            print(f"Swapped {table} with its partitioned copy, the existing table is kept as {table}_unpartitioned")
+
+    except PartitioningError as e:
+        print(e)
+
+    finally:
+        engine.dispose()
+
+
+@cli.command("check-indexes")
+@click.option("--all", "show_all", is_flag=True, help="Also list the keys that are covered")
+@test_connection
+@test_db_connection
+def check_collection_indexes(show_all):
+    """
+    Check that the natural keys and lookup columns of the collection tasks are covered by indexes
+    """
+    engine = create_database_engine()
+
+    try:
+        with engine.connect() as connection:
+            results = check_indexes(Base.metadata, connection)
+    finally:
+        engine.dispose()
+
+    gaps = [result for result in results if result["gap"]]
+
+    for result in results:
+
+        if not result["gap"] and not show_all:
+            continue
+
+        key = f"{result['kind']} {result['table']}({', '.join(result['columns'])})"
+
+        if not result["gap"]:
+            print(f"{key} is covered by {result['database_index']}")
+            continue
+
+        if result["declared_index"] is None:
+            print(f"{key} has no index in augur_data.py")
+        if result["database_index"] is None:
+            print(f"{key} has no valid index in the database, run `augur db upgrade-db-version` if augur_data.py declares one")
+
+        evidence = result.get("evidence")
+        if evidence:
+            print(f"    {evidence['statements']} statements in pg_stat_statements use it, "
+                  f"they were called {evidence['calls']} times and took {evidence['total_time_ms']} ms")
+            for statement in evidence["slowest"]:
+                print(f"    {statement}")
+
+    print(f"{len(gaps)} of {len(results)} natural keys and lookups are not covered by an index")
+
+
 def generate_key(length):
     return "".join(
         random.choice(string.ascii_letters + string.digits) for _ in range(length)
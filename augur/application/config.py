@@ -1,5 +1,10 @@
 import sqlalchemy as s
 import json
+import copy
+import time
+import threading
+import weakref
+import redis
 from typing import List, Any, Optional
 import os
 from augur.application.db.models import Config 
@@ -52,6 +57,14 @@ default_config = {
             },
             "Server": {
                 "cache_expire": "3600",
+                "metric_cache_expire": 604800,
+                "metric_cache_size": 512,
+                "dataset_cache_directory": "",
+                "dataset_cache_size": 1024,
+                "prerender_report_images": 0,
+                "batch_workers": 8,
+                "batch_timeout": 60,
+                "statement_timeout": 30000,
                 "host": "0.0.0.0",
                 "port": 5000,
                 "workers": 6,
@@ -67,12 +80,24 @@ default_config = {
             "Celery": {
                 "concurrency": 12
             },
+            "Database": {
+                "pool_size": 5,
+                "max_overflow": 10,
+                "pool_timeout": 30,
+                "pool_recycle": 1800,
+                "pool_pre_ping": 1,
+                "insert_chunk_size": 1000,
+                "read_replica_max_lag": 60,
+                "slow_query_threshold_ms": 1000,
+                "slow_query_sample_rate": 1.0
+            },
             "Redis": {
                 "cache_group": 0, 
                 "connection_string": "redis://127.0.0.1:6379/"
             },
             "Tasks": {
-                "collection_interval": 2592000
+                "collection_interval": 2592000,
+                "materialized_view_refresh_workers": 4
             },
             "Message_Insights": {
                     "insight_days": 30,
@@ -130,6 +155,150 @@ def convert_type_of_value(config_dict, logger=None):
 
         return config_dict
 
+# redis key that is incremented whenever the config table changes
+CONFIG_VERSION_KEY = "config_version"
+
+# seconds between checks of the config version in redis
+CONFIG_VERSION_CHECK_INTERVAL = 5
+
+# seconds after which a snapshot is reloaded even if redis can't tell whether the config changed
+CONFIG_SNAPSHOT_MAX_AGE = 300
+
+
+class ConfigSnapshot():
+    """Process local copy of the config table of a database engine.
+
+    The copy is loaded once with a single query and reused by every AugurConfig of the process.
+    add_or_update_settings, clear and remove_section bump the config version in redis, and a
+    process reloads its copy when it sees the version change, which it checks at most every
+    CONFIG_VERSION_CHECK_INTERVAL seconds.
+
+    Attributes:
+        config (dict): maps section names to dicts of their settings, settings without a section are under None
+        version (int): config version in redis when the copy was loaded, None if redis was not reachable
+        loaded_at (float): monotonic time the copy was loaded
+        checked_at (float): monotonic time the version was last checked
+    """
+
+    def __init__(self):
+
+        self.config = None
+        self.version = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.redis = None
+        self.connecting = False
+
+        self.lock = threading.Lock()
+
+    def get(self, session, logger) -> dict:
+        """Get the snapshot of the config, loading it if it is missing or outdated"""
+
+        self._connect_redis()
+
+        with self.lock:
+
+            now = time.monotonic()
+
+            if self.config is not None and now - self.loaded_at < CONFIG_SNAPSHOT_MAX_AGE:
+
+                if now - self.checked_at < CONFIG_VERSION_CHECK_INTERVAL:
+                    return self.config
+
+                self.checked_at = now
+                version = self._get_version(logger)
+
+                if version is not None and version == self.version:
+                    return self.config
+
+            self._load(session, logger)
+
+            return self.config
+
+    def invalidate(self) -> None:
+
+        with self.lock:
+            self.config = None
+
+    def bump_version(self, logger) -> None:
+        """Tell every process that the config changed"""
+
+        self._connect_redis()
+        client = self.redis
+
+        self.invalidate()
+
+        if client is None:
+            return
+
+        try:
+            client.incr(CONFIG_VERSION_KEY)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Unable to bump the config version, other processes will see the change within {CONFIG_SNAPSHOT_MAX_AGE} seconds: {e}")
+
+    def _load(self, session, logger) -> None:
+
+        # read before the table, so a change that is made while loading causes another reload
+        version = self._get_version(logger)
+
+        query = session.query(Config)
+        settings = execute_session_query(query, 'all')
+
+        config = {}
+        for setting in settings:
+
+            setting_dict = convert_type_of_value({"value": setting.value, "type": setting.type}, logger)
+
+            config.setdefault(setting.section_name, {})[setting.setting_name] = setting_dict["value"]
+
+        self.config = config
+        self.version = version
+        self.loaded_at = self.checked_at = time.monotonic()
+
+    def _get_version(self, logger) -> Optional[int]:
+
+        client = self.redis
+        if client is None:
+            return None
+
+        try:
+            return int(client.get(CONFIG_VERSION_KEY) or 0)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Unable to check the config version: {e}")
+            return None
+
+    def _connect_redis(self) -> None:
+
+        # the redis settings are in the config itself, so there is no connection until it was loaded once.
+        # Creating the connection reads the config again, so it is done outside the lock and only once
+        if self.redis is not None or self.config is None or self.connecting:
+            return
+
+        self.connecting = True
+        try:
+            from augur.tasks.init.redis_connection import redis_connection
+            self.redis = redis_connection
+        finally:
+            self.connecting = False
+
+
+# the snapshot of each engine, the engine of a process is shared so there is one snapshot per process
+_config_snapshots = weakref.WeakKeyDictionary()
+_config_snapshots_lock = threading.Lock()
+
+
+def get_config_snapshot(engine) -> ConfigSnapshot:
+
+    with _config_snapshots_lock:
+
+        snapshot = _config_snapshots.get(engine)
+        if snapshot is None:
+            snapshot = ConfigSnapshot()
+            _config_snapshots[engine] = snapshot
+
+    return snapshot
+
+
 class AugurConfig():
 
     def __init__(self, logger, session):
@@ -140,6 +309,11 @@ class AugurConfig():
         self.accepted_types = ["str", "bool", "int", "float", "NoneType"]
         self.default_config = default_config
 
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+
+        return get_config_snapshot(self.session.engine)
+
     def get_section(self, section_name) -> dict:
         """Get a section of data from the config.
 
@@ -149,21 +323,9 @@ class AugurConfig():
         Returns:
             The section data as a dict
         """
-        query = self.session.query(Config).filter_by(section_name=section_name)
-        section_data = execute_session_query(query, 'all')
-        
-        section_dict = {}
-        for setting in section_data:
-            setting_dict = setting.__dict__
-
-            setting_dict = convert_type_of_value(setting_dict, self.logger)
-
-            setting_name = setting_dict["setting_name"]
-            setting_value = setting_dict["value"]
+        config = self.snapshot.get(self.session, self.logger)
 
-            section_dict[setting_name] = setting_value
-
-        return section_dict
+        return dict(config.get(section_name, {}))
 
 
     def get_value(self, section_name: str, setting_name: str) -> Optional[Any]:
@@ -176,17 +338,9 @@ class AugurConfig():
         Returns:
             The value from config if found, and None otherwise
         """
-        try:
-            query = self.session.query(Config).filter(Config.section_name == section_name, Config.setting_name == setting_name)
-            config_setting = execute_session_query(query, 'one')
-        except s.orm.exc.NoResultFound:
-            return None
-
-        setting_dict = config_setting.__dict__
+        config = self.snapshot.get(self.session, self.logger)
 
-        setting_dict = convert_type_of_value(setting_dict, self.logger)
-
-        return setting_dict["value"]
+        return config.get(section_name, {}).get(setting_name)
 
 
     def load_config(self) -> dict:
@@ -195,26 +349,13 @@ class AugurConfig():
         Returns:
             The config from the database
         """
-        # get all the sections in the config table
-        query = self.session.query(Config.section_name)
-        section_names = execute_session_query(query, 'all')
-
-        config = {}
-        # loop through and get the data for each section
-        for section_name in section_names:
-
-            section_data = self.get_section(section_name[0])
+        config = copy.deepcopy(self.snapshot.get(self.session, self.logger))
 
-            # rows with a section of None are on the top level, 
-            # so we are adding these values to the top level rather 
-            # than creating a section for them
-            if section_name[0] is None:
-                for key in list(section_data.keys()):
-                    config[key] = section_data[key]
-                continue
-
-            # add section data to config object
-            config[section_name[0]] = section_data
+        # rows with a section of None are on the top level, 
+        # so we are adding these values to the top level rather 
+        # than creating a section for them
+        top_level_settings = config.pop(None, {})
+        config.update(top_level_settings)
 
         return config
 
@@ -266,6 +407,8 @@ class AugurConfig():
 
         #print(f"\nsetting: {settings}")
         self.session.insert_data(settings,Config, ["section_name", "setting_name"])
+
+        self.snapshot.bump_version(self.logger)
        
 
     def add_section_from_json(self, section_name: str, json_data: dict) -> None:
@@ -336,6 +479,8 @@ class AugurConfig():
         self.session.query(Config).delete()
         self.session.commit()
 
+        self.snapshot.bump_version(self.logger)
+
     def remove_section(self, section_name: str) -> None:
         """Remove a section from the config.
         
@@ -345,6 +490,8 @@ class AugurConfig():
         self.session.query(Config).filter(Config.section_name == section_name).delete()
         self.session.commit()
 
+        self.snapshot.bump_version(self.logger)
+
 
     def create_default_config(self) -> None:
         """Create default config in the database."""
@@ -4,14 +4,37 @@ import json
 import sys
 import logging
 import inspect
-from sqlalchemy import create_engine, event
+import time
+import threading
+from typing import Optional
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool
 from augur.application.logs import initialize_stream_handler
 from augur.application.db.util import catch_operational_error
+from augur.application.db.instrumentation import instrument_engine, configure_slow_queries
+from augur.application.db.statement_timeout import apply_statement_timeouts
 
 
 logger = logging.getLogger("engine")
 initialize_stream_handler(logger, logging.ERROR)
 
+# the shared engine of each database string, see get_database_engine
+_engines = {}
+_engines_lock = threading.Lock()
+
+# number of tasks a celery worker process runs at once, see set_worker_concurrency
+_worker_concurrency = None
+
+# seconds between checks of the replication lag of the read replica
+READ_REPLICA_CHECK_INTERVAL = 30
+
+# minimum seconds between two queries of the replayed wal position of the replica
+READ_REPLICA_REPLAY_CHECK_INTERVAL = 1
+
+# pools and connections inherited from the parent process, see _make_fork_safe
+_inherited_from_parent = []
+
 def get_database_string() -> str:
     """Get database string from env or file
 
@@ -48,11 +71,17 @@ def get_database_string() -> str:
     return db_conn_string
 
 
-def create_database_engine():  
+def create_database_engine(**engine_args):  
     """Create sqlalchemy database engine 
 
     Note:
-        A new database engine is created each time the function is called
+        A new database engine is created each time the function is called,
+            so it should only be used by short lived commands that dispose it.
+            Everything else should use get_database_engine.
+            The statement_timeout of query contexts is only applied to the shared engines
+
+    Args:
+        engine_args: keyword arguments passed on to sqlalchemy.create_engine
 
     Returns:
         sqlalchemy database engine
@@ -65,7 +94,7 @@ def create_database_engine():
 
     db_conn_string = get_database_string()
 
-    engine = create_engine(db_conn_string)
+    engine = create_engine(db_conn_string, **engine_args)
 
     @event.listens_for(engine, "connect", insert=True)
     def set_search_path(dbapi_connection, connection_record):
@@ -76,9 +105,541 @@ def create_database_engine():
         cursor.close()
         dbapi_connection.autocommit = existing_autocommit
 
+    instrument_engine(engine)
+
+    return engine
+
+
+def get_database_engine():
+    """Get the database engine shared by the whole process
+
+    Note:
+        The engine is created on the first call with the pool settings
+            of the Database section of the config, or for the concurrency 
+            of the celery worker (see set_worker_concurrency). Its connections 
+            are never handed to a forked process, so the engine can be created 
+            by modules that are loaded before celery or gunicorn fork their workers.
+
+    Returns:
+        sqlalchemy database engine
+    """
+
+    db_conn_string = get_database_string()
+
+    with _engines_lock:
+
+        engine = _engines.get(db_conn_string)
+        if engine is None:
+
+            settings = get_database_settings(db_conn_string)
+
+            configure_slow_queries(int(settings["slow_query_threshold_ms"]), float(settings["slow_query_sample_rate"]))
+
+            engine = create_database_engine(poolclass=InstrumentedQueuePool, **_get_pool_args(settings))
+            _make_fork_safe(engine)
+            apply_statement_timeouts(engine)
+
+            _engines[db_conn_string] = engine
+
+    return engine
+
+
+def set_worker_concurrency(concurrency: int) -> None:
+    """Size the pools of the engines of this process for the tasks a celery worker process runs at once
+
+    Note:
+        Each task holds a connection while it runs, so the pool_size of the Database 
+            section is replaced with the concurrency. Engines that were created before 
+            are disposed, so they are recreated with the new size.
+
+    Args:
+        concurrency: number of tasks each worker process runs at once
+    """
+
+    global _worker_concurrency
+
+    _worker_concurrency = concurrency
+
+    dispose_database_engine()
+
+
+def dispose_database_engine():
+    """Close the connections of the shared engine, which is recreated by the next get_database_engine call"""
+
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+
+    for engine in engines:
+        engine.dispose()
+
+
+def get_database_settings(db_conn_string: str) -> dict:
+    """Get the Database section of the config
+
+    Note:
+        The config is stored in the database, so it is read over a 
+            single unpooled connection. The defaults are used if it can't be read.
+
+    Returns:
+        the settings of the section
+    """
+    from augur.application.config import default_config, convert_type_of_value
+
+    settings = dict(default_config["Database"])
+
+    bootstrap_engine = create_engine(db_conn_string, poolclass=NullPool)
+    try:
+        with bootstrap_engine.connect() as connection:
+            result = connection.execute(text("""
+                SELECT setting_name, value, type FROM augur_operations.config WHERE section_name = 'Database'
+            """))
+
+            for row in result:
+                setting = convert_type_of_value(dict(row), logger)
+                settings[setting["setting_name"]] = setting["value"]
+
+    except exc.SQLAlchemyError as e:
+        logger.warning(f"Unable to read the database settings from the config, using the defaults: {e}")
+    finally:
+        bootstrap_engine.dispose()
+
+    return settings
+
+
+def _get_pool_args(settings: dict) -> dict:
+
+    return {
+        "pool_size": _worker_concurrency if _worker_concurrency is not None else int(settings["pool_size"]),
+        "max_overflow": int(settings["max_overflow"]),
+        "pool_timeout": int(settings["pool_timeout"]),
+        "pool_recycle": int(settings["pool_recycle"]),
+        "pool_pre_ping": bool(settings["pool_pre_ping"])
+    }
+
+
+def get_read_replica_string() -> Optional[str]:
+    """Get the database string of the optional read replica
+
+    Note:
+        The AUGUR_DB_READ_REPLICA environment variable is used if it is 
+            defined, otherwise the read_replica key of db.config.json
+
+    Returns:
+        postgres database string, None if no replica is configured
+    """
+
+    augur_db_read_replica_var = os.getenv("AUGUR_DB_READ_REPLICA")
+    if augur_db_read_replica_var:
+        return augur_db_read_replica_var
+
+    db_json_file_location = os.getcwd() + "/db.config.json"
+    if not os.path.exists(db_json_file_location):
+        return None
+
+    with open(db_json_file_location, 'r') as f:
+        db_config = json.load(f)
+
+    return db_config.get("read_replica") or None
+
+
+def get_read_database_engine():
+    """Get the engine the api and the analysis tasks read through
+
+    Note:
+        If a read replica is configured the connections of the engine go to the 
+            replica while its replication lag is at most the read_replica_max_lag 
+            seconds of the Database section of the config, and to the primary 
+            while it lags further behind or can't be reached. Without a replica 
+            this is the engine get_database_engine returns. Nothing may be 
+            written through this engine.
+
+    Returns:
+        sqlalchemy database engine
+    """
+
+    replica_string = get_read_replica_string()
+
+    if not replica_string:
+        return get_database_engine()
+
+    db_conn_string = get_database_string()
+    engine_key = f"read_replica:{replica_string}"
+
+    with _engines_lock:
+
+        engine = _engines.get(engine_key)
+        if engine is None:
+
+            settings = get_database_settings(db_conn_string)
+
+            configure_slow_queries(int(settings["slow_query_threshold_ms"]), float(settings["slow_query_sample_rate"]))
+
+            router = ReadReplicaRouter(db_conn_string, replica_string, int(settings["read_replica_max_lag"]))
+
+            # the url of the primary only determines the dialect, the router opens the connections
+            engine = create_database_engine(poolclass=InstrumentedQueuePool, creator=router.connect, **_get_pool_args(settings))
+            _make_fork_safe(engine)
+            router.route(engine)
+            apply_statement_timeouts(engine)
+
+            _engines[engine_key] = engine
+
     return engine
 
 
+def read_engine_has_replayed(lsn: Optional[int]) -> bool:
+    """Whether reads through the read engine see every write the primary committed up to a wal position
+
+    Note:
+        This has to be checked before the read. Results read while this is False may miss data 
+            whose repo data version was already bumped, so they must not be cached under keys 
+            that include the versions. The replica is checked even while reads go to the primary, 
+            because they can be routed to the replica again at any time
+
+    Args:
+        lsn: wal position of the primary, see repo_data_versions.get_data_lsn. None if it is unknown
+
+    Returns:
+        True if no read replica is configured or the replica replayed the primary's wal up to lsn
+    """
+
+    with _engines_lock:
+        read_engines = [engine for key, engine in _engines.items() if key.startswith("read_replica:")]
+
+    if not read_engines:
+        return True
+
+    if lsn is None:
+        return False
+
+    return all(engine.read_replica_router.has_replayed(lsn) for engine in read_engines)
+
+
+def get_pool_stats() -> dict:
+    """Get the checkout wait and saturation of the pool of the shared engine in this process
+
+    Returns:
+        dict of pool stats, empty if the shared engine was not created. If the read engine 
+            of a replica was created its stats are under read_replica
+    """
+
+    with _engines_lock:
+        engine = _engines.get(get_database_string())
+        read_engines = [engine for key, engine in _engines.items() if key.startswith("read_replica:")]
+
+    if engine is None or not isinstance(engine.pool, InstrumentedQueuePool):
+        return {}
+
+    stats = engine.pool.get_stats()
+
+    for read_engine in read_engines:
+        stats["read_replica"] = read_engine.pool.get_stats()
+        stats["read_replica"].update(read_engine.read_replica_router.get_stats())
+
+    return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection
+
+    Attributes:
+        checkouts (int): number of connections that were checked out
+        checkout_timeouts (int): number of checkouts that gave up waiting after pool_timeout
+        checkout_wait (float): total seconds the checkouts waited
+        max_checkout_wait (float): longest wait of a checkout in seconds
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def _do_get(self):
+
+        start = time.monotonic()
+
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+
+        wait = time.monotonic() - start
+
+        with self._stats_lock:
+            self.checkouts += 1
+            self.checkout_wait += wait
+            self.max_checkout_wait = max(self.max_checkout_wait, wait)
+
+        return connection
+
+    def reset_stats(self):
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait = 0.0
+        self.max_checkout_wait = 0.0
+
+    def get_stats(self) -> dict:
+
+        capacity = self.size() + self._max_overflow if self._max_overflow > -1 else None
+        checked_out = self.checkedout()
+
+        with self._stats_lock:
+            return {
+                "pid": os.getpid(),
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": checked_out,
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "saturation": round(checked_out / capacity, 3) if capacity else None,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "avg_checkout_wait": self.checkout_wait / self.checkouts if self.checkouts else 0.0,
+                "max_checkout_wait": self.max_checkout_wait
+            }
+
+
+class ReadReplicaRouter():
+    """Sends the connections of the read engine to the replica while it is current, and to the primary otherwise
+
+    The replication lag is checked at most every READ_REPLICA_CHECK_INTERVAL seconds. When the target 
+    changes, pooled connections to the old target are replaced as they are checked out.
+
+    Attributes:
+        max_lag (int): seconds the replica may lag behind before reads go to the primary
+        lag (float): replication lag of the last check, None if the replica could not be reached or is not streaming from the primary
+        use_replica (bool): whether new connections go to the replica
+        replayed_lsn (int): greatest wal position of the primary the replica was seen to have replayed
+
+    Note:
+        The lag is queried by the thread whose checkout found the last check too old, without holding the lock,
+            so the checkouts of other threads use the result of the last check instead of waiting for the replica
+    """
+
+    def __init__(self, db_conn_string: str, replica_string: str, max_lag: int):
+
+        dialect = make_url(db_conn_string).get_dialect()()
+
+        self.primary_connect_args = dialect.create_connect_args(make_url(db_conn_string))
+        self.replica_connect_args = dialect.create_connect_args(make_url(replica_string))
+
+        self.max_lag = max_lag
+        self.lag = None
+        self.use_replica = False
+        self.checked_at = None
+        self.checking = False
+
+        self.replayed_lsn = 0
+        self.replay_checked_at = None
+        self.checking_replay = False
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def route(self, engine):
+        """Record the target of each connection of the engine and replace connections to the old target on checkout"""
+
+        engine.read_replica_router = self
+
+        @event.listens_for(engine, "connect")
+        def record_target(dbapi_connection, connection_record):
+            connection_record.info["read_replica"] = getattr(self.local, "use_replica", False)
+
+        @event.listens_for(engine, "checkout")
+        def check_target(dbapi_connection, connection_record, connection_proxy):
+            if connection_record.info.get("read_replica") != self.replica_is_current():
+                raise exc.DisconnectionError("Read replica routing changed, reconnecting")
+
+    def connect(self):
+
+        import psycopg2
+
+        use_replica = self.replica_is_current()
+        args, kwargs = self.replica_connect_args if use_replica else self.primary_connect_args
+
+        connection = psycopg2.connect(*args, **kwargs)
+        self.local.use_replica = use_replica
+
+        return connection
+
+    def replica_is_current(self) -> bool:
+
+        with self.lock:
+
+            now = time.monotonic()
+            if self.checking or (self.checked_at is not None and now - self.checked_at < READ_REPLICA_CHECK_INTERVAL):
+                return self.use_replica
+
+            self.checked_at = now
+            self.checking = True
+
+        try:
+            lag = self._get_replica_lag()
+        finally:
+            with self.lock:
+                self.checking = False
+
+        with self.lock:
+
+            self.lag = lag
+
+            use_replica = self.lag is not None and self.lag <= self.max_lag
+
+            if use_replica != self.use_replica:
+                if use_replica:
+                    logger.warning(f"Reading from the read replica again, it lags {round(self.lag, 1)} seconds behind")
+                else:
+                    logger.warning(f"Reading from the primary, the read replica lags {self.lag} seconds behind which is more than {self.max_lag}")
+
+            self.use_replica = use_replica
+
+            return self.use_replica
+
+    def has_replayed(self, lsn: int) -> bool:
+        """Whether the replica replayed the wal of the primary up to lsn, so reads from it see every write before it
+
+        The replayed position only grows, so it is only queried again when the last one is behind lsn,
+        and at most every READ_REPLICA_REPLAY_CHECK_INTERVAL seconds.
+        """
+
+        with self.lock:
+
+            if self.replayed_lsn >= lsn:
+                return True
+
+            now = time.monotonic()
+            if self.checking_replay or (self.replay_checked_at is not None and now - self.replay_checked_at < READ_REPLICA_REPLAY_CHECK_INTERVAL):
+                return False
+
+            self.replay_checked_at = now
+            self.checking_replay = True
+
+        try:
+            replayed_lsn = self._get_replayed_lsn()
+        finally:
+            with self.lock:
+                self.checking_replay = False
+
+        with self.lock:
+
+            if replayed_lsn is not None:
+                self.replayed_lsn = max(self.replayed_lsn, replayed_lsn)
+
+            return self.replayed_lsn >= lsn
+
+    def get_stats(self) -> dict:
+
+        return {
+            "use_replica": self.use_replica,
+            "replication_lag": self.lag,
+            "max_replication_lag": self.max_lag,
+            "replayed_lsn": self.replayed_lsn
+        }
+
+    def _get_replayed_lsn(self) -> Optional[int]:
+
+        import psycopg2
+
+        args, kwargs = self.replica_connect_args
+        kwargs = dict(kwargs, connect_timeout=5)
+
+        try:
+            connection = psycopg2.connect(*args, **kwargs)
+        except psycopg2.Error as e:
+            logger.error(f"Unable to connect to the read replica: {e}")
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                # a replica that was promoted has everything it ever replayed, and writes its own wal from there
+                cursor.execute("""
+                    SELECT CASE
+                        WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+                        ELSE pg_current_wal_lsn()
+                    END - '0/0'::pg_lsn
+                """)
+                replayed_lsn = cursor.fetchone()[0]
+        except psycopg2.Error as e:
+            logger.error(f"Unable to get the replayed wal position of the read replica: {e}")
+            return None
+        finally:
+            connection.close()
+
+        return int(replayed_lsn) if replayed_lsn is not None else None
+
+    def _get_replica_lag(self) -> Optional[float]:
+
+        import psycopg2
+
+        args, kwargs = self.replica_connect_args
+        kwargs = dict(kwargs, connect_timeout=5)
+
+        try:
+            connection = psycopg2.connect(*args, **kwargs)
+        except psycopg2.Error as e:
+            logger.error(f"Unable to connect to the read replica: {e}")
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                # a replica that streams from the primary and replayed everything it received is current,
+                # however long ago the primary last wrote. One whose wal receiver stopped only replayed what it got before
+                cursor.execute("""
+                    SELECT CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END
+                """)
+                lag = cursor.fetchone()[0]
+        except psycopg2.Error as e:
+            logger.error(f"Unable to get the replication lag of the read replica: {e}")
+            return None
+        finally:
+            connection.close()
+
+        if lag is None:
+            logger.error("The read replica is not streaming from the primary")
+            return None
+
+        return float(lag)
+
+
+def _make_fork_safe(engine):
+    """Keep forked processes from using the connections of the process that created the engine"""
+
+    @event.listens_for(engine, "connect")
+    def record_pid(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info["pid"] != pid:
+            # the socket belongs to the parent, so it is set aside without being closed
+            _inherited_from_parent.append(connection_record.connection)
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                f"Connection record belongs to pid {connection_record.info['pid']}, attempting to check out in pid {pid}"
+            )
+
+    def replace_pool_in_child():
+        # the pool of the parent is kept referenced, because closing its connections
+        # when they are garbage collected would also close them for the parent
+        _inherited_from_parent.append(engine.pool)
+        engine.pool = engine.pool.recreate()
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=replace_pool_in_child)
+
+
 class EngineConnection():
 
     def __init__(self, engine):
@@ -0,0 +1,340 @@
+"""Checks that the natural keys and lookup columns of the collection tasks are covered by indexes.
+
+The natural keys are the ON CONFLICT targets the tasks pass to insert_data, which postgres can only use
+with a unique index on exactly those columns. The lookups are the columns the tasks filter on to find single rows,
+which need an index that starts with them, or a table scan runs for every row collected.
+Each key is checked against the indexes declared in augur_data.py and, when a database is given, against the
+indexes that exist in it. For the gaps the statements that use the columns are taken from pg_stat_statements,
+if the extension is installed, to show how often they run and how much time they take.
+"""
+import logging
+
+from typing import Dict, Iterable, List, Optional
+
+import sqlalchemy as s
+
+
+NATURAL_KEY = "natural_key"
+LOOKUP = "lookup"
+
+# the natural keys and lookup columns the collection tasks use per table of the augur_data schema,
+# new insert_data calls and lookups should be added here along with the index they need
+COLLECTION_KEYS = {
+    "contributors": {
+        "natural_keys": [["cntrb_id"], ["cntrb_login"]],
+        "lookups": [["gh_user_id"], ["cntrb_full_name"], ["cntrb_canonical"], ["cntrb_email"]]
+    },
+    "contributors_aliases": {
+        "natural_keys": [["alias_email"]],
+        "lookups": [["alias_email"]]
+    },
+    "unresolved_commit_emails": {
+        "natural_keys": [["email"]],
+        "lookups": [["email"]]
+    },
+    "repo": {
+        "natural_keys": [["repo_id"]],
+        "lookups": [["repo_git"]]
+    },
+    "releases": {
+        "natural_keys": [["release_id"]],
+        "lookups": []
+    },
+    "commits": {
+        "natural_keys": [],
+        "lookups": [["repo_id", "cmt_commit_hash"], ["cmt_author_email"], ["cmt_author_raw_email"],
+                    ["cmt_committer_email"], ["cmt_committer_raw_email"]]
+    },
+    "issues": {
+        "natural_keys": [["repo_id", "gh_issue_id"]],
+        "lookups": [["issue_url"]]
+    },
+    "issue_labels": {
+        "natural_keys": [["label_src_id", "issue_id"]],
+        "lookups": []
+    },
+    "issue_assignees": {
+        "natural_keys": [["issue_assignee_src_id", "issue_id"]],
+        "lookups": []
+    },
+    "issue_events": {
+        "natural_keys": [["repo_id", "issue_id", "issue_event_src_id"]],
+        "lookups": []
+    },
+    "issue_message_ref": {
+        "natural_keys": [["issue_id", "issue_msg_ref_src_comment_id"]],
+        "lookups": []
+    },
+    "message": {
+        "natural_keys": [["repo_id", "platform_msg_id"]],
+        "lookups": []
+    },
+    "pull_requests": {
+        "natural_keys": [["pr_url"], ["repo_id", "pr_src_id"]],
+        "lookups": [["pr_url"], ["pr_issue_url"]]
+    },
+    "pull_request_events": {
+        "natural_keys": [["repo_id", "node_id"]],
+        "lookups": []
+    },
+    "pull_request_labels": {
+        "natural_keys": [["pr_src_id", "pull_request_id"]],
+        "lookups": []
+    },
+    "pull_request_assignees": {
+        "natural_keys": [["pull_request_id", "pr_assignee_src_id"]],
+        "lookups": []
+    },
+    "pull_request_reviewers": {
+        "natural_keys": [["pull_request_id", "pr_reviewer_src_id"]],
+        "lookups": []
+    },
+    "pull_request_meta": {
+        "natural_keys": [["pull_request_id", "pr_head_or_base", "pr_sha"]],
+        "lookups": []
+    },
+    "pull_request_files": {
+        "natural_keys": [["pull_request_id", "repo_id", "pr_file_path"]],
+        "lookups": []
+    },
+    "pull_request_commits": {
+        "natural_keys": [["pull_request_id", "repo_id", "pr_cmt_sha"]],
+        "lookups": []
+    },
+    "pull_request_reviews": {
+        "natural_keys": [],
+        "lookups": [["pr_review_src_id"]]
+    },
+    "pull_request_message_ref": {
+        "natural_keys": [["pull_request_id", "pr_message_ref_src_comment_id"]],
+        "lookups": []
+    },
+    "pull_request_review_message_ref": {
+        "natural_keys": [["pr_review_msg_src_id"]],
+        "lookups": []
+    }
+}
+
+SCHEMA = "augur_data"
+
+DEFAULT_STATEMENT_LIMIT = 3
+
+# characters of a statement that are reported
+MAX_REPORTED_STATEMENT_LENGTH = 300
+
+logger = logging.getLogger(__name__)
+
+
+def find_covering_index(indexes: Iterable[dict], columns: List[str], kind: str) -> Optional[str]:
+    """Find an index that covers a natural key or a lookup
+
+    A natural key needs a valid unique btree index on exactly its columns. A lookup needs a valid btree index that
+    starts with its columns, in any order, or a hash index on its single column. Partial indexes cover neither.
+
+    Args:
+        indexes: dicts with the name, columns, method and the unique, partial and valid flags of the indexes of the table
+        columns: columns of the key
+        kind: NATURAL_KEY or LOOKUP
+
+    Returns:
+        name of the first index that covers the key, None if there is none
+    """
+
+    for index in indexes:
+
+        if index["partial"] or not index["valid"] or None in index["columns"]:
+            continue
+
+        if kind == NATURAL_KEY:
+            if index["unique"] and index["method"] == "btree" and sorted(index["columns"]) == sorted(columns):
+                return index["name"]
+
+        elif index["method"] == "btree" and sorted(index["columns"][:len(columns)]) == sorted(columns):
+            return index["name"]
+
+        elif index["method"] == "hash" and index["columns"] == columns:
+            return index["name"]
+
+    return None
+
+
+def get_declared_indexes(table) -> List[dict]:
+    """Get the primary key, unique constraints and indexes of a table of the models
+
+    Args:
+        table: sqlalchemy table
+
+    Returns:
+        list of index dicts like find_covering_index takes
+    """
+
+    indexes = []
+
+    for constraint in table.constraints:
+        if isinstance(constraint, (s.PrimaryKeyConstraint, s.UniqueConstraint)) and len(constraint.columns):
+
+            # unnamed constraints get the names postgres gives them
+            if isinstance(constraint, s.PrimaryKeyConstraint):
+                default_name = f"{table.name}_pkey"
+            else:
+                default_name = f"{table.name}_{'_'.join(constraint.columns.keys())}_key"
+
+            indexes.append({
+                "name": constraint.name or default_name,
+                "columns": list(constraint.columns.keys()),
+                "method": "btree",
+                "unique": True,
+                "partial": False,
+                "valid": True
+            })
+
+    for index in table.indexes:
+
+        postgresql_options = index.dialect_options["postgresql"]
+
+        indexes.append({
+            "name": index.name,
+            # expressions aren't columns
+            "columns": [expression.name if isinstance(expression, s.Column) else None for expression in index.expressions],
+            "method": postgresql_options["using"] or "btree",
+            "unique": bool(index.unique),
+            "partial": postgresql_options["where"] is not None,
+            "valid": True
+        })
+
+    return indexes
+
+
+def get_database_indexes(connection, table: str) -> Optional[List[dict]]:
+    """Get the indexes of a table in the database
+
+    Args:
+        connection: database connection
+        table: name of the table in the augur_data schema
+
+    Returns:
+        list of index dicts like find_covering_index takes, None if the table doesn't exist
+    """
+
+    exists = connection.execute(s.sql.text("SELECT to_regclass(:table) IS NOT NULL"), table=f"{SCHEMA}.{table}").scalar()
+    if not exists:
+        return None
+
+    # the indexes of partitioned tables are listed on the parent, the key columns of expressions have no attribute
+    indexes_sql = s.sql.text("""
+        SELECT index_class.relname AS name, am.amname AS method, pg_index.indisunique AS is_unique,
+            pg_index.indisvalid AS valid, pg_index.indpred IS NOT NULL AS partial,
+            ARRAY(
+                SELECT pg_attribute.attname
+                FROM unnest(CAST(pg_index.indkey AS int2[])) WITH ORDINALITY AS key(attnum, position)
+                    LEFT JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid AND pg_attribute.attnum = key.attnum
+                WHERE key.position <= pg_index.indnkeyatts
+                ORDER BY key.position
+            ) AS columns
+        FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            JOIN pg_am am ON am.oid = index_class.relam
+        WHERE pg_index.indrelid = CAST(:table AS regclass)
+    """)
+
+    return [{"name": row.name, "columns": list(row.columns), "method": row.method, "unique": row.is_unique,
+             "partial": row.partial, "valid": row.valid}
+            for row in connection.execute(indexes_sql, table=f"{SCHEMA}.{table}")]
+
+
+def get_statement_time_column(connection) -> Optional[str]:
+    """Get the column of pg_stat_statements with the total time of the statements
+
+    Returns:
+        total_exec_time, or total_time before postgres 13. None if pg_stat_statements isn't installed
+    """
+
+    installed = connection.execute(s.sql.text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements')")).scalar()
+    if not installed:
+        return None
+
+    return connection.execute(s.sql.text("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass('pg_stat_statements') AND attname IN ('total_exec_time', 'total_time')
+    """)).scalar()
+
+
+def get_statement_evidence(connection, time_column: str, table: str, columns: List[str], limit: int = DEFAULT_STATEMENT_LIMIT) -> dict:
+    """Get the statements of pg_stat_statements that mention a table and all columns of a key
+
+    Args:
+        connection: database connection
+        time_column: column with the total time of the statements, see get_statement_time_column
+        table: name of the table
+        columns: columns of the key
+        limit: number of statements that are reported
+
+    Returns:
+        dict with the number of matching statements, their calls and total milliseconds, and the slowest of them
+    """
+
+    # \m and \M match the start and end of a word, so pr_url doesn't match pr_url_id
+    patterns = {f"pattern_{i}": f"\\m{name}\\M" for i, name in enumerate([table] + columns)}
+    conditions = " AND ".join(f"query ~* :{key}" for key in patterns)
+
+    evidence_sql = s.sql.text(f"""
+        SELECT calls, {time_column} AS total_time, query
+        FROM pg_stat_statements
+        WHERE {conditions}
+        ORDER BY {time_column} DESC
+    """)
+
+    rows = connection.execute(evidence_sql, **patterns).fetchall()
+
+    return {
+        "statements": len(rows),
+        "calls": sum(row.calls for row in rows),
+        "total_time_ms": round(sum(row.total_time for row in rows), 1),
+        "slowest": [" ".join(row.query.split())[:MAX_REPORTED_STATEMENT_LENGTH] for row in rows[:limit]]
+    }
+
+
+def check_indexes(metadata, connection=None, keys: Dict[str, dict] = COLLECTION_KEYS) -> List[dict]:
+    """Check that the natural keys and lookups of the collection tasks are covered by indexes
+
+    Args:
+        metadata: sqlalchemy metadata of the models
+        connection: database connection, if None only the declared indexes are checked
+        keys: natural keys and lookups per table of the augur_data schema
+
+    Returns:
+        list of dicts with the table, columns and kind of each key, the names of the declared and the
+            database index that cover it (None if there is none) and whether it is a gap.
+            Gaps have the pg_stat_statements evidence if it is available
+    """
+
+    time_column = get_statement_time_column(connection) if connection is not None else None
+    if connection is not None and time_column is None:
+        logger.info("pg_stat_statements isn't installed, the gaps are reported without the statements that hit them")
+
+    results = []
+    for table, table_keys in keys.items():
+
+        model_table = metadata.tables.get(f"{SCHEMA}.{table}")
+        declared_indexes = get_declared_indexes(model_table) if model_table is not None else []
+        database_indexes = get_database_indexes(connection, table) if connection is not None else None
+
+        for kind, key_columns in [(NATURAL_KEY, columns) for columns in table_keys["natural_keys"]] + \
+                                 [(LOOKUP, columns) for columns in table_keys["lookups"]]:
+
+            result = {
+                "table": table,
+                "columns": key_columns,
+                "kind": kind,
+                "declared_index": find_covering_index(declared_indexes, key_columns, kind),
+                "database_index": find_covering_index(database_indexes, key_columns, kind) if database_indexes is not None else None
+            }
+
+            result["gap"] = result["declared_index"] is None or (connection is not None and result["database_index"] is None)
+
+            if result["gap"] and time_column is not None and database_indexes is not None:
+                result["evidence"] = get_statement_evidence(connection, time_column, table, key_columns)
+
+            results.append(result)
+
+    return results
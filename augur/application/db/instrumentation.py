@@ -0,0 +1,250 @@
+"""Counts the queries, rows and time of every statement the engines execute, per celery task or api route.
+
+The task or route that runs is kept in a context variable, which AugurTask and the flask app set with query_context.
+Statements that take longer than the slow_query_threshold_ms of the Database section of the config are sampled,
+with the slow_query_sample_rate, to the slow_queries log. At the end of each task its totals are logged and added
+to the redis hash query_stats, so the tasks that dominate the database time can be compared across workers.
+"""
+import json
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import event
+
+from augur.tasks.util.redis_stats import increment_stats, get_stats
+
+
+QUERY_STATS_KEY = "query_stats"
+
+SLOW_QUERY_LOGGER = "slow_queries"
+
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 1000
+DEFAULT_SLOW_QUERY_SAMPLE_RATE = 1.0
+
+# characters of a slow statement that are logged
+MAX_LOGGED_STATEMENT_LENGTH = 2000
+
+# name the queries outside of a task or route are counted under
+UNATTRIBUTED = "unattributed"
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(SLOW_QUERY_LOGGER)
+
+_slow_query_threshold = DEFAULT_SLOW_QUERY_THRESHOLD_MS / 1000
+_slow_query_sample_rate = DEFAULT_SLOW_QUERY_SAMPLE_RATE
+
+_current_context = contextvars.ContextVar("query_context", default=None)
+
+# totals of this process per task or route
+_process_stats = {}
+_process_stats_lock = threading.Lock()
+
+
+class QueryContext():
+    """The task or route queries are attributed to, and the totals of its queries
+
+    Attributes:
+        task (str): name of the celery task
+        repo (str): repo the task collects
+        route (str): url rule of the api route
+        statement_timeout (int): milliseconds after which postgres cancels a statement, None for the server default
+        queries (int): number of statements executed
+        rows (int): rows the statements returned or changed
+        duration (float): seconds the statements took
+        max_duration (float): seconds the longest statement took
+        slow_queries (int): number of statements that took longer than the slow query threshold
+    """
+
+    def __init__(self, task: Optional[str] = None, repo: Optional[str] = None, route: Optional[str] = None,
+                 statement_timeout: Optional[int] = None):
+
+        self.task = task
+        self.repo = repo
+        self.route = route
+        self.statement_timeout = statement_timeout
+
+        self.queries = 0
+        self.rows = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.slow_queries = 0
+
+        # the statements of a context can run in threads the context was copied to
+        self.lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+
+        if self.task:
+            return f"task:{self.task}"
+
+        if self.route:
+            return f"route:{self.route}"
+
+        return UNATTRIBUTED
+
+    def record(self, rows: int, duration: float, slow: bool) -> None:
+
+        with self.lock:
+            self.queries += 1
+            self.rows += rows
+            self.duration += duration
+            self.max_duration = max(self.max_duration, duration)
+            self.slow_queries += slow
+
+    def get_summary(self) -> dict:
+
+        with self.lock:
+            return {
+                "queries": self.queries,
+                "rows": self.rows,
+                "duration": round(self.duration, 3),
+                "max_duration": round(self.max_duration, 3),
+                "slow_queries": self.slow_queries
+            }
+
+
+def configure_slow_queries(threshold_ms: int, sample_rate: float) -> None:
+    """Set which statements are sampled to the slow query log
+
+    Args:
+        threshold_ms: milliseconds after which a statement is slow
+        sample_rate: share of the slow statements that are logged, between 0 and 1
+    """
+
+    global _slow_query_threshold, _slow_query_sample_rate
+
+    _slow_query_threshold = threshold_ms / 1000
+    _slow_query_sample_rate = sample_rate
+
+
+@contextmanager
+def query_context(task: Optional[str] = None, repo: Optional[str] = None, route: Optional[str] = None,
+                  statement_timeout: Optional[int] = None) -> Iterator[QueryContext]:
+    """Attribute the statements executed inside the with block to a task or a route
+
+    Note:
+        The statement_timeout is applied to the connections of the shared engines 
+            when they are checked out inside the block, see augur.application.db.statement_timeout
+
+    Yields:
+        the context, which holds the totals of its statements
+    """
+
+    context = QueryContext(task, repo, route, statement_timeout)
+    token = _current_context.set(context)
+
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def get_current_query_context() -> Optional[QueryContext]:
+
+    return _current_context.get()
+
+
+def instrument_engine(engine) -> None:
+    """Count the statements the engine executes"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        record_query(statement, max(cursor.rowcount, 0), duration)
+
+    @event.listens_for(engine, "handle_error")
+    def discard_failed_query(exception_context):
+        query_start = exception_context.connection.info.get("query_start") if exception_context.connection is not None else None
+        if query_start:
+            query_start.pop()
+
+
+def record_query(statement: str, rows: int, duration: float) -> None:
+    """Add a statement to the totals of the current context and of the process, and sample it if it was slow"""
+
+    context = _current_context.get()
+    slow = duration >= _slow_query_threshold
+
+    if context is not None:
+        context.record(rows, duration, slow)
+
+    name = context.name if context is not None else UNATTRIBUTED
+
+    with _process_stats_lock:
+
+        stats = _process_stats.setdefault(name, {"queries": 0, "rows": 0, "duration": 0.0, "max_duration": 0.0, "slow_queries": 0})
+
+        stats["queries"] += 1
+        stats["rows"] += rows
+        stats["duration"] += duration
+        stats["max_duration"] = max(stats["max_duration"], duration)
+        stats["slow_queries"] += slow
+
+    if slow and random.random() < _slow_query_sample_rate:
+
+        slow_query_logger.warning(json.dumps({
+            "duration": round(duration, 3),
+            "rows": rows,
+            "task": context.task if context else None,
+            "repo": context.repo if context else None,
+            "route": context.route if context else None,
+            "pid": os.getpid(),
+            "statement": " ".join(statement.split())[:MAX_LOGGED_STATEMENT_LENGTH]
+        }))
+
+
+def get_query_stats() -> Dict[str, dict]:
+    """Get the totals of the statements this process executed per task and route
+
+    Returns:
+        dict that maps task:<name>, route:<rule> and unattributed to their totals
+    """
+
+    with _process_stats_lock:
+        return {name: dict(stats, duration=round(stats["duration"], 3), max_duration=round(stats["max_duration"], 3))
+                for name, stats in _process_stats.items()}
+
+
+def record_task_query_summary(context: QueryContext, task_logger: Optional[logging.Logger] = None) -> None:
+    """Log the totals of the statements of a task and add them to the task stats in redis
+
+    Args:
+        context: the context of the task
+        task_logger: logger the summary is logged to, the module logger by default
+    """
+
+    summary = context.get_summary()
+
+    repo = f" of {context.repo}" if context.repo else ""
+    (task_logger or logger).info(f"{context.task}{repo} executed {summary['queries']} statements that returned "
+                                 f"{summary['rows']} rows in {summary['duration']} seconds, {summary['slow_queries']} of them were slow")
+
+    increment_stats(QUERY_STATS_KEY, context.task, {
+        "runs": 1,
+        "queries": summary["queries"],
+        "rows": summary["rows"],
+        "slow_queries": summary["slow_queries"],
+        "duration": float(summary["duration"])
+    })
+
+
+def get_task_query_stats() -> Dict[str, Dict[str, float]]:
+    """Get the totals of the statements of each task across all workers
+
+    Returns:
+        dict that maps task names to their runs, queries, rows, slow queries and duration
+    """
+
+    return get_stats(QUERY_STATS_KEY, float_stats=("duration",))
@@ -28,6 +28,7 @@ from augur.application.db.models.augur_data import (
     Release,
     RepoBadging,
     RepoClusterMessage,
+    RepoDailyActivity,
     RepoDependency,
     RepoDepsLibyear,
     RepoDepsScorecard,
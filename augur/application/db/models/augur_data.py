@@ -7,6 +7,7 @@ from sqlalchemy import (
     Date,
     Float,
     ForeignKey,
+    ForeignKeyConstraint,
     Index,
     Integer,
     JSON,
@@ -156,6 +157,9 @@ class Contributor(Base):
         Index("login", "cntrb_login"),
         Index("login-contributor-idx", "cntrb_login"),
 
+        # looked up when github users are resolved to contributors
+        Index("contributors_gh_user_id", "gh_user_id"),
+
         {
             "schema": "augur_data",
             "comment": "For GitHub, this should be repeated from gh_login. for other systems, it should be that systems login. \nGithub now allows a user to change their login name, but their user id remains the same in this case. So, the natural key is the combination of id and login, but there should never be repeated logins. ",
@@ -930,11 +934,13 @@ class Commit(Base):
             "cmt_author_date",
         ),
         Index("committer_raw_email", "cmt_committer_raw_email"),
+        Index("committer_email", "cmt_committer_email"),
         Index("repo_id,commit", "repo_id", "cmt_commit_hash"),
 
         {
             "schema": "augur_data",
             "comment": "Commits.\nEach row represents changes to one FILE within a single commit. So you will encounter multiple rows per commit hash in many cases. ",
+            "postgresql_partition_by": "HASH (repo_id)",
         },
     )
 
@@ -945,6 +951,7 @@ class Commit(Base):
     )
     repo_id = Column(
         ForeignKey("augur_data.repo.repo_id", ondelete="RESTRICT", onupdate="CASCADE"),
+        primary_key=True,
         nullable=False,
     )
     cmt_commit_hash = Column(String(80), nullable=False)
@@ -1159,11 +1166,11 @@ class LstmAnomalyResult(Base):
 class Message(Base):
     __tablename__ = "message"
     __table_args__ = (
-        UniqueConstraint("platform_msg_id", name="message-insert-unique"),
+        UniqueConstraint("repo_id", "platform_msg_id", name="message-insert-unique"),
         Index("msg-cntrb-id-idx", "cntrb_id"),
         Index("platformgrouper", "msg_id", "pltfrm_id"),
-        Index("messagegrouper", "msg_id", "rgls_id", unique=True),
-        {"schema": "augur_data"},
+        Index("messagegrouper", "msg_id", "rgls_id", "repo_id", unique=True),
+        {"schema": "augur_data", "postgresql_partition_by": "HASH (repo_id)"},
     )
 
     msg_id = Column(
@@ -1187,7 +1194,9 @@ class Message(Base):
             onupdate="CASCADE",
             deferrable=True,
             initially="DEFERRED",
-        )
+        ),
+        primary_key=True,
+        nullable=False,
     )
     cntrb_id = Column(
         ForeignKey(
@@ -1313,6 +1322,7 @@ class PullRequest(Base):
         Index(
             "pull_requests_idx_repo_id_data_datex", "repo_id", "data_collection_date"
         ),
+        Index("pull_requests_pr_issue_url", "pr_issue_url"),
         {"schema": "augur_data"},
     )
 
@@ -1523,6 +1533,33 @@ class RepoClusterMessage(Base):
     repo = relationship("Repo")
 
 
+class RepoDailyActivity(Base):
+    __tablename__ = "repo_daily_activity"
+    __table_args__ = {
+        "schema": "augur_data",
+        "comment": "Daily counts of the issues, issue events, pull requests and commits of each repo. Collection recomputes the days of a repo whose counts it changed, so timeseries metrics can aggregate days instead of scanning the raw tables.",
+    }
+
+    repo_id = Column(
+        ForeignKey("augur_data.repo.repo_id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    day = Column(Date, primary_key=True, nullable=False)
+    issues_opened = Column(Integer, nullable=False, server_default=text("0"))
+    issues_closed = Column(Integer, nullable=False, server_default=text("0"))
+    issue_events = Column(Integer, nullable=False, server_default=text("0"))
+    pull_requests_opened = Column(Integer, nullable=False, server_default=text("0"))
+    commits = Column(Integer, nullable=False, server_default=text("0"))
+    lines_added = Column(BigInteger, nullable=False, server_default=text("0"))
+    lines_removed = Column(BigInteger, nullable=False, server_default=text("0"))
+    data_collection_date = Column(
+        TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
+    )
+
+    repo = relationship("Repo")
+
+
 class RepoDependency(Base):
     __tablename__ = "repo_dependencies"
     __table_args__ = {
@@ -1875,6 +1912,20 @@ class CommitCommentRef(Base):
     __tablename__ = "commit_comment_ref"
     __table_args__ = (
         Index("comment_id", "cmt_comment_src_id", "cmt_comment_id", "msg_id"),
+        ForeignKeyConstraint(
+            ["cmt_id", "repo_id"],
+            ["augur_data.commits.cmt_id", "augur_data.commits.repo_id"],
+            match="FULL",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+        ),
+        ForeignKeyConstraint(
+            ["msg_id", "repo_id"],
+            ["augur_data.message.msg_id", "augur_data.message.repo_id"],
+            match="FULL",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+        ),
         {"schema": "augur_data"},
     )
 
@@ -1885,19 +1936,10 @@ class CommitCommentRef(Base):
             "nextval('augur_data.commit_comment_ref_cmt_comment_id_seq'::regclass)"
         ),
     )
-    cmt_id = Column(
-        ForeignKey(
-            "augur_data.commits.cmt_id", ondelete="RESTRICT", onupdate="CASCADE"
-        ),
-        nullable=False,
-    )
+    # commits and message are partitioned by repo_id, so their ids are referenced together with repo_id
+    cmt_id = Column(BigInteger, nullable=False)
     repo_id = Column(BigInteger)
-    msg_id = Column(
-        ForeignKey(
-            "augur_data.message.msg_id", ondelete="RESTRICT", onupdate="CASCADE"
-        ),
-        nullable=False,
-    )
+    msg_id = Column(BigInteger, nullable=False)
     user_id = Column(BigInteger, nullable=False)
     body = Column(Text)
     line = Column(BigInteger)
@@ -1922,8 +1964,8 @@ class CommitCommentRef(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    cmt = relationship("Commit")
-    msg = relationship("Message")
+    cmt = relationship("Commit", primaryjoin="foreign(CommitCommentRef.cmt_id) == Commit.cmt_id")
+    msg = relationship("Message", primaryjoin="foreign(CommitCommentRef.msg_id) == Message.msg_id")
 
 
 class CommitParent(Base):
@@ -1934,13 +1976,14 @@ class CommitParent(Base):
         {"schema": "augur_data"}
     )
 
+    # commits is partitioned by repo_id, so cmt_id can't be referenced by foreign keys
     cmt_id = Column(
-        ForeignKey("augur_data.commits.cmt_id"),
+        BigInteger,
         primary_key=True,
         nullable=False,
     )
     parent_id = Column(
-        ForeignKey("augur_data.commits.cmt_id"),
+        BigInteger,
         primary_key=True,
         nullable=False,
         server_default=text(
@@ -1954,9 +1997,9 @@ class CommitParent(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    cmt = relationship("Commit", primaryjoin="CommitParent.cmt_id == Commit.cmt_id")
+    cmt = relationship("Commit", primaryjoin="foreign(CommitParent.cmt_id) == Commit.cmt_id")
     parent = relationship(
-        "Commit", primaryjoin="CommitParent.parent_id == Commit.cmt_id"
+        "Commit", primaryjoin="foreign(CommitParent.parent_id) == Commit.cmt_id"
     )
 
 
@@ -1974,7 +2017,8 @@ class DiscourseInsight(Base):
             "nextval('augur_data.discourse_insights_msg_discourse_id_seq1'::regclass)"
         ),
     )
-    msg_id = Column(ForeignKey("augur_data.message.msg_id"))
+    # message is partitioned by repo_id, so msg_id can't be referenced by a foreign key
+    msg_id = Column(BigInteger)
     discourse_act = Column(String)
     tool_source = Column(String)
     tool_version = Column(String)
@@ -1983,7 +2027,7 @@ class DiscourseInsight(Base):
         TIMESTAMP(True, 6), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(DiscourseInsight.msg_id) == Message.msg_id")
 
 
 class IssueAssignee(Base):
@@ -2044,13 +2088,13 @@ class IssueAssignee(Base):
 class IssueEvent(Base):
     __tablename__ = "issue_events"
     __table_args__ = (
-        UniqueConstraint('issue_id', 'issue_event_src_id', name='unique_event_id_key'),
+        UniqueConstraint('repo_id', 'issue_id', 'issue_event_src_id', name='unique_event_id_key'),
 
         Index("issue-cntrb-idx2", "issue_event_src_id"),
         Index("issue_events_ibfk_1", "issue_id"),
         Index("issue_events_ibfk_2", "cntrb_id"),
 
-        {"schema": "augur_data"},
+        {"schema": "augur_data", "postgresql_partition_by": "HASH (repo_id)"},
     )
 
     event_id = Column(
@@ -2067,7 +2111,9 @@ class IssueEvent(Base):
         nullable=False,
     )
     repo_id = Column(
-        ForeignKey("augur_data.repo.repo_id", ondelete="RESTRICT", onupdate="CASCADE")
+        ForeignKey("augur_data.repo.repo_id", ondelete="RESTRICT", onupdate="CASCADE"),
+        primary_key=True,
+        nullable=False,
     )
     cntrb_id = Column(
         ForeignKey(
@@ -2190,6 +2236,15 @@ class IssueMessageRef(Base):
     __tablename__ = "issue_message_ref"
     __table_args__ = (
         UniqueConstraint("issue_msg_ref_src_comment_id", "issue_id", name="issue-message-ref-insert-unique"),
+        ForeignKeyConstraint(
+            ["msg_id", "repo_id"],
+            ["augur_data.message.msg_id", "augur_data.message.repo_id"],
+            match="FULL",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
         {"schema": "augur_data"},
     )
 
@@ -2218,15 +2273,8 @@ class IssueMessageRef(Base):
             initially="DEFERRED",
         )
     )
-    msg_id = Column(
-        ForeignKey(
-            "augur_data.message.msg_id",
-            ondelete="RESTRICT",
-            onupdate="CASCADE",
-            deferrable=True,
-            initially="DEFERRED",
-        )
-    )
+    # message is partitioned by repo_id, so msg_id is referenced together with repo_id
+    msg_id = Column(BigInteger)
     issue_msg_ref_src_node_id = Column(
         String,
         comment="This character based identifier comes from the source. In the case of GitHub, it is the id that is the first field returned from the issue comments API",
@@ -2243,7 +2291,7 @@ class IssueMessageRef(Base):
     )
 
     issue = relationship("Issue")
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(IssueMessageRef.msg_id) == Message.msg_id")
     repo = relationship("Repo")
 
 
@@ -2312,7 +2360,8 @@ class MessageAnalysis(Base):
             "nextval('augur_data.message_analysis_msg_analysis_id_seq'::regclass)"
         ),
     )
-    msg_id = Column(ForeignKey("augur_data.message.msg_id"))
+    # message is partitioned by repo_id, so msg_id can't be referenced by a foreign key
+    msg_id = Column(BigInteger)
     worker_run_id = Column(
         BigInteger,
         comment="This column is used to indicate analyses run by a worker during the same execution period, and is useful for grouping, and time series analysis.  ",
@@ -2340,7 +2389,7 @@ class MessageAnalysis(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(MessageAnalysis.msg_id) == Message.msg_id")
 
 
 class MessageSentiment(Base):
@@ -2354,7 +2403,8 @@ class MessageSentiment(Base):
             "nextval('augur_data.message_sentiment_msg_analysis_id_seq'::regclass)"
         ),
     )
-    msg_id = Column(ForeignKey("augur_data.message.msg_id"))
+    # message is partitioned by repo_id, so msg_id can't be referenced by a foreign key
+    msg_id = Column(BigInteger)
     worker_run_id = Column(
         BigInteger,
         comment="This column is used to indicate analyses run by a worker during the same execution period, and is useful for grouping, and time series analysis.  ",
@@ -2382,7 +2432,7 @@ class MessageSentiment(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(MessageSentiment.msg_id) == Message.msg_id")
 
 
 class PullRequestAnalysis(Base):
@@ -2546,9 +2596,9 @@ class PullRequestEvent(Base):
     __table_args__ = (
         Index("pr_events_ibfk_1", "pull_request_id"),
         Index("pr_events_ibfk_2", "cntrb_id"),
-        UniqueConstraint("platform_id", "node_id", name="unique-pr-event-id"),
-        UniqueConstraint("node_id", name="pr-unqiue-event"),
-        {"schema": "augur_data"},
+        UniqueConstraint("repo_id", "platform_id", "node_id", name="unique-pr-event-id"),
+        UniqueConstraint("repo_id", "node_id", name="pr-unqiue-event"),
+        {"schema": "augur_data", "postgresql_partition_by": "HASH (repo_id)"},
     )
 
     pr_event_id = Column(
@@ -2573,7 +2623,9 @@ class PullRequestEvent(Base):
             onupdate="RESTRICT",
             deferrable=True,
             initially="DEFERRED",
-        )
+        ),
+        primary_key=True,
+        nullable=False,
     )
     cntrb_id = Column(
         ForeignKey("augur_data.contributors.cntrb_id")
@@ -2758,6 +2810,15 @@ class PullRequestMessageRef(Base):
     __tablename__ = "pull_request_message_ref"
     __table_args__ = (
         UniqueConstraint("pr_message_ref_src_comment_id", "pull_request_id", name="pull-request-message-ref-insert-unique"),
+        ForeignKeyConstraint(
+            ["msg_id", "repo_id"],
+            ["augur_data.message.msg_id", "augur_data.message.repo_id"],
+            match="FULL",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
         {"schema": "augur_data"},
     )
 
@@ -2780,15 +2841,8 @@ class PullRequestMessageRef(Base):
     repo_id = Column(
         ForeignKey("augur_data.repo.repo_id", ondelete="RESTRICT", onupdate="CASCADE")
     )
-    msg_id = Column(
-        ForeignKey(
-            "augur_data.message.msg_id",
-            ondelete="RESTRICT",
-            onupdate="CASCADE",
-            deferrable=True,
-            initially="DEFERRED",
-        )
-    )
+    # message is partitioned by repo_id, so msg_id is referenced together with repo_id
+    msg_id = Column(BigInteger)
     pr_message_ref_src_comment_id = Column(BigInteger)
     pr_message_ref_src_node_id = Column(String)
     pr_issue_url = Column(String)
@@ -2799,7 +2853,7 @@ class PullRequestMessageRef(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(PullRequestMessageRef.msg_id) == Message.msg_id")
     pull_request = relationship("PullRequest")
     repo = relationship("Repo")
 
@@ -3094,6 +3148,15 @@ class PullRequestReviewMessageRef(Base):
     __tablename__ = "pull_request_review_message_ref"
     __table_args__ = (
         UniqueConstraint("pr_review_msg_src_id", name="pull-request-review-message-ref-insert-unique"),
+        ForeignKeyConstraint(
+            ["msg_id", "repo_id"],
+            ["augur_data.message.msg_id", "augur_data.message.repo_id"],
+            match="FULL",
+            ondelete="RESTRICT",
+            onupdate="CASCADE",
+            deferrable=True,
+            initially="DEFERRED",
+        ),
         {"schema": "augur_data"},
     )
 
@@ -3123,16 +3186,8 @@ class PullRequestReviewMessageRef(Base):
             initially="DEFERRED",
         )
     )
-    msg_id = Column(
-        ForeignKey(
-            "augur_data.message.msg_id",
-            ondelete="RESTRICT",
-            onupdate="CASCADE",
-            deferrable=True,
-            initially="DEFERRED",
-        ),
-        nullable=False,
-    )
+    # message is partitioned by repo_id, so msg_id is referenced together with repo_id
+    msg_id = Column(BigInteger, nullable=False)
     pr_review_msg_url = Column(String)
     pr_review_src_id = Column(BigInteger)
     pr_review_msg_src_id = Column(BigInteger)
@@ -3160,6 +3215,6 @@ class PullRequestReviewMessageRef(Base):
         TIMESTAMP(precision=0), server_default=text("CURRENT_TIMESTAMP")
     )
 
-    msg = relationship("Message")
+    msg = relationship("Message", primaryjoin="foreign(PullRequestReviewMessageRef.msg_id) == Message.msg_id")
     pr_review = relationship("PullRequestReview")
     repo = relationship("Repo")
@@ -0,0 +1,375 @@
+"""Moves the rows of the large collection tables into their repo_id partitioned copies while augur keeps collecting.
+
+The partitioned copies are created empty by the alembic migration 4. Moving a table takes three steps:
+
+1. A trigger mirrors every write to the existing table into the partitioned copy.
+2. The existing rows are copied in chunks of primary keys, each chunk in its own short transaction,
+   so collection only ever waits on the rows of one chunk.
+3. The tables are swapped in one short transaction. The existing table is kept as <table>_unpartitioned.
+
+Rows without a repo_id can't be partitioned, and foreign keys from tables without a repo_id can't reference
+the partitioned table, so the swap refuses to run while either exists unless it is forced (see get_swap_problems).
+"""
+import logging
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as s
+
+
+# the primary key column of each table that can be partitioned
+PARTITIONED_TABLES = {
+    "commits": "cmt_id",
+    "message": "msg_id",
+    "issue_events": "event_id",
+    "pull_request_events": "pr_event_id"
+}
+
+PARTITIONED_SUFFIX = "_partitioned"
+UNPARTITIONED_SUFFIX = "_unpartitioned"
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# how long the swap waits for the lock on the existing table before it gives up,
+# since the writes that queue behind the waiting swap are blocked as well
+SWAP_LOCK_TIMEOUT = "10s"
+
+# postgres truncates longer identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+logger = logging.getLogger(__name__)
+
+
+class PartitioningError(Exception):
+    """Raised when a table can't be moved into its partitioned copy"""
+
+
+def suffixed_name(name: str, suffix: str) -> str:
+    """Add a suffix to the name of a table, index or constraint, truncating the name so the suffix is kept
+
+    Args:
+        name: name to add the suffix to
+        suffix: suffix to add
+
+    Returns:
+        name with the suffix
+    """
+
+    return name[:MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+def unsuffixed_name(name: str, suffix: str) -> str:
+    """Remove a suffix from the name of a table, index or constraint
+
+    Args:
+        name: name to remove the suffix from
+        suffix: suffix to remove
+
+    Returns:
+        name without the suffix, or the name itself if it doesn't end with the suffix
+    """
+
+    if name.endswith(suffix):
+        return name[:-len(suffix)]
+
+    return name
+
+
+def get_trigger_name(table: str) -> str:
+
+    return suffixed_name(f"{table}_mirror", PARTITIONED_SUFFIX)
+
+
+def _check_partitioned_copy(connection, table: str) -> None:
+
+    partitioned_table = suffixed_name(table, PARTITIONED_SUFFIX)
+
+    if connection.execute(s.sql.text("SELECT to_regclass(:table)"), table=f'augur_data."{partitioned_table}"').scalar() is None:
+        raise PartitioningError(f"augur_data.{partitioned_table} doesn't exist. Either {table} is partitioned already, or `augur db upgrade-db-version` has to be run first")
+
+
+def install_mirror_trigger(engine, table: str) -> None:
+    """Mirror the writes to a table into its partitioned copy
+
+    Args:
+        engine: database engine
+        table: table to mirror, one of PARTITIONED_TABLES
+
+    Raises:
+        PartitioningError: if the partitioned copy doesn't exist
+    """
+
+    trigger_sql = s.sql.text(f"""
+        DROP TRIGGER IF EXISTS "{get_trigger_name(table)}" ON augur_data."{table}";
+
+        CREATE TRIGGER "{get_trigger_name(table)}"
+            AFTER INSERT OR UPDATE OR DELETE ON augur_data."{table}"
+            FOR EACH ROW EXECUTE PROCEDURE augur_data.mirror_to_partitioned('{suffixed_name(table, PARTITIONED_SUFFIX)}', '{PARTITIONED_TABLES[table]}');
+    """)
+
+    with engine.begin() as connection:
+        _check_partitioned_copy(connection, table)
+        connection.execute(trigger_sql)
+
+
+def copy_rows(engine, table: str, chunk_size: int = DEFAULT_CHUNK_SIZE, progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """Copy the rows of a table into its partitioned copy in chunks of primary keys
+
+    The copy can be restarted at any time, since rows that are already in the partitioned copy are skipped.
+
+    Args:
+        engine: database engine
+        table: table to copy, one of PARTITIONED_TABLES
+        chunk_size: number of primary keys that are copied in one transaction
+        progress: called with the last copied primary key and the number of rows copied so far after each chunk
+
+    Returns:
+        number of rows copied
+    """
+
+    primary_key = PARTITIONED_TABLES[table]
+    partitioned_table = suffixed_name(table, PARTITIONED_SUFFIX)
+
+    chunk_end_sql = s.sql.text(f"""
+        SELECT MAX("{primary_key}") FROM (
+            SELECT "{primary_key}" FROM augur_data."{table}"
+            WHERE "{primary_key}" > :after
+            ORDER BY "{primary_key}"
+            LIMIT :chunk_size
+        ) chunk
+    """)
+
+    # the copied rows are locked until the chunk is committed, otherwise the mirror trigger of an update or delete
+    # that runs while the chunk is copied doesn't see the copied row, and the copy would keep its old version
+    copy_sql = s.sql.text(f"""
+        INSERT INTO augur_data."{partitioned_table}"
+        SELECT * FROM augur_data."{table}"
+        WHERE "{primary_key}" > :after AND "{primary_key}" <= :until AND repo_id IS NOT NULL
+        FOR SHARE
+        ON CONFLICT DO NOTHING
+    """)
+
+    after = -1
+    copied = 0
+    while True:
+
+        with engine.connect() as connection:
+            until = connection.execute(chunk_end_sql, after=after, chunk_size=chunk_size).scalar()
+
+        if until is None:
+            break
+
+        with engine.begin() as connection:
+            copied += connection.execute(copy_sql, after=after, until=until).rowcount
+
+        after = until
+
+        if progress:
+            progress(after, copied)
+
+    return copied
+
+
+def _get_renames(connection, table: str) -> Tuple[List[str], List[str]]:
+    """Get the constraints and the indexes that don't belong to a constraint of a table"""
+
+    constraints_sql = s.sql.text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'u', 'f', 'c', 'x')
+    """)
+
+    indexes_sql = s.sql.text("""
+        SELECT index_class.relname FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = CAST(:table AS regclass)
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+    """)
+
+    constraints = [row[0] for row in connection.execute(constraints_sql, table=f'augur_data."{table}"')]
+    indexes = [row[0] for row in connection.execute(indexes_sql, table=f'augur_data."{table}"')]
+
+    return constraints, indexes
+
+
+def _rename_constraints_and_indexes(connection, table: str, rename: Callable[[str], str]) -> None:
+
+    constraints, indexes = _get_renames(connection, table)
+
+    for constraint in constraints:
+        if rename(constraint) != constraint:
+            connection.execute(s.sql.text(f'ALTER TABLE augur_data."{table}" RENAME CONSTRAINT "{constraint}" TO "{rename(constraint)}"'))
+
+    for index in indexes:
+        if rename(index) != index:
+            connection.execute(s.sql.text(f'ALTER INDEX augur_data."{index}" RENAME TO "{rename(index)}"'))
+
+
+def repo_foreign_key_definition(column: str, table: str, primary_key: str, options: str = "") -> str:
+    """Get the definition of a foreign key that references a partitioned table by its primary key and repo_id
+
+    Args:
+        column: column of the referencing table that holds the primary key
+        table: referenced table, one of PARTITIONED_TABLES
+        primary_key: primary key column of the referenced table
+        options: ON UPDATE, ON DELETE and DEFERRABLE options of the foreign key
+
+    Returns:
+        definition of the foreign key, without the validation of the existing rows
+
+    Note:
+        The foreign key matches fully, a row that sets the column but no repo_id is rejected instead of not being checked
+    """
+
+    options = options.replace("NOT VALID", "").replace("MATCH FULL", "").replace("MATCH SIMPLE", "").strip()
+
+    return " ".join(part for part in [
+        f'FOREIGN KEY ("{column}", repo_id) REFERENCES augur_data."{table}" ("{primary_key}", repo_id) MATCH FULL',
+        options,
+        "NOT VALID"
+    ] if part)
+
+
+def _get_referencing_foreign_keys(connection, table: str) -> list:
+    """Get the foreign keys of other tables that reference a table"""
+
+    foreign_keys_sql = s.sql.text(r"""
+        SELECT conrelid::regclass::text AS referencing_table, conname,
+            (SELECT attname FROM pg_attribute WHERE attrelid = conrelid AND attnum = conkey[1]) AS column_name,
+            array_length(conkey, 1) = 1 AND EXISTS (
+                SELECT 1 FROM pg_attribute WHERE attrelid = conrelid AND attname = 'repo_id' AND NOT attisdropped
+            ) AS has_repo_id,
+            COALESCE(substring(pg_get_constraintdef(oid) FROM '\)\s+REFERENCES\s+\S+\([^)]*\)(.*)$'), '') AS options
+        FROM pg_constraint
+        WHERE confrelid = CAST(:table AS regclass) AND conrelid != confrelid AND contype = 'f'
+    """)
+
+    return connection.execute(foreign_keys_sql, table=f'augur_data."{table}"').fetchall()
+
+
+def get_swap_problems(engine, table: str) -> List[str]:
+    """Get what would be lost by swapping a table with its partitioned copy
+
+    Args:
+        engine: database engine
+        table: table to swap, one of PARTITIONED_TABLES
+
+    Returns:
+        description of each problem, empty if nothing would be lost
+    """
+
+    problems = []
+
+    with engine.connect() as connection:
+
+        null_rows = connection.execute(s.sql.text(f'SELECT COUNT(*) FROM augur_data."{table}" WHERE repo_id IS NULL')).scalar()
+        if null_rows:
+            problems.append(f"{null_rows} rows of {table} have no repo_id, they would only be kept in {suffixed_name(table, UNPARTITIONED_SUFFIX)}")
+
+        for foreign_key in _get_referencing_foreign_keys(connection, table):
+
+            if not foreign_key.has_repo_id:
+                problems.append(f"Foreign key {foreign_key.referencing_table}.{foreign_key.conname} would be dropped, since its table has no repo_id")
+                continue
+
+            unmatched_rows = connection.execute(s.sql.text(f"""
+                SELECT COUNT(*) FROM {foreign_key.referencing_table}
+                WHERE "{foreign_key.column_name}" IS NOT NULL AND repo_id IS NULL
+            """)).scalar()
+            if unmatched_rows:
+                problems.append(f"{unmatched_rows} rows of {foreign_key.referencing_table} set {foreign_key.column_name} but no repo_id, "
+                                f"foreign key {foreign_key.conname} could only check new rows")
+
+    return problems
+
+
+def swap_tables(engine, table: str, force: bool = False) -> Dict[str, List[str]]:
+    """Replace a table with its partitioned copy
+
+    The rows have to be copied with copy_rows after the mirror trigger was installed, the swap only holds
+    an exclusive lock on the table while the tables are renamed. Postgres can't reference a partitioned table
+    by its primary key alone, so the foreign keys of tables with a repo_id column are replaced with foreign keys
+    on the primary key and repo_id. They are validated after the swap, a foreign key whose existing rows don't
+    match is kept without the validation and only checks new rows. The other foreign keys are dropped.
+
+    Args:
+        engine: database engine
+        table: table to swap, one of PARTITIONED_TABLES
+        force: swap even if get_swap_problems finds rows without a repo_id, or foreign keys that would be dropped or not validated
+
+    Returns:
+        dict with the names of the replaced, the not validated and the dropped foreign keys
+
+    Raises:
+        PartitioningError: if the partitioned copy doesn't exist, or the swap would lose something and isn't forced
+    """
+
+    # the rows are counted before the table is locked, so the lock isn't held while they are scanned
+    problems = get_swap_problems(engine, table)
+    if problems and not force:
+        raise PartitioningError(f"Not swapping {table}, since:\n" + "\n".join(problems) + "\nFix them or force the swap")
+
+    primary_key = PARTITIONED_TABLES[table]
+    partitioned_table = suffixed_name(table, PARTITIONED_SUFFIX)
+    unpartitioned_table = suffixed_name(table, UNPARTITIONED_SUFFIX)
+
+    with engine.begin() as connection:
+
+        _check_partitioned_copy(connection, table)
+
+        connection.execute(s.sql.text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+        connection.execute(s.sql.text(f'LOCK TABLE augur_data."{table}" IN ACCESS EXCLUSIVE MODE'))
+
+        connection.execute(s.sql.text(f'DROP TRIGGER IF EXISTS "{get_trigger_name(table)}" ON augur_data."{table}"'))
+
+        foreign_keys = _get_referencing_foreign_keys(connection, table)
+
+        # a foreign key that was added since the rows were counted is checked again while the table is locked
+        if not force and any(not foreign_key.has_repo_id for foreign_key in foreign_keys):
+            raise PartitioningError(f"Not swapping {table}, since a foreign key without a repo_id was added to a table that references it")
+
+        for foreign_key in foreign_keys:
+            connection.execute(s.sql.text(f'ALTER TABLE {foreign_key.referencing_table} DROP CONSTRAINT "{foreign_key.conname}"'))
+
+        _rename_constraints_and_indexes(connection, table, lambda name: suffixed_name(name, UNPARTITIONED_SUFFIX))
+        connection.execute(s.sql.text(f'ALTER TABLE augur_data."{table}" RENAME TO "{unpartitioned_table}"'))
+
+        connection.execute(s.sql.text(f'ALTER TABLE augur_data."{partitioned_table}" RENAME TO "{table}"'))
+        _rename_constraints_and_indexes(connection, table, lambda name: unsuffixed_name(name, PARTITIONED_SUFFIX))
+
+        # the existing rows are validated after the swap, so the exclusive lock isn't held while they are scanned
+        for foreign_key in foreign_keys:
+
+            if not foreign_key.has_repo_id:
+                logger.info(f"Dropped foreign key {foreign_key.conname} of {foreign_key.referencing_table} that references {table}, since it has no repo_id column")
+                continue
+
+            definition = repo_foreign_key_definition(foreign_key.column_name, table, primary_key, foreign_key.options)
+            connection.execute(s.sql.text(f'ALTER TABLE {foreign_key.referencing_table} ADD CONSTRAINT "{foreign_key.conname}" {definition}'))
+
+        sequence = connection.execute(s.sql.text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                      table=f'augur_data."{unpartitioned_table}"', column=primary_key).scalar()
+        if sequence:
+            connection.execute(s.sql.text(f'ALTER SEQUENCE {sequence} OWNED BY augur_data."{table}"."{primary_key}"'))
+
+    replaced = []
+    not_validated = []
+    for foreign_key in foreign_keys:
+
+        if not foreign_key.has_repo_id:
+            continue
+
+        name = f"{foreign_key.referencing_table}.{foreign_key.conname}"
+
+        try:
+            with engine.begin() as connection:
+                connection.execute(s.sql.text(f'ALTER TABLE {foreign_key.referencing_table} VALIDATE CONSTRAINT "{foreign_key.conname}"'))
+            replaced.append(name)
+        except s.exc.IntegrityError as e:
+            logger.warning(f"Existing rows of {foreign_key.referencing_table} don't match {table} by {foreign_key.column_name} and repo_id, {foreign_key.conname} only checks new rows: {e}")
+            not_validated.append(name)
+
+    return {
+        "replaced_foreign_keys": replaced,
+        "not_validated_foreign_keys": not_validated,
+        "dropped_foreign_keys": [f"{foreign_key.referencing_table}.{foreign_key.conname}" for foreign_key in foreign_keys if not foreign_key.has_repo_id]
+    }
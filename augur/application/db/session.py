@@ -15,7 +15,18 @@ from psycopg2.errors import DeadlockDetected
 from augur.application.config import AugurConfig
 from augur.application.db.models import Platform
 from augur.application.db.engine import EngineConnection
-from augur.tasks.util.worker_util import remove_duplicate_dicts, remove_duplicates_by_uniques
+from augur.tasks.util.redis_stats import increment_stats, get_stats
+from augur.tasks.util.worker_util import remove_duplicate_dicts, remove_duplicates_by_uniques, sort_by_uniques
+
+# rows inserted per transaction when the Database section of the config does not set insert_chunk_size
+DEFAULT_INSERT_CHUNK_SIZE = 1000
+
+# seconds the first retry after a deadlock waits at most, doubled on each further retry up to DEADLOCK_MAX_BACKOFF
+DEADLOCK_BACKOFF = 0.1
+DEADLOCK_MAX_BACKOFF = 5
+
+# redis hash that counts the deadlocks and the seconds slept after them per table
+DEADLOCK_STATS_KEY = "insert_deadlock_stats"
 
 
 def remove_null_characters_from_string(string):
@@ -50,6 +61,18 @@ def remove_null_characters_from_list_of_dicts(data_list, fields):
     return data_list
 
 
+def record_deadlocks(table_name: str, deadlocks: int, sleep_time: float) -> None:
+    """Add the deadlocks of an insert and the time slept after them to the stats of the table in redis"""
+
+    increment_stats(DEADLOCK_STATS_KEY, table_name, {"deadlocks": deadlocks, "sleep": float(sleep_time)})
+
+
+def get_deadlock_stats() -> dict:
+    """Get the number of deadlocks and the seconds slept after them per table"""
+
+    return get_stats(DEADLOCK_STATS_KEY, float_stats=("sleep",))
+
+
 class DatabaseSession(s.orm.Session):
 
     def __init__(self, logger, engine=None):
@@ -58,14 +81,12 @@ class DatabaseSession(s.orm.Session):
         self.config = AugurConfig(logger=logger, session=self)
 
         self.engine = engine
-        self.engine_created = False
 
         if self.engine is None:
-            from augur.application.db.engine import create_database_engine
+            from augur.application.db.engine import get_database_engine
 
-            self.engine_created = True
-
-            self.engine = create_database_engine()
+            # the engine is shared by the process, so closing the session returns its connection to the pool
+            self.engine = get_database_engine()
 
         super().__init__(self.engine)
 
@@ -73,9 +94,6 @@ class DatabaseSession(s.orm.Session):
         return self
 
     def __exit__(self, exception_type, exception_value, exception_traceback):
-
-        if self.engine_created:
-            self.engine.dispose()
         
         self.close()
     
@@ -122,6 +140,26 @@ class DatabaseSession(s.orm.Session):
         if string_fields and isinstance(string_fields, list):
             data = remove_null_characters_from_list_of_dicts(data, string_fields)
 
+        # sorting by the natural keys makes concurrent tasks lock overlapping rows in the same order, 
+        # so they wait for each other instead of deadlocking
+        data = sort_by_uniques(data, natural_keys)
+
+        chunk_size = self.config.get_value("Database", "insert_chunk_size") or DEFAULT_INSERT_CHUNK_SIZE
+
+        return_data = []
+        for i in range(0, len(data), chunk_size):
+
+            # each chunk is its own transaction so the row locks are held briefly. A chunk that can't be
+            # inserted raises, because the chunks before it are already committed
+            return_data.extend(self._insert_chunk(data[i:i + chunk_size], table, natural_keys, return_columns, on_conflict_update))
+
+        if not return_columns:
+            return None
+
+        return return_data
+
+    def _insert_chunk(self, data: List[dict], table, natural_keys: List[str], return_columns: Optional[List[str]], on_conflict_update: bool) -> List[dict]:
+
         # creates list of arguments to tell sqlalchemy what columns to return after the data is inserted
         returning_args = []
         if return_columns:
@@ -158,86 +196,51 @@ class DatabaseSession(s.orm.Session):
 
 
         # print(str(stmnt.compile(dialect=s.dialects.postgresql.dialect())))
-        attempts = 0
-        # creates list from 1 to 10
-        sleep_time_list = list(range(1,11))
-        deadlock_detected = False
-
+        table_name = table.__table__.name
+        deadlocks = 0
+        deadlock_sleep = 0.0
 
-        # if there is no data to return then it executes the insert then returns nothing
-        if not return_columns:
-
-            while attempts < 10:
-                try:
-                    with EngineConnection(self.engine) as connection:
-                        connection.execute(stmnt)
-                        break
-                except s.exc.OperationalError as e:
-                    # print(str(e).split("Process")[1].split(";")[0])
-                    if isinstance(e.orig, DeadlockDetected):
-                        deadlock_detected = True
-                        sleep_time = random.choice(sleep_time_list)
-                        self.logger.debug(f"Deadlock detected on {table.__table__} table...trying again in {round(sleep_time)} seconds: transaction size: {len(data)}")
-                        time.sleep(sleep_time)
-
-                        attempts += 1
-                        continue
-                    
-                    raise e
-
-                except Exception as e:
-                    if(len(data) == 1):
-                        raise e
-                    else:
-                        first_half = data[:len(data)//2]
-                        second_half = data[len(data)//2:]
-
-                        self.insert_data(first_half, natural_keys, return_columns, string_fields, on_conflict_update)
-                        self.insert_data(second_half, natural_keys, return_columns, string_fields, on_conflict_update)
-
-            else:
-                self.logger.error("Unable to insert data in 10 attempts")
-                return None
-
-            if deadlock_detected is True:
-                self.logger.error("Made it through even though Deadlock was detected")
-                    
-            return None
-        
-
-        # othewise it gets the requested return columns and returns them as a list of dicts
-        while attempts < 10:
+        while True:
             try:
                 with EngineConnection(self.engine) as connection:
-                    return_data_tuples = connection.execute(stmnt).fetchall()
+                    return_data_tuples = connection.execute(stmnt).fetchall() if return_columns else []
                     break
             except s.exc.OperationalError as e:
+                # print(str(e).split("Process")[1].split(";")[0])
                 if isinstance(e.orig, DeadlockDetected):
-                    sleep_time = random.choice(sleep_time_list)
-                    self.logger.debug(f"Deadlock detected on {table.__table__} table...trying again in {round(sleep_time)} seconds: transaction size: {len(data)}")
-                    time.sleep(sleep_time)
 
-                    attempts += 1
-                    continue   
+                    if deadlocks == 9:
+                        self.logger.error(f"Unable to insert data in 10 attempts on {table.__table__} table")
+                        record_deadlocks(table_name, deadlocks + 1, deadlock_sleep)
+                        raise e
+
+                    # the rows are locked in key order, so a deadlock is with a writer that does not sort its rows
+                    # and the transaction is retried after a short exponential backoff
+                    sleep_time = random.uniform(0, min(DEADLOCK_BACKOFF * 2 ** deadlocks, DEADLOCK_MAX_BACKOFF))
+                    self.logger.debug(f"Deadlock detected on {table.__table__} table...trying again in {round(sleep_time, 2)} seconds: transaction size: {len(data)}")
+                    time.sleep(sleep_time)
 
+                    deadlocks += 1
+                    deadlock_sleep += sleep_time
+                    continue
+                
                 raise e
 
             except Exception as e:
                 if(len(data) == 1):
                     raise e
-                else:
-                    first_half = data[:len(data)//2]
-                    second_half = data[len(data)//2:]
 
-                    self.insert_data(first_half, natural_keys, return_columns, string_fields, on_conflict_update)
-                    self.insert_data(second_half, natural_keys, return_columns, string_fields, on_conflict_update)
+                first_half = self._insert_chunk(data[:len(data)//2], table, natural_keys, return_columns, on_conflict_update)
+                second_half = self._insert_chunk(data[len(data)//2:], table, natural_keys, return_columns, on_conflict_update)
 
-        else:
-            self.logger.error("Unable to insert and return data in 10 attempts")
-            return None
+                return first_half + second_half
 
-        if deadlock_detected is True:
-            self.logger.error("Made it through even though Deadlock was detected")
+        if deadlocks:
+            self.logger.warning(f"Made it through {deadlocks} deadlocks on {table.__table__} table after sleeping {round(deadlock_sleep, 2)} seconds")
+            record_deadlocks(table_name, deadlocks, deadlock_sleep)
+
+        if not return_columns:
+            return []
 
         return_data = []
         for data_tuple in return_data_tuples:
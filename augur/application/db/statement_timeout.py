@@ -0,0 +1,124 @@
+"""Applies the statement_timeout budget of the current query context to the connections of the shared engines.
+
+The api routes run in a query context with the budget of their route or metric (see Server.get_statement_timeout),
+which is set on each connection when it is checked out, so a slow query is cancelled by postgres instead of
+holding a connection and a worker. Statements that are cancelled because of a budget are raised as a
+RetryableError, which the api answers with a 503 and a Retry-After header, and they are counted per route
+in the redis hash statement_timeouts, so the routes that exceed their budget can be fixed or precomputed.
+Connections checked out without a budget, like the ones of the celery tasks, use the server default.
+"""
+import json
+import os
+import logging
+
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from augur.application.db.instrumentation import get_current_query_context, UNATTRIBUTED, SLOW_QUERY_LOGGER, MAX_LOGGED_STATEMENT_LENGTH
+from augur.tasks.util.retry import RetryableError, STATEMENT_TIMEOUT
+from augur.tasks.util.redis_stats import increment_stats, get_stats
+
+
+STATEMENT_TIMEOUT_STATS_KEY = "statement_timeouts"
+
+# sqlstate of the statements postgres cancelled
+QUERY_CANCELED = "57014"
+
+# seconds a client should wait before repeating a request whose statement exceeded its budget
+STATEMENT_TIMEOUT_RETRY_AFTER = 60
+
+slow_query_logger = logging.getLogger(SLOW_QUERY_LOGGER)
+
+
+def apply_statement_timeouts(engine) -> None:
+    """Set the budget of the current query context on the connections of the engine when they are checked out
+
+    Note:
+        The listener has to be added after the ones that replace connections on
+            checkout, so it doesn't run statements on a connection that is discarded
+    """
+
+    @event.listens_for(engine, "checkout")
+    def set_statement_timeout(dbapi_connection, connection_record, connection_proxy):
+
+        context = get_current_query_context()
+        statement_timeout = context.statement_timeout if context is not None else None
+
+        set_connection_statement_timeout(dbapi_connection, connection_record.info, statement_timeout)
+
+    @event.listens_for(engine, "handle_error", retval=True)
+    def raise_statement_timeout(exception_context):
+
+        context = get_current_query_context()
+        if context is None or not context.statement_timeout or not is_query_canceled(exception_context.original_exception):
+            return None
+
+        record_statement_timeout(context.name, context.statement_timeout, exception_context.statement)
+
+        return RetryableError(f"The request was cancelled because its query took longer than {context.statement_timeout} ms",
+                              STATEMENT_TIMEOUT_RETRY_AFTER, STATEMENT_TIMEOUT)
+
+
+def set_connection_statement_timeout(dbapi_connection, info: dict, statement_timeout: Optional[int]) -> None:
+    """Set the statement_timeout of a connection, unless it is already set to it
+
+    Args:
+        dbapi_connection: psycopg2 connection
+        info: info dict of the connection record, which remembers the statement_timeout of the connection
+        statement_timeout: milliseconds after which statements are cancelled, None or 0 for the server default
+    """
+
+    statement_timeout = int(statement_timeout) if statement_timeout else None
+
+    if info.get("statement_timeout") == statement_timeout:
+        return
+
+    # set outside of a transaction, so a rollback doesn't undo it
+    existing_autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    cursor = dbapi_connection.cursor()
+    if statement_timeout is None:
+        cursor.execute("SET SESSION statement_timeout TO DEFAULT")
+    else:
+        cursor.execute(f"SET SESSION statement_timeout = {statement_timeout}")
+    cursor.close()
+    dbapi_connection.autocommit = existing_autocommit
+
+    info["statement_timeout"] = statement_timeout
+
+
+def is_query_canceled(error: BaseException) -> bool:
+    """Whether a dbapi error is a statement postgres cancelled"""
+
+    return getattr(error, "pgcode", None) == QUERY_CANCELED
+
+
+def record_statement_timeout(name: str, statement_timeout: int, statement: Optional[str]) -> None:
+    """Log a statement that was cancelled because it exceeded its budget and count it in redis
+
+    Args:
+        name: name of the query context, like route:<rule>
+        statement_timeout: budget of the context in milliseconds
+        statement: the cancelled statement
+    """
+
+    slow_query_logger.warning(json.dumps({
+        "cancelled": True,
+        "statement_timeout": statement_timeout,
+        "context": name or UNATTRIBUTED,
+        "pid": os.getpid(),
+        "statement": " ".join((statement or "").split())[:MAX_LOGGED_STATEMENT_LENGTH]
+    }))
+
+    increment_stats(STATEMENT_TIMEOUT_STATS_KEY, name or UNATTRIBUTED, {"timeouts": 1})
+
+
+def get_statement_timeout_stats() -> Dict[str, int]:
+    """Get the number of statements that were cancelled per route across all api workers
+
+    Returns:
+        dict that maps route:<rule> to the number of cancelled statements
+    """
+
+    return {name: stats["timeouts"] for name, stats in get_stats(STATEMENT_TIMEOUT_STATS_KEY).items()}
@@ -1,25 +1,32 @@
 from sqlalchemy.exc import OperationalError
-import time
 
+from augur.tasks.util.retry import RetryableError, DATABASE_UNAVAILABLE
+
+# seconds a task waits before it is retried when the database can't be reached
+DATABASE_RETRY_COUNTDOWN = 240
 
 
 def catch_operational_error(func):
+    """Call func, retrying it once if the database connection fails
+
+    The second attempt gets a new connection from the pool, so a connection that was dropped is 
+    replaced without waiting. If the database still can't be reached a RetryableError is raised 
+    rather than sleeping, so a celery task is queued again instead of blocking its worker.
+
+    Raises:
+        RetryableError: if both attempts fail
+    """
 
     attempts = 0
-    while attempts < 4:
+    while True:
 
-        # do the sleep here instead of instead of in the exception 
-        # so it doesn't sleep after the last failed time
-        if attempts > 0:
-            time.sleep(240)
         try:
             return func()
-        except OperationalError:
-            pass
-
-        attempts += 1
+        except OperationalError as e:
 
-    raise Exception("Unable to Resolve Operational Error")
+            attempts += 1
+            if attempts == 2:
+                raise RetryableError(f"Unable to Resolve Operational Error: {e}", DATABASE_RETRY_COUNTDOWN, DATABASE_UNAVAILABLE) from e
 
 
 def execute_session_query(query, query_type="all"):
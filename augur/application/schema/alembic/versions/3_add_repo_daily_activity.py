@@ -0,0 +1,96 @@
+"""Add repo daily activity rollup table
+
+Revision ID: 3
+Revises: 2
+Create Date: 2023-01-16 10:12:44.311047
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision = '3'
+down_revision = '2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+
+    add_repo_daily_activity_table_1()
+
+def downgrade():
+
+    upgrade=False
+
+    add_repo_daily_activity_table_1(upgrade)
+
+def add_repo_daily_activity_table_1(upgrade=True):
+
+    if upgrade:
+
+        op.create_table('repo_daily_activity',
+        sa.Column('repo_id', sa.BigInteger(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('issues_opened', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('issues_closed', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('issue_events', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('pull_requests_opened', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('commits', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('lines_added', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('lines_removed', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('data_collection_date', postgresql.TIMESTAMP(precision=0), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['repo_id'], ['augur_data.repo.repo_id'], ondelete='CASCADE', onupdate='CASCADE'),
+        sa.PrimaryKeyConstraint('repo_id', 'day'),
+        schema='augur_data',
+        comment='Daily counts of the issues, issue events, pull requests and commits of each repo. Collection recomputes the days of a repo whose counts it changed, so timeseries metrics can aggregate days instead of scanning the raw tables.'
+        )
+
+        # backfill the counts of the data that was collected before the table existed
+        conn = op.get_bind()
+        conn.execute(text("""
+        INSERT INTO augur_data.repo_daily_activity (repo_id, day, issues_opened)
+            SELECT repo_id, created_at::DATE AS day, COUNT(*)
+            FROM augur_data.issues
+            WHERE pull_request IS NULL AND created_at IS NOT NULL
+            GROUP BY repo_id, day
+        ON CONFLICT (repo_id, day) DO UPDATE SET issues_opened = EXCLUDED.issues_opened;
+
+        INSERT INTO augur_data.repo_daily_activity (repo_id, day, issues_closed)
+            SELECT repo_id, closed_at::DATE AS day, COUNT(*)
+            FROM augur_data.issues
+            WHERE pull_request IS NULL AND closed_at IS NOT NULL
+            GROUP BY repo_id, day
+        ON CONFLICT (repo_id, day) DO UPDATE SET issues_closed = EXCLUDED.issues_closed;
+
+        INSERT INTO augur_data.repo_daily_activity (repo_id, day, issue_events)
+            SELECT issues.repo_id, issue_events.created_at::DATE AS day, COUNT(*)
+            FROM augur_data.issue_events JOIN augur_data.issues ON issues.issue_id = issue_events.issue_id
+            WHERE issues.pull_request IS NULL AND issue_events.created_at IS NOT NULL
+            GROUP BY issues.repo_id, day
+        ON CONFLICT (repo_id, day) DO UPDATE SET issue_events = EXCLUDED.issue_events;
+
+        INSERT INTO augur_data.repo_daily_activity (repo_id, day, pull_requests_opened)
+            SELECT repo_id, pr_created_at::DATE AS day, COUNT(*)
+            FROM augur_data.pull_requests
+            WHERE pr_created_at IS NOT NULL
+            GROUP BY repo_id, day
+        ON CONFLICT (repo_id, day) DO UPDATE SET pull_requests_opened = EXCLUDED.pull_requests_opened;
+
+        INSERT INTO augur_data.repo_daily_activity (repo_id, day, commits, lines_added, lines_removed)
+            SELECT repo_id, cmt_author_date::DATE AS day, COUNT(DISTINCT cmt_commit_hash),
+                COALESCE(SUM(cmt_added), 0), COALESCE(SUM(cmt_removed), 0)
+            FROM augur_data.commits
+            GROUP BY repo_id, day
+        ON CONFLICT (repo_id, day) DO UPDATE SET
+            commits = EXCLUDED.commits,
+            lines_added = EXCLUDED.lines_added,
+            lines_removed = EXCLUDED.lines_removed;
+        """))
+
+    else:
+
+        op.drop_table('repo_daily_activity', schema='augur_data')
@@ -0,0 +1,251 @@
+"""Add repo_id hash partitioned copies of the commits, message, issue_events and pull_request_events tables
+
+Revision ID: 4
+Revises: 3
+Create Date: 2023-02-06 09:31:18.520734
+
+The partitioned copies are created empty next to the existing tables. The data is moved into them
+online by `augur db partition-tables`, which also swaps them in place of the existing tables.
+The unique constraints and indexes of the existing tables are replaced with the repo_id prefixed ones of
+the copies, so the tables enforce the same keys before and after the swap.
+The downgrade restores the unique keys without repo_id and removes the copies, it can't undo a swap.
+
+"""
+from alembic import op
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision = '4'
+down_revision = '3'
+branch_labels = None
+depends_on = None
+
+PARTITION_COUNT = 16
+
+# primary key column, unique constraints and unique indexes of each table, they all include repo_id
+# because postgres only allows unique indexes on partitioned tables that contain the partition key.
+# Without repo_id they are the unique keys the existing tables had before this migration
+PARTITIONED_TABLES = {
+    "commits": {
+        "primary_key": "cmt_id",
+        "unique_constraints": {},
+        "unique_indexes": {}
+    },
+    "message": {
+        "primary_key": "msg_id",
+        "unique_constraints": {
+            "message-insert-unique": ["repo_id", "platform_msg_id"]
+        },
+        "unique_indexes": {
+            "messagegrouper": ["msg_id", "rgls_id", "repo_id"]
+        }
+    },
+    "issue_events": {
+        "primary_key": "event_id",
+        "unique_constraints": {
+            "unique_event_id_key": ["repo_id", "issue_id", "issue_event_src_id"]
+        },
+        "unique_indexes": {}
+    },
+    "pull_request_events": {
+        "primary_key": "pr_event_id",
+        "unique_constraints": {
+            "unique-pr-event-id": ["repo_id", "platform_id", "node_id"],
+            "pr-unqiue-event": ["repo_id", "node_id"]
+        },
+        "unique_indexes": {}
+    }
+}
+
+PARTITIONED_SUFFIX = "_partitioned"
+
+# suffix of the indexes that are built next to a unique key of an existing table before they replace it
+REPLACEMENT_SUFFIX = "_new"
+
+# postgres truncates longer identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def upgrade():
+
+    add_partitioned_tables_1()
+
+def downgrade():
+
+    upgrade=False
+
+    add_partitioned_tables_1(upgrade)
+
+def partitioned_name(name):
+
+    return name[:MAX_IDENTIFIER_LENGTH - len(PARTITIONED_SUFFIX)] + PARTITIONED_SUFFIX
+
+def replacement_name(name):
+
+    return name[:MAX_IDENTIFIER_LENGTH - len(REPLACEMENT_SUFFIX)] + REPLACEMENT_SUFFIX
+
+def without_repo_id(columns):
+
+    return [column for column in columns if column != "repo_id"]
+
+def quote_columns(columns):
+
+    return ", ".join(f'"{column}"' for column in columns)
+
+def replace_unique_keys(with_repo_id):
+    """Replace the unique keys of the existing tables with the keys with or without repo_id
+
+    The indexes are built concurrently before they replace the old keys, so collection isn't blocked while they are built
+    """
+
+    with op.get_context().autocommit_block():
+
+        for table, spec in PARTITIONED_TABLES.items():
+
+            for name, columns in spec["unique_constraints"].items():
+                columns = columns if with_repo_id else without_repo_id(columns)
+                op.execute(f"""
+                CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{replacement_name(name)}" ON augur_data."{table}" ({quote_columns(columns)});
+                """)
+                op.execute(f"""
+                ALTER TABLE augur_data."{table}"
+                    DROP CONSTRAINT IF EXISTS "{name}",
+                    ADD CONSTRAINT "{name}" UNIQUE USING INDEX "{replacement_name(name)}";
+                """)
+
+            for name, columns in spec["unique_indexes"].items():
+                columns = columns if with_repo_id else without_repo_id(columns)
+                op.execute(f"""
+                CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{replacement_name(name)}" ON augur_data."{table}" ({quote_columns(columns)});
+                """)
+                op.execute(f"""
+                DROP INDEX CONCURRENTLY IF EXISTS augur_data."{name}";
+                """)
+                op.execute(f"""
+                ALTER INDEX augur_data."{replacement_name(name)}" RENAME TO "{name}";
+                """)
+
+def add_partitioned_tables_1(upgrade=True):
+
+    conn = op.get_bind()
+
+    if upgrade:
+
+        for table, spec in PARTITIONED_TABLES.items():
+
+            partitioned_table = partitioned_name(table)
+
+            conn.execute(text(f"""
+            CREATE TABLE augur_data."{partitioned_table}" (LIKE augur_data."{table}" INCLUDING DEFAULTS INCLUDING COMMENTS)
+                PARTITION BY HASH (repo_id);
+
+            ALTER TABLE augur_data."{partitioned_table}" ALTER COLUMN repo_id SET NOT NULL;
+
+            ALTER TABLE augur_data."{partitioned_table}"
+                ADD CONSTRAINT "{partitioned_name(f'{table}_pkey')}" PRIMARY KEY ("{spec['primary_key']}", repo_id);
+            """))
+
+            for name, columns in spec["unique_constraints"].items():
+                conn.execute(text(f"""
+                ALTER TABLE augur_data."{partitioned_table}"
+                    ADD CONSTRAINT "{partitioned_name(name)}" UNIQUE ({quote_columns(columns)});
+                """))
+
+            for name, columns in spec["unique_indexes"].items():
+                conn.execute(text(f"""
+                CREATE UNIQUE INDEX "{partitioned_name(name)}" ON augur_data."{partitioned_table}" ({quote_columns(columns)});
+                """))
+
+            for remainder in range(PARTITION_COUNT):
+                conn.execute(text(f"""
+                CREATE TABLE augur_data."{table}_p{remainder}" PARTITION OF augur_data."{partitioned_table}"
+                    FOR VALUES WITH (MODULUS {PARTITION_COUNT}, REMAINDER {remainder});
+                """))
+
+            # the foreign keys and plain indexes are copied from the existing table,
+            # since their names differ between databases that were created by different augur versions
+            foreign_keys = conn.execute(text("""
+            SELECT conname, pg_get_constraintdef(oid) AS definition
+            FROM pg_constraint
+            WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+            """), table=f"augur_data.{table}").fetchall()
+
+            for foreign_key in foreign_keys:
+
+                # foreign keys of partitioned tables can't skip the validation
+                definition = foreign_key.definition.replace(" NOT VALID", "")
+
+                conn.execute(text(f"""
+                ALTER TABLE augur_data."{partitioned_table}"
+                    ADD CONSTRAINT "{partitioned_name(foreign_key.conname)}" {definition};
+                """))
+
+            indexes = conn.execute(text("""
+            SELECT index_class.relname AS name, am.amname AS method,
+                ARRAY(
+                    SELECT pg_get_indexdef(pg_index.indexrelid, position, true)
+                    FROM generate_series(1, pg_index.indnkeyatts) AS position
+                ) AS columns
+            FROM pg_index
+                JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+                JOIN pg_am am ON am.oid = index_class.relam
+            WHERE pg_index.indrelid = CAST(:table AS regclass)
+                AND NOT pg_index.indisunique
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+            """), table=f"augur_data.{table}").fetchall()
+
+            for index in indexes:
+                conn.execute(text(f"""
+                CREATE INDEX "{partitioned_name(index.name)}" ON augur_data."{partitioned_table}"
+                    USING {index.method} ({", ".join(index.columns)});
+                """))
+
+        # keeps the partitioned copy in sync with the writes to the existing table while its rows are copied,
+        # the trigger is added by `augur db partition-tables` with the partitioned table and the primary key column as arguments.
+        # A row that is already in the copy is overwritten, since the copy of a chunk can commit an older version of it.
+        # Both tables have the same unique keys, so the copy can only conflict on another key than the primary key
+        # if one statement moves a key from one row to another, which collection doesn't do. Such a write fails
+        # with a unique violation instead of leaving the copy out of sync
+        conn.execute(text("""
+        CREATE OR REPLACE FUNCTION augur_data.mirror_to_partitioned() RETURNS trigger AS $$
+        DECLARE
+            assignments text;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.repo_id IS NOT NULL THEN
+                EXECUTE format('DELETE FROM augur_data.%I WHERE %I = $1 AND repo_id = $2', TG_ARGV[0], TG_ARGV[1])
+                USING CAST(to_jsonb(OLD) ->> TG_ARGV[1] AS BIGINT), OLD.repo_id;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.repo_id IS NOT NULL THEN
+                SELECT string_agg(format('%I = EXCLUDED.%I', attname, attname), ', ' ORDER BY attnum) INTO assignments
+                FROM pg_attribute
+                WHERE attrelid = CAST(format('augur_data.%I', TG_ARGV[0]) AS regclass)
+                    AND attnum > 0 AND NOT attisdropped AND attname NOT IN (TG_ARGV[1], 'repo_id');
+
+                EXECUTE format('INSERT INTO augur_data.%I SELECT ($1).* ON CONFLICT (%I, repo_id) DO UPDATE SET %s',
+                               TG_ARGV[0], TG_ARGV[1], assignments)
+                USING NEW;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """))
+
+        # the repo_id prefixed keys are the conflict targets of insert_data
+        replace_unique_keys(with_repo_id=True)
+
+    else:
+
+        # fails if rows of different repos share a key, the keys without repo_id can't be restored then
+        replace_unique_keys(with_repo_id=False)
+
+        conn.execute(text("""
+        DROP FUNCTION IF EXISTS augur_data.mirror_to_partitioned() CASCADE;
+        """))
+
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(f"""
+            DROP TABLE IF EXISTS augur_data."{partitioned_name(table)}";
+            """))
@@ -0,0 +1,134 @@
+"""Add the indexes the lookups of the collection tasks are missing
+
+Revision ID: 5
+Revises: 4
+Create Date: 2023-02-13 11:02:37.904215
+
+The gaps were found with `augur db check-indexes`. The indexes are created concurrently, so collection
+keeps writing to the tables while they are built. An index that fails to build is left invalid,
+check-indexes reports it and it has to be dropped before the migration is run again.
+
+"""
+from alembic import op
+from sqlalchemy.sql import text
+
+
+# revision identifiers, used by Alembic.
+revision = '5'
+down_revision = '4'
+branch_labels = None
+depends_on = None
+
+LOOKUP_INDEXES = {
+    "pull_requests": {
+        "pull_requests_pr_issue_url": ["pr_issue_url"]
+    },
+    "contributors": {
+        "contributors_gh_user_id": ["gh_user_id"]
+    },
+    "commits": {
+        "committer_email": ["cmt_committer_email"]
+    }
+}
+
+PARTITIONED_SUFFIX = "_partitioned"
+
+# postgres truncates longer identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def upgrade():
+
+    add_lookup_indexes_1()
+
+def downgrade():
+
+    upgrade=False
+
+    add_lookup_indexes_1(upgrade)
+
+def partitioned_name(name):
+
+    return name[:MAX_IDENTIFIER_LENGTH - len(PARTITIONED_SUFFIX)] + PARTITIONED_SUFFIX
+
+def quote_columns(columns):
+
+    return ", ".join(f'"{column}"' for column in columns)
+
+def get_relkind(conn, name):
+
+    return conn.execute(text("""
+    SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)
+    """), name=f"augur_data.{name}").scalar()
+
+def create_index(conn, table, name, columns):
+
+    relkind = get_relkind(conn, table)
+
+    if relkind is None:
+        return
+
+    if relkind != 'p':
+        op.execute(f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON augur_data."{table}" ({quote_columns(columns)});
+        """)
+        return
+
+    # partitioned tables can't be indexed concurrently, so the index is created on the parent alone, where it is invalid
+    # until the index of every partition, which is built concurrently, is attached to it
+    op.execute(f"""
+    CREATE INDEX IF NOT EXISTS "{name}" ON ONLY augur_data."{table}" ({quote_columns(columns)});
+    """)
+
+    partitions = conn.execute(text("""
+    SELECT partition.relname
+    FROM pg_inherits
+        JOIN pg_class partition ON partition.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = to_regclass(:table)
+    """), table=f"augur_data.{table}").fetchall()
+
+    for partition in partitions:
+
+        partition_index = f"{partition.relname}_{name}"[:MAX_IDENTIFIER_LENGTH]
+
+        op.execute(f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" ON augur_data."{partition.relname}" ({quote_columns(columns)});
+        """)
+
+        op.execute(f"""
+        ALTER INDEX augur_data."{name}" ATTACH PARTITION augur_data."{partition_index}";
+        """)
+
+def drop_index(conn, name):
+
+    relkind = get_relkind(conn, name)
+
+    if relkind is None:
+        return
+
+    # the indexes of partitioned tables can't be dropped concurrently, dropping them drops the indexes of their partitions
+    op.execute(f"""
+    DROP INDEX {"" if relkind == 'I' else "CONCURRENTLY "}IF EXISTS augur_data."{name}";
+    """)
+
+def add_lookup_indexes_1(upgrade=True):
+
+    with op.get_context().autocommit_block():
+
+        conn = op.get_bind()
+
+        for table, indexes in LOOKUP_INDEXES.items():
+            for name, columns in indexes.items():
+
+                if upgrade:
+
+                    create_index(conn, table, name, columns)
+
+                    # the partitioned copy of migration 4 gets the index too if it wasn't swapped in yet,
+                    # under the name the swap gives it
+                    create_index(conn, partitioned_name(table), partitioned_name(name), columns)
+
+                else:
+
+                    drop_index(conn, name)
+                    drop_index(conn, partitioned_name(name))
@@ -22,8 +22,9 @@ from collections import Counter
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.application.db.models import Repo, RepoClusterMessage, RepoTopic, TopicWord
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_read_database_engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 
 MODEL_FILE_NAME = "kmeans_repo_messages"
@@ -109,7 +110,7 @@ def clustering_model(repo_git: str) -> None:
             """
     )
     # result = db.execute(delete_points_SQL, repo_id=repo_id, min_date=min_date)
-    msg_df_cur_repo = pd.read_sql(get_messages_for_repo_sql, create_database_engine(), params={"repo_id": repo_id})
+    msg_df_cur_repo = pd.read_sql(get_messages_for_repo_sql, get_read_database_engine(), params={"repo_id": repo_id})
     logger.info(msg_df_cur_repo.head())
     logger.debug(f"Repo message df size: {len(msg_df_cur_repo.index)}")
 
@@ -169,6 +170,9 @@ def clustering_model(repo_git: str) -> None:
         session.add(repo_cluster_messages_obj)
         session.commit()
 
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
     # result = db.execute(repo_cluster_messages_table.insert().values(record))
     logging.info(
         "Primary key inserted into the repo_cluster_messages table: {}".format(repo_cluster_messages_obj.msg_cluster_id))
@@ -298,7 +302,7 @@ def train_model(logger, max_df, min_df, max_features, ngram_range, num_clusters,
         AND prmr.msg_id=m.msg_id
         """
     )
-    msg_df_all = pd.read_sql(get_messages_sql, create_database_engine(), params={})
+    msg_df_all = pd.read_sql(get_messages_sql, get_read_database_engine(), params={})
 
     # select only highly active repos
     logger.debug("Selecting highly active repos")
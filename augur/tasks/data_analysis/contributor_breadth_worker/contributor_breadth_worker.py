@@ -7,7 +7,7 @@ from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.tasks.github.util.github_paginator import GithubPaginator
 from augur.application.db.models import ContributorRepo
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_database_engine
 
 ### This worker scans all the platform users in Augur, and pulls their platform activity 
 ### logs. Those are then used to analyze what repos each is working in (which will include repos not
@@ -43,7 +43,7 @@ def contributor_breadth_model() -> None:
         WHERE gh_login IS NOT NULL
     """)
 
-    current_cntrb_logins = json.loads(pd.read_sql(cntrb_login_query, create_database_engine(), params={}).to_json(orient="records"))
+    current_cntrb_logins = json.loads(pd.read_sql(cntrb_login_query, get_database_engine(), params={}).to_json(orient="records"))
 
     ## We need a list of all contributors so we can iterate through them to gather events
     ## We need a list of event ids to avoid insertion of duplicate events. We ignore the event
@@ -84,7 +84,7 @@ def contributor_breadth_model() -> None:
         WHERE 1 = 1
     """)
 
-    current_event_ids = json.loads(pd.read_sql(dup_query, create_database_engine(), params={}).to_json(orient="records"))
+    current_event_ids = json.loads(pd.read_sql(dup_query, get_database_engine(), params={}).to_json(orient="records"))
 
     #Convert list of dictionaries to regular list of 'event_ids'.
     #The only values that the sql query returns are event_ids so
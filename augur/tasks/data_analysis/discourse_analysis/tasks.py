@@ -9,8 +9,9 @@ from collections import Counter
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.application.db.models import Repo, DiscourseInsight
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_read_database_engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 #import os, sys, time, requests, json
 # from sklearn.model_selection import train_test_split
@@ -64,7 +65,7 @@ def discourse_analysis_model(repo_git: str) -> None:
             """)
 
     # result = db.execute(delete_points_SQL, repo_id=repo_id, min_date=min_date)
-    msg_df_cur_repo = pd.read_sql(get_messages_for_repo_sql, create_database_engine(), params={"repo_id": repo_id})
+    msg_df_cur_repo = pd.read_sql(get_messages_for_repo_sql, get_read_database_engine(), params={"repo_id": repo_id})
     msg_df_cur_repo = msg_df_cur_repo.sort_values(by=['thread_id']).reset_index(drop=True)
     logger.info(msg_df_cur_repo.head())
 
@@ -100,6 +101,9 @@ def discourse_analysis_model(repo_git: str) -> None:
             logging.info(
                 "Primary key inserted into the discourse_insights table: {}".format(discourse_insight_object.msg_discourse_id))
 
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
     logger.info("prediction: " + str(y_pred_git_flat))
 
 
@@ -16,12 +16,13 @@ import warnings
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.application.db.models import Repo, ChaossMetricStatus, RepoInsight, RepoInsightsRecord
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_database_engine, get_read_database_engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 warnings.filterwarnings('ignore')
 
-engine = create_database_engine()
+engine = get_database_engine()
 
 @celery.task
 def insight_model(repo_git: str) -> None:
@@ -302,6 +303,11 @@ def insight_model(repo_git: str) -> None:
                 logger.info("error occurred while storing datapoint: {}\n".format(repr(e)))
                 break
 
+    with DatabaseSession(logger) as session:
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
 def confidence_interval_insights(logger):
     """ Anomaly detection method based on confidence intervals
     """
@@ -321,7 +327,7 @@ def confidence_interval_insights(logger):
     # endpointSQL = s.sql.text("""
     #     SELECT * FROM chaoss_metric_status WHERE cm_source = 'augur_db'
     #     """)
-    # for endpoint in pd.read_sql(endpointSQL, create_database_engine(), params={}).to_records():
+    # for endpoint in pd.read_sql(endpointSQL, get_read_database_engine(), params={}).to_records():
     #     endpoints.append(endpoint)
 
     """"""
@@ -523,7 +529,7 @@ def send_insight(insight, units_from_mean, logger):
             WHERE repo_id = {}
         """.format(insight['repo_id']))
 
-        repo = pd.read_sql(repoSQL, create_database_engine(), params={}).iloc[0]
+        repo = pd.read_sql(repoSQL, get_read_database_engine(), params={}).iloc[0]
 
         begin_date = datetime.datetime.now() - datetime.timedelta(days=anomaly_days)
         dict_date = insight['ri_date'].strftime("%Y-%m-%d %H:%M:%S")
@@ -561,11 +567,8 @@ def clear_insights(repo_id, new_endpoint, new_field, logger):
                 AND ri_field = '{}'
     """.format(repo_id, new_endpoint, new_field)
     try:
-        engine = create_database_engine()
         result = engine.execute(deleteSQL)
-        engine.dispose()
     except Exception as e:
-        engine.dispose()
         logger.info("Error occured deleting insight slot: {}".format(e))
 
     # Delete all insights
@@ -581,11 +584,8 @@ def clear_insights(repo_id, new_endpoint, new_field, logger):
                 AND ri_field = '{}'
     """.format(repo_id, new_endpoint, new_field)
     try:
-        engine = create_database_engine()
         result = engine.execute(deleteSQL)
-        engine.dispose()
     except Exception as e:
-        engine.dispose()
         logger.info("Error occured deleting insight slot: {}".format(e))
 
 def clear_insight(repo_id, new_score, new_metric, new_field, logger):
@@ -604,7 +604,7 @@ def clear_insight(repo_id, new_score, new_metric, new_field, logger):
         AND ri_field = '{}'
         ORDER BY ri_score DESC
     """.format(repo_id, new_metric, new_field))
-    rec = json.loads(pd.read_sql(recordSQL, create_database_engine(), params={}).to_json(orient='records'))
+    rec = json.loads(pd.read_sql(recordSQL, get_read_database_engine(), params={}).to_json(orient='records'))
     logger.info("recordsql: {}, \n{}".format(recordSQL, rec))
     # If new score is higher, continue with deletion
     if len(rec) > 0:
@@ -625,11 +625,8 @@ def clear_insight(repo_id, new_score, new_metric, new_field, logger):
                             AND ri_field = '{}'
                 """.format(record['repo_id'], record['ri_metric'], record['ri_field'])
                 try:
-                    engine = create_database_engine()
-                    result = engineexecute(deleteSQL)
-                    engine.dispose()
+                    result = engine.execute(deleteSQL)
                 except Exception as e:
-                    engine.dispose()
                     logger.info("Error occured deleting insight slot: {}".format(e))
     else:
         insertion_directions['record'] = True
@@ -642,7 +639,7 @@ def clear_insight(repo_id, new_score, new_metric, new_field, logger):
         WHERE repo_id = {}
         ORDER BY ri_score ASC
     """.format(repo_id))
-    ins = json.loads(pd.read_sql(insightSQL, create_database_engine(), params={}).to_json(orient='records'))
+    ins = json.loads(pd.read_sql(insightSQL, get_read_database_engine(), params={}).to_json(orient='records'))
     logger.info("This repos insights: {}".format(ins))
 
     # Determine if inisghts need to be deleted based on if there are more insights than we want stored,
@@ -680,11 +677,8 @@ def clear_insight(repo_id, new_score, new_metric, new_field, logger):
                     AND ri_metric = '{}'
         """.format(insight['repo_id'], insight['ri_metric'])
         try:
-            engine = create_database_engine()
             result = engine.execute(deleteSQL)
-            engine.dispose()
         except Exception as e:
-            engine.dispose()
             logger.info("Error occured deleting insight slot: {}".format(e))
 
     return insertion_directions
@@ -752,7 +746,7 @@ def filter_duplicates(cols, tables, og_data, logger):
         colSQL = s.sql.text("""
             SELECT {} FROM {}
             """.format(col, table_str))
-        values = pd.read_sql(colSQL, create_database_engine(), params={})
+        values = pd.read_sql(colSQL, get_read_database_engine(), params={})
 
         for obj in og_data:
             if values.isin([obj[cols[col]]]).any().any():
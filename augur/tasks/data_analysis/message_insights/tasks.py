@@ -14,8 +14,9 @@ from augur.tasks.data_analysis.message_insights.message_sentiment import get_sen
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.application.db.models import Repo, MessageAnalysis, MessageAnalysisSummary
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_database_engine, get_read_database_engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 #SPDX-License-Identifier: MIT
 
@@ -50,7 +51,7 @@ def message_insight_model(repo_git: str) -> None:
     repo_exists_SQL = s.sql.text("""
         SELECT exists (SELECT 1 FROM augur_data.message_analysis_summary WHERE repo_id = :repo_id LIMIT 1)""")
 
-    df_rep = pd.read_sql_query(repo_exists_SQL, create_database_engine(), params={'repo_id': repo_id})
+    df_rep = pd.read_sql_query(repo_exists_SQL, get_read_database_engine(), params={'repo_id': repo_id})
     #full_train = not(df_rep['exists'].iloc[0])
     logger.info(f'Full Train: {full_train}')
 
@@ -75,7 +76,7 @@ def message_insight_model(repo_git: str) -> None:
             where message.repo_id = :repo_id
             """)
 
-        df_past = pd.read_sql_query(past_SQL, create_database_engine(), params={'repo_id': repo_id})
+        df_past = pd.read_sql_query(past_SQL, get_read_database_engine(), params={'repo_id': repo_id})
         df_past['msg_timestamp'] = pd.to_datetime(df_past['msg_timestamp'])
         df_past = df_past.sort_values(by='msg_timestamp')
         logger.debug(f'{df_past} is df_past')
@@ -114,7 +115,7 @@ def message_insight_model(repo_git: str) -> None:
             left outer join augur_data.issues on issue_message_ref.issue_id = issues.issue_id
             where message.repo_id = :repo_id""")
 
-    df_message = pd.read_sql_query(join_SQL, create_database_engine(), params={'repo_id': repo_id, 'begin_date': begin_date})
+    df_message = pd.read_sql_query(join_SQL, get_read_database_engine(), params={'repo_id': repo_id, 'begin_date': begin_date})
 
     logger.info(f'Messages dataframe dim: {df_message.shape}')
     logger.info(f'Value 1: {df_message.shape[0]}')
@@ -149,7 +150,7 @@ def message_insight_model(repo_git: str) -> None:
             left outer join augur_data.issues on issue_message_ref.issue_id = issues.issue_id
             where issue_message_ref.repo_id = :repo_id""")
 
-            df_past = pd.read_sql_query(merge_SQL, create_database_engine(), params={'repo_id': repo_id})
+            df_past = pd.read_sql_query(merge_SQL, get_read_database_engine(), params={'repo_id': repo_id})
             df_past = df_past.loc[df_past['novelty_flag'] == 0]
             rec_errors = df_past['reconstruction_error'].tolist()
             threshold = threshold_otsu(np.array(rec_errors))
@@ -201,7 +202,7 @@ def message_insight_model(repo_git: str) -> None:
                     session.add(message_analysis_object)
                     session.commit()
 
-                    # result = create_database_engine().execute(message_analysis_table.insert().values(msg))
+                    # result = get_database_engine().execute(message_analysis_table.insert().values(msg))
                     logger.info(
                         f'Primary key inserted into the message_analysis table: {message_analysis_object.msg_analysis_id}')
                     # logger.info(
@@ -210,6 +211,9 @@ def message_insight_model(repo_git: str) -> None:
                     logger.error(f'Error occurred while storing datapoint {repr(e)}')
                     break
 
+            # let the api caches know this repo has new data
+            bump_repo_data_version(session, repo_id)
+
         logger.info('Data insertion completed\n')
 
         df_trend = df_message.copy()
@@ -325,7 +329,7 @@ def message_insight_model(repo_git: str) -> None:
             session.add(message_analysis_summary_object)
             session.commit()
 
-            # result = create_database_engine().execute(message_analysis_summary_table.insert().values(msg))
+            # result = get_database_engine().execute(message_analysis_summary_table.insert().values(msg))
             logger.info(
                 f'Primary key inserted into the message_analysis_summary table: {message_analysis_summary_object.msg_summary_id}')
             # logger.info(f'Inserted data point {results_counter} for insight_period {row.Index}')
@@ -337,7 +341,7 @@ def message_insight_model(repo_git: str) -> None:
                                  FROM message_analysis_summary 
                                  WHERE repo_id=:repo_id""")
 
-        df_past = pd.read_sql_query(message_analysis_query, create_database_engine(), params={'repo_id': repo_id})
+        df_past = pd.read_sql_query(message_analysis_query, get_read_database_engine(), params={'repo_id': repo_id})
 
         # df_past = get_table_values(cols=['period', 'positive_ratio', 'negative_ratio', 'novel_count'],
         #                                 tables=['message_analysis_summary'],
@@ -406,7 +410,7 @@ def send_insight(repo_id, insights, logger):
             WHERE repo_id = {}
         """.format(repo_id))
 
-        repo = pd.read_sql(repoSQL, create_database_engine(), params={}).iloc[0]
+        repo = pd.read_sql(repoSQL, get_read_database_engine(), params={}).iloc[0]
         to_send = {
             'message_insight': True,
             'repo_git': repo['repo_git'],
@@ -440,7 +444,7 @@ def get_max_id(table, column, logger, default=25150):
         SELECT max({0}.{1}) AS {1}
         FROM {0}
     """.format(table, column))
-    db = create_database_engine()
+    db = get_database_engine()
     rs = pd.read_sql(max_id_sql, db, params={})
     if rs.iloc[0][column] is not None:
         max_id = int(rs.iloc[0][column]) + 1
@@ -450,6 +454,4 @@ def get_max_id(table, column, logger, default=25150):
         logger.warning("Could not find max id for {} column in the {} table... " +
             "using default set to: {}\n".format(column, table, max_id))
 
-    db.dispose()
-
     return max_id
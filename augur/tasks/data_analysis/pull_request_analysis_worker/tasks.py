@@ -11,8 +11,9 @@ from augur.tasks.data_analysis.message_insights.message_sentiment import get_sen
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.session import DatabaseSession
 from augur.application.db.models import Repo, PullRequestAnalysis
-from augur.application.db.engine import create_database_engine
+from augur.application.db.engine import get_read_database_engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 # from sklearn.metrics import (confusion_matrix, f1_score, precision_score, recall_score)
 # from sklearn.preprocessing import LabelEncoder, MinMaxScaler
@@ -62,7 +63,7 @@ def pull_request_analysis_model(repo_git: str) -> None:
         and pr_src_state like 'open' 
     """)
 
-    df_pr = pd.read_sql_query(pr_SQL, create_database_engine(), params={'begin_date': begin_date, 'repo_id': repo_id})
+    df_pr = pd.read_sql_query(pr_SQL, get_read_database_engine(), params={'begin_date': begin_date, 'repo_id': repo_id})
 
     logger.info(f'PR Dataframe dim: {df_pr.shape}\n')
 
@@ -94,13 +95,13 @@ def pull_request_analysis_model(repo_git: str) -> None:
             left outer join augur_data.issue_message_ref on message.msg_id = issue_message_ref.msg_id 
             left outer join augur_data.issues on issue_message_ref.issue_id = issues.issue_id where issue_message_ref.repo_id = :repo_id""")
 
-    df_message = pd.read_sql_query(messages_SQL, create_database_engine(), params={'repo_id': repo_id})
+    df_message = pd.read_sql_query(messages_SQL, get_read_database_engine(), params={'repo_id': repo_id})
 
     logger.info(f'Mapping messages to PR, find comment & participants counts')
 
     # Map PR to its corresponding messages
     pr_ref_sql = s.sql.text("select * from augur_data.pull_request_message_ref")
-    df_pr_ref = pd.read_sql_query(pr_ref_sql, create_database_engine())
+    df_pr_ref = pd.read_sql_query(pr_ref_sql, get_read_database_engine())
     df_merge = pd.merge(df_pr, df_pr_ref, on='pull_request_id', how='left')
     df_merge = pd.merge(df_merge, df_message, on='msg_id', how='left')
     df_merge = df_merge.dropna(subset=['msg_id'], axis=0)
@@ -137,7 +138,7 @@ def pull_request_analysis_model(repo_git: str) -> None:
     '''
     # Get cntrb info from API
     cntrb_sql = 'SELECT cntrb_id, gh_login FROM augur_data.contributors'
-    df_ctrb = pd.read_sql_query(cntrb_SQL, create_database_engine())
+    df_ctrb = pd.read_sql_query(cntrb_SQL, get_read_database_engine())
     df_fin1 = pd.merge(df_fin,df_ctrb,left_on='pr_augur_contributor_id', right_on='cntrb_id', how='left')
     df_fin1 = df_fin1.drop(['cntrb_id'],axis=1)
     # Dict for persisting user data & fast lookups
@@ -153,7 +154,7 @@ def pull_request_analysis_model(repo_git: str) -> None:
             SELECT repo_id, pull_requests_merged, pull_request_count,watchers_count, last_updated FROM 
             augur_data.repo_info where repo_id = :repo_id
             """)
-    df_repo = pd.read_sql_query(repo_sql, create_database_engine(), params={'repo_id': repo_id})
+    df_repo = pd.read_sql_query(repo_sql, get_read_database_engine(), params={'repo_id': repo_id})
 
     df_repo = df_repo.loc[df_repo.groupby('repo_id').last_updated.idxmax(), :]
     df_repo = df_repo.drop(['last_updated'], axis=1)
@@ -224,6 +225,9 @@ def pull_request_analysis_model(repo_git: str) -> None:
                 logger.error(f'{repr(row.merge_prob)}')
                 break
 
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
     logger.info('Data insertion completed\n')
 
 '''
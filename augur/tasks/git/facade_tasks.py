@@ -28,6 +28,8 @@ from augur.tasks.git.util.facade_worker.facade_worker.facade03analyzecommit impo
 from augur.tasks.github.facade_github.tasks import *
 
 from augur.tasks.util.worker_util import create_grouped_task_load
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
+from augur.tasks.util.repo_daily_activity import get_activity_days, update_repo_daily_activity, COMMITS
 
 from augur.tasks.init.celery_app import celery_app as celery
 
@@ -110,6 +112,9 @@ def trim_commits_facade_task(repo_id):
     except:
         working_commits = []
 
+    # the days the trimmed commits are counted on
+    trimmed_days = get_activity_days(session, repo_id, COMMITS, [commit['working_commit'] for commit in working_commits])
+
     # If there's a commit still there, the previous run was interrupted and
     # the commit data may be incomplete. It should be trimmed, just in case.
     for commit in working_commits:
@@ -122,8 +127,10 @@ def trim_commits_facade_task(repo_id):
         session.execute_sql(remove_commit)
         session.log_activity('Debug',f"Removed working commit: {commit['working_commit']}")
 
+    update_repo_daily_activity(session, repo_id, COMMITS, trimmed_days)
+
 @celery.task
-def trim_commits_post_analysis_facade_task(repo_id,commits):
+def trim_commits_post_analysis_facade_task(repo_id,commits,analyzed_commits=None):
     logger = logging.getLogger(trim_commits_post_analysis_facade_task.__name__)
 
     session = FacadeSession(logger)
@@ -143,6 +150,9 @@ def trim_commits_post_analysis_facade_task(repo_id,commits):
     update_analysis_log(repo_id,'Beginning to trim commits')
 
     session.log_activity('Debug',f"Commits to be trimmed from repo {repo_id}: {len(commits)}")
+
+    # only the days of the trimmed and the analyzed commits are recounted
+    changed_days = get_activity_days(session, repo_id, COMMITS, commits)
     
     for commit in commits:
         trim_commit(session,repo_id,commit)
@@ -156,6 +166,13 @@ def trim_commits_post_analysis_facade_task(repo_id,commits):
 
     update_analysis_log(repo_id,'Complete')
 
+    changed_days |= get_activity_days(session, repo_id, COMMITS, analyzed_commits or [])
+
+    update_repo_daily_activity(session, repo_id, COMMITS, changed_days)
+
+    # analysis of this repo is done, let the api caches know its commits changed
+    bump_repo_data_version(session, repo_id)
+
 @celery.task
 def facade_analysis_end_facade_task():
     logger = logging.getLogger(facade_analysis_end_facade_task.__name__)
@@ -309,7 +326,7 @@ def generate_analysis_sequence(logger):
             # Find commits which are out of the analysis range
 
             trimmed_commits = existing_commits - parent_commits
-            analysis_sequence.append(trim_commits_post_analysis_facade_task.si(repo['repo_id'],list(trimmed_commits)).on_error(facade_error_handler.s()))
+            analysis_sequence.append(trim_commits_post_analysis_facade_task.si(repo['repo_id'],list(trimmed_commits),list(missing_commits)).on_error(facade_error_handler.s()))
         
         analysis_sequence.append(facade_analysis_end_facade_task.si().on_error(facade_error_handler.s()))
     
@@ -7,6 +7,7 @@ from augur.application.db.data_parse import *
 from augur.tasks.github.util.github_paginator import GithubPaginator, hit_api
 from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.util.worker_util import wait_child_tasks
+from augur.tasks.util.retry import RetryableError, SECONDARY_RATE_LIMIT
 from augur.application.db.models import PullRequest, Message, PullRequestReview, PullRequestLabel, PullRequestReviewer, PullRequestEvent, PullRequestMeta, PullRequestAssignee, PullRequestReviewMessageRef, Issue, IssueEvent, IssueLabel, IssueAssignee, PullRequestMessageRef, IssueMessageRef, Contributor, Repo
 from augur.application.db.util import execute_session_query
 
@@ -88,9 +89,9 @@ def retrieve_dict_data(url: str, session):
                 break
 
             elif "You have exceeded a secondary rate limit. Please wait a few minutes before you try again" in page_data['message']:
-                session.logger.info('\n\n\n\nSleeping for 100 seconds due to secondary rate limit issue.\n\n\n\n')
-                time.sleep(100)
-                continue
+                retry_after = int(response.headers.get("Retry-After", 100))
+                session.logger.info(f"Retrying in {retry_after} seconds due to secondary rate limit issue")
+                raise RetryableError(f"Secondary rate limit exceeded on {response.url}", retry_after, SECONDARY_RATE_LIMIT)
 
             elif "You have triggered an abuse detection mechanism." in page_data['message']:
                 #self.update_rate_limit(response, temporarily_disable=True,platform=platform)
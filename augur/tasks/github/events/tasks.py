@@ -10,6 +10,8 @@ from augur.tasks.github.util.util import get_owner_repo
 from augur.tasks.util.worker_util import remove_duplicate_dicts
 from augur.application.db.models import PullRequest, Message, PullRequestReview, PullRequestLabel, PullRequestReviewer, PullRequestEvent, PullRequestMeta, PullRequestAssignee, PullRequestReviewMessageRef, Issue, IssueEvent, IssueLabel, IssueAssignee, PullRequestMessageRef, IssueMessageRef, Contributor, Repo
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
+from augur.tasks.util.repo_daily_activity import get_activity_dates, changed_activity_days, update_repo_daily_activity, ISSUE_EVENTS
 
 platform_id = 1
 
@@ -159,12 +161,18 @@ def process_events(events, task_name, repo_id, logger):
         logger.info(f"{task_name}: Inserting {len(pr_event_dicts)} pr events and {len(issue_event_dicts)} issue events")
 
         # TODO: Could replace this with "id" but it isn't stored on the table for some reason
-        pr_event_natural_keys = ["node_id"]
+        pr_event_natural_keys = ["repo_id", "node_id"]
         session.insert_data(pr_event_dicts, PullRequestEvent, pr_event_natural_keys)
 
-        issue_event_natural_keys = ["issue_id", "issue_event_src_id"]
+        issue_event_natural_keys = ["repo_id", "issue_id", "issue_event_src_id"]
+        issue_event_dates = get_activity_dates(session, repo_id, ISSUE_EVENTS, [event["issue_event_src_id"] for event in issue_event_dicts])
         session.insert_data(issue_event_dicts, IssueEvent, issue_event_natural_keys)
 
+        update_repo_daily_activity(session, repo_id, ISSUE_EVENTS, changed_activity_days(ISSUE_EVENTS, issue_event_dates, issue_event_dicts))
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
 
 # TODO: Should we skip an event if there is no contributor to resolve it o
 def process_github_event_contributors(logger, event, tool_source, tool_version, data_source):
@@ -14,6 +14,7 @@ import traceback
 from augur.application.db.models import *
 from augur.tasks.util.AugurUUID import AugurUUID, GithubUUID, UnresolvableUUID
 from augur.tasks.github.util.github_paginator import GithubPaginator, hit_api, process_dict_response
+from augur.tasks.util.retry import RetryableError
 # Debugger
 import traceback
 from augur.tasks.github.util.github_paginator import GithubApiResult
@@ -59,10 +60,14 @@ def request_dict_from_endpoint(session, url, timeout_wait=10):
             response_data = json.loads(json.dumps(response.text))
 
         if type(response_data) == dict:
-            err = process_dict_response(session.logger,response,response_data)
+            err = process_dict_response(session.logger,response,response_data,session.oauths)
 
             
             #If we get an error message that's not None
+            # the exhausted key was set aside, retrying with another key isn't counted as an attempt
+            if err == GithubApiResult.RATE_LIMIT_EXCEEDED:
+                continue
+
             if err and err != GithubApiResult.SUCCESS:
                 attempts += 1
                 session.logger.info(f"err: {err}")
@@ -86,7 +91,7 @@ def request_dict_from_endpoint(session, url, timeout_wait=10):
                     # Sometimes raw text can be converted to a dict
                     response_data = json.loads(response_data)
 
-                    err = process_dict_response(session.logger,response,response_data)
+                    err = process_dict_response(session.logger,response,response_data,session.oauths)
 
                     #If we get an error message that's not None
                     if err and err != GithubApiResult.SUCCESS:
@@ -94,6 +99,8 @@ def request_dict_from_endpoint(session, url, timeout_wait=10):
                     
                     success = True
                     break
+                except RetryableError:
+                    raise
                 except:
                     pass
         attempts += 1
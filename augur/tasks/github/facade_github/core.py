@@ -9,6 +9,7 @@ import time
 import math
 import traceback
 from augur.tasks.util.AugurUUID import AugurUUID, GithubUUID, UnresolvableUUID
+from augur.tasks.util.retry import RetryableError
 
 
 
@@ -129,6 +130,8 @@ def query_github_contributors(session, entry_info, repo_id):
             #session.logger.info(f"Contributor:  {cntrb}  \n")
             session.insert_data(cntrb,Contributor,cntrb_natural_keys)
             
+        except RetryableError:
+            raise
         except Exception as e:
             session.logger.error("Caught exception: {}".format(e))
             session.logger.error(f"Traceback: {traceback.format_exc()}")
@@ -142,6 +145,8 @@ def grab_committer_list(session, repo_id, platform="github"):
     # Create API endpoint from repo_id
     try:
         endpoint = create_endpoint_from_repo_id(session, repo_id)
+    except RetryableError:
+        raise
     except Exception as e:
         session.logger.info(
             f"Could not create endpoint from repo {repo_id} because of ERROR: {e}")
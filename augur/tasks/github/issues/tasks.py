@@ -15,6 +15,8 @@ from augur.tasks.util.worker_util import remove_duplicate_dicts
 from augur.application.db.models import PullRequest, Message, PullRequestReview, PullRequestLabel, PullRequestReviewer, PullRequestEvent, PullRequestMeta, PullRequestAssignee, PullRequestReviewMessageRef, Issue, IssueEvent, IssueLabel, IssueAssignee, PullRequestMessageRef, IssueMessageRef, Contributor, Repo
 from augur.application.config import get_development_flag
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
+from augur.tasks.util.repo_daily_activity import get_activity_dates, changed_activity_days, update_repo_daily_activity, ISSUES
 development = get_development_flag()
 
 @celery.task
@@ -146,6 +148,9 @@ def process_issues(issues, task_name, repo_id, logger) -> None:
         issue_natural_keys = ["repo_id", "gh_issue_id"]
         issue_return_columns = ["issue_url", "issue_id"]
         issue_string_columns = ["issue_title", "issue_body"]
+
+        # the days the issues are counted on before they are updated, so only the days that change are recomputed
+        issue_dates = get_activity_dates(session, repo_id, ISSUES, [issue["gh_issue_id"] for issue in issue_dicts])
         try:
             issue_return_data = session.insert_data(issue_dicts, Issue, issue_natural_keys, return_columns=issue_return_columns, string_fields=issue_string_columns)
         except IntegrityError as e:
@@ -188,6 +193,11 @@ def process_issues(issues, task_name, repo_id, logger) -> None:
         issue_assignee_natural_keys = ['issue_assignee_src_id', 'issue_id']
         session.insert_data(issue_assignee_dicts, IssueAssignee, issue_assignee_natural_keys)
 
+        update_repo_daily_activity(session, repo_id, ISSUES, changed_activity_days(ISSUES, issue_dates, issue_dicts))
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
 
 
 def process_issue_contributors(issue, tool_source, tool_version, data_source):
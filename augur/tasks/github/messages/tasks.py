@@ -10,6 +10,7 @@ from augur.tasks.util.worker_util import remove_duplicate_dicts
 from augur.tasks.github.util.util import get_owner_repo
 from augur.application.db.models import PullRequest, Message, PullRequestReview, PullRequestLabel, PullRequestReviewer, PullRequestEvent, PullRequestMeta, PullRequestAssignee, PullRequestReviewMessageRef, Issue, IssueEvent, IssueLabel, IssueAssignee, PullRequestMessageRef, IssueMessageRef, Contributor, Repo
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 
 
@@ -171,7 +172,7 @@ def process_messages(messages, task_name, repo_id, logger):
         session.insert_data(contributors, Contributor, ["cntrb_id"])
 
         logger.info(f"{task_name}: Inserting {len(message_dicts)} messages")
-        message_natural_keys = ["platform_msg_id"]
+        message_natural_keys = ["repo_id", "platform_msg_id"]
         message_return_columns = ["msg_id", "platform_msg_id"]
         message_string_fields = ["msg_text"]
         message_return_data = session.insert_data(message_dicts, Message, message_natural_keys, 
@@ -209,6 +210,9 @@ def process_messages(messages, task_name, repo_id, logger):
 
         logger.info(f"{task_name}: Inserted {len(message_dicts)} messages. {len(issue_message_ref_dicts)} from issues and {len(pr_message_ref_dicts)} from prs")
 
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
 
 def is_issue_message(html_url):
 
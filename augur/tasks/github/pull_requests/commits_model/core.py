@@ -7,9 +7,19 @@ from augur.application.db.session import DatabaseSession
 from augur.tasks.init.celery_app import engine
 from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.github.util.github_paginator import GithubPaginator, hit_api
+from augur.tasks.github.util.gh_graphql_entities import GraphQlPageCollection, request_graphql_dict, build_pull_request_batch_query
 from augur.application.db.models import *
 from augur.tasks.github.util.util import get_owner_repo
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.retry import RetryableError
+from augur.tasks.util.task_checkpoints import get_checkpoint, save_checkpoint, clear_checkpoint
+
+# number of pull requests whose first page of commits is requested in one graphql query
+PR_COMMITS_BATCH_SIZE = 25
+# number of pull request commit rows that are written to the database at once
+PR_COMMITS_INSERT_BATCH_SIZE = 10000
+# name the last pull request whose commits were inserted is saved under, so a retried task can resume after it
+PR_COMMITS_CHECKPOINT = "pull_request_commits"
 
 
 def pull_request_commits_model(repo_id,logger):
@@ -63,11 +73,220 @@ def pull_request_commits_model(repo_id,logger):
                 pr_commits_natural_keys = [	"pull_request_id", "repo_id", "pr_cmt_sha"]
                 session.insert_data(all_data,PullRequestCommit,pr_commits_natural_keys)
             
+        except RetryableError:
+            raise
         except Exception as e:
             logger.error(f"Ran into error with pull request #{index + 1} in repo {repo_id}")
             logger.error(
             ''.join(traceback.format_exception(None, e, e.__traceback__)))
 
 
+def pull_request_commits_graphql_model(repo_id,logger,batch_size=PR_COMMITS_BATCH_SIZE,resume=False):
+    """Collects the commits of the pull requests of a repo using aliased graphql queries.
+
+    Closed pull requests that already have commits stored are skipped since their commits can no longer change.
+    The pull requests are collected in order of their number, and the number of the last one whose commits were
+    inserted is saved as a checkpoint. When resume is True the pull requests up to the checkpoint are skipped.
+    """
+
+    # query the PRs that are still open or that we have no commits for yet
+    pr_number_sql = s.sql.text("""
+            SELECT DISTINCT pr_src_number, pull_requests.pull_request_id
+            FROM pull_requests
+            WHERE repo_id = :repo_id
+            AND NOT (
+                pr_src_state = 'closed'
+                AND EXISTS (
+                    SELECT 1 FROM pull_request_commits
+                    WHERE pull_request_commits.pull_request_id = pull_requests.pull_request_id
+                )
+            )
+            ORDER BY pr_src_number
+        """).bindparams(repo_id=repo_id)
+
+    session = GithubTaskSession(logger)
+    pr_numbers = session.fetchall_data_from_sql_text(pr_number_sql)
+
+    query = session.query(Repo).filter(Repo.repo_id == repo_id)
+    repo = execute_session_query(query, 'one')
+
+    owner, name = get_owner_repo(repo.repo_git)
+
+    checkpoint = get_checkpoint(PR_COMMITS_CHECKPOINT, repo_id) if resume else None
+    if checkpoint is not None:
+        logger.info(f"Resuming pull request commits of repo {repo.repo_git} after pull request #{checkpoint}")
+        pr_numbers = [pr_info for pr_info in pr_numbers if pr_info['pr_src_number'] > int(checkpoint)]
+
+    logger.info(f"Getting pull request commits for {len(pr_numbers)} pull requests of repo: {repo.repo_git}")
+
+    all_data = []
+    for start in range(0, len(pr_numbers), batch_size):
+
+        batch = pr_numbers[start:start + batch_size]
+
+        logger.info(f'Querying commits for pull requests #{start + 1} to #{start + len(batch)} of {len(pr_numbers)}')
+
+        try:
+            batch_rows, incomplete_prs = get_pull_request_commits_batch(session, owner, name, repo_id, batch)
+
+            all_data += batch_rows
+        except RetryableError:
+            raise
+        except Exception as e:
+            logger.error(f"Ran into error with pull requests #{start + 1} to #{start + len(batch)} in repo {repo_id}. Falling back to querying them one at a time")
+            logger.error(
+            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+
+            incomplete_prs = batch
+
+        #prs that have more commits than fit in the first page of the batched query
+        for pr_info in incomplete_prs:
+
+            logger.info(f"Repaginating commits for pull request #{pr_info['pr_src_number']}")
+
+            try:
+                all_data += get_pull_request_commits(session, owner, name, repo_id, pr_info)
+            except RetryableError:
+                raise
+            except Exception as e:
+                logger.error(f"Ran into error with pull request #{pr_info['pr_src_number']} in repo {repo_id}")
+                logger.error(
+                ''.join(traceback.format_exception(None, e, e.__traceback__)))
+
+        #every pr up to the end of this batch is done once the rows are inserted
+        if len(all_data) >= PR_COMMITS_INSERT_BATCH_SIZE:
+            insert_pull_request_commits(session, all_data)
+            all_data = []
+
+            save_checkpoint(PR_COMMITS_CHECKPOINT, repo_id, batch[-1]['pr_src_number'])
+
+    insert_pull_request_commits(session, all_data)
+
+    clear_checkpoint(PR_COMMITS_CHECKPOINT, repo_id)
+
+
+def get_pull_request_commits_batch(session, owner, name, repo_id, pr_infos):
+    """Gets the first page of commits for several pull requests with one graphql query.
+
+    Returns:
+        the pull request commit rows, and the pr_infos whose commits did not fit on the first page
+    """
+
+    pr_fields = """
+        number
+        commits(first: 100) {
+            edges {
+                node {
+                    commit {
+                        oid
+                        id
+                        message
+                    }
+                }
+            }
+            totalCount
+        }
+    """
+
+    query = build_pull_request_batch_query([pr_info['pr_src_number'] for pr_info in pr_infos], pr_fields)
+
+    params = {
+        'owner' : owner,
+        'repo'  : name
+    }
+
+    data = request_graphql_dict(session, "https://api.github.com/graphql", query, variables=params, query_name="pull_request_commits_batch")
+
+    if not data or not data.get('data') or not data['data'].get('repository'):
+        raise KeyError(f"No data returned for pull request commits batch: {data}")
+
+    repository = data['data']['repository']
+
+    pr_commit_rows = []
+    incomplete_prs = []
+    for pr_info in pr_infos:
+
+        pr = repository.get(f"pr{pr_info['pr_src_number']}")
+
+        #pull requests that no longer exist on github come back as null
+        if not pr or not pr['commits']:
+            continue
+
+        if pr['commits']['totalCount'] > len(pr['commits']['edges']):
+            incomplete_prs.append(pr_info)
+            continue
+
+        pr_commit_rows += [
+            extract_pr_commit_row(pr_info, edge['node'], repo_id)
+            for edge in pr['commits']['edges'] if edge['node']
+        ]
+
+    return pr_commit_rows, incomplete_prs
+
+
+def get_pull_request_commits(session, owner, name, repo_id, pr_info):
+    """Paginates through all the commits of a single pull request.
+
+    Returns:
+        the pull request commit rows
+    """
+
+    query = """
+        query($repo: String!, $owner: String!, $pr_number: Int!, $numRecords: Int!, $cursor: String) {
+            repository(name: $repo, owner: $owner) {
+                pullRequest(number: $pr_number) {
+                    commits(first: $numRecords, after: $cursor) {
+                        edges {
+                            node {
+                                commit {
+                                    oid
+                                    id
+                                    message
+                                }
+                            }
+                        }
+                        totalCount
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
+                    }
+                }
+            }
+        }
+    """
+
+    values = ("repository","pullRequest","commits")
+    params = {
+        'owner' : owner,
+        'repo'  : name,
+        'pr_number' : pr_info['pr_src_number'],
+        'values' : values
+    }
+
+    commit_collection = GraphQlPageCollection(query, session.oauths, session.logger, bind=params)
+
+    return [extract_pr_commit_row(pr_info, pr_commit, repo_id) for pr_commit in commit_collection if pr_commit]
+
+
+def extract_pr_commit_row(pr_info, pr_commit, repo_id):
+
+    return {
+        'pull_request_id': pr_info['pull_request_id'],
+        'pr_cmt_sha': pr_commit['commit']['oid'],
+        'pr_cmt_node_id': pr_commit['commit']['id'],
+        'pr_cmt_message': pr_commit['commit']['message'],
+        'tool_source': 'pull_request_commits_model',
+        'tool_version': '0.41',
+        'data_source': 'GitHub API',
+        'repo_id': repo_id,
+    }
+
 
+def insert_pull_request_commits(session, pr_commit_rows):
 
+    if len(pr_commit_rows) > 0:
+        session.logger.info(f"Inserting {len(pr_commit_rows)} pull request commits")
+        #Execute bulk upsert
+        pr_commits_natural_keys = [	"pull_request_id", "repo_id", "pr_cmt_sha"]
+        session.insert_data(pr_commit_rows,PullRequestCommit,pr_commits_natural_keys)
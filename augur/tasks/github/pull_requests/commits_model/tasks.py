@@ -4,6 +4,8 @@ from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.github.pull_requests.commits_model.core import *
 from augur.tasks.init.celery_app import celery_app as celery
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.retry import RetryableError
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 
 @celery.task
@@ -14,7 +16,13 @@ def process_pull_request_commits(repo_git: str) -> None:
         query = session.query(Repo).filter(Repo.repo_git == repo_git)
         repo = execute_session_query(query, 'one')
         try:
-            pull_request_commits_model(repo.repo_id, logger)
+            # a retry resumes after the last pull request whose commits were inserted
+            pull_request_commits_graphql_model(repo.repo_id, logger, resume=process_pull_request_commits.request.retries > 0)
+        except RetryableError:
+            raise
         except Exception as e:
-            logger.error(f"Could not complete pull_request_commits_model!\n Reason: {e} \n Traceback: {''.join(traceback.format_exception(None, e, e.__traceback__))}")
+            logger.error(f"Could not complete pull_request_commits_graphql_model!\n Reason: {e} \n Traceback: {''.join(traceback.format_exception(None, e, e.__traceback__))}")
             raise e
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo.repo_id)
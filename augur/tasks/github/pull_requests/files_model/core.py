@@ -7,18 +7,33 @@ from augur.application.db.session import DatabaseSession
 from augur.tasks.init.celery_app import engine
 from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.github.util.github_paginator import GithubPaginator, hit_api
-from augur.tasks.github.util.gh_graphql_entities import GraphQlPageCollection, hit_api_graphql
+from augur.tasks.github.util.gh_graphql_entities import GraphQlPageCollection, hit_api_graphql, request_graphql_dict, build_pull_request_batch_query
 from augur.application.db.models import *
 from augur.tasks.github.util.util import get_owner_repo
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.retry import RetryableError
+from augur.tasks.util.task_checkpoints import get_checkpoint, save_checkpoint, clear_checkpoint
 
-def pull_request_files_model(repo_id,logger):
+# number of pull requests whose first page of files is requested in one graphql query
+PR_FILES_BATCH_SIZE = 50
+# number of pull request file rows that are written to the database at once
+PR_FILES_INSERT_BATCH_SIZE = 10000
+# name the last pull request whose files were inserted is saved under, so a retried task can resume after it
+PR_FILES_CHECKPOINT = "pull_request_files"
+
+def pull_request_files_model(repo_id,logger,batch_size=PR_FILES_BATCH_SIZE,resume=False):
+        """Collects the files of the pull requests of a repo using aliased graphql queries.
+
+        The pull requests are collected in order of their number, and the number of the last one whose files were
+        inserted is saved as a checkpoint. When resume is True the pull requests up to the checkpoint are skipped.
+        """
 
         # query existing PRs and the respective url we will append the commits url to
         pr_number_sql = s.sql.text("""
             SELECT DISTINCT pr_src_number as pr_src_number, pull_requests.pull_request_id
             FROM pull_requests--, pull_request_meta
             WHERE repo_id = :repo_id
+            ORDER BY pr_src_number
         """).bindparams(repo_id=repo_id)
         pr_numbers = []
         #pd.read_sql(pr_number_sql, self.db, params={})
@@ -31,64 +46,184 @@ def pull_request_files_model(repo_id,logger):
     
         owner, name = get_owner_repo(repo.repo_git)
 
+        checkpoint = get_checkpoint(PR_FILES_CHECKPOINT, repo_id) if resume else None
+        if checkpoint is not None:
+            logger.info(f"Resuming pull request files of repo {repo.repo_git} after pull request #{checkpoint}")
+            pr_numbers = [pr_info for pr_info in pr_numbers if pr_info['pr_src_number'] > int(checkpoint)]
+
         pr_file_rows = []
         logger.info(f"Getting pull request files for repo: {repo.repo_git}")
-        for index,pr_info in enumerate(pr_numbers):
-
-            logger.info(f'Querying files for pull request #{index + 1} of {len(pr_numbers)}')
-            
-            query = """
-
-                query($repo: String!, $owner: String!,$pr_number: Int!, $numRecords: Int!, $cursor: String) {
-                    repository(name: $repo, owner: $owner) {
-                        pullRequest(number: $pr_number) {
-                            files ( first: $numRecords, after: $cursor)
-                            {
-                                edges {
-                                    node {
-                                        additions
-                                        deletions
-                                        path
-                                    }
-                                }
-                                totalCount
-                                pageInfo {
-                                    hasNextPage
-                                    endCursor
-                                }
+        for start in range(0, len(pr_numbers), batch_size):
+
+            batch = pr_numbers[start:start + batch_size]
+
+            logger.info(f'Querying files for pull requests #{start + 1} to #{start + len(batch)} of {len(pr_numbers)}')
+
+            try:
+                batch_rows, incomplete_prs = get_pull_request_files_batch(session, owner, name, repo_id, batch)
+
+                pr_file_rows += batch_rows
+            except RetryableError:
+                raise
+            except Exception as e:
+                logger.error(f"Ran into error with pull requests #{start + 1} to #{start + len(batch)} in repo {repo_id}. Falling back to querying them one at a time")
+                logger.error(
+                ''.join(traceback.format_exception(None, e, e.__traceback__)))
+
+                incomplete_prs = batch
+
+            #prs that have more files than fit in the first page of the batched query
+            for pr_info in incomplete_prs:
+
+                logger.info(f"Repaginating files for pull request #{pr_info['pr_src_number']}")
+
+                try:
+                    pr_file_rows += get_pull_request_files(session, owner, name, repo_id, pr_info)
+                except RetryableError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ran into error with pull request #{pr_info['pr_src_number']} in repo {repo_id}")
+                    logger.error(
+                    ''.join(traceback.format_exception(None, e, e.__traceback__)))
+
+            #every pr up to the end of this batch is done once the rows are inserted
+            if len(pr_file_rows) >= PR_FILES_INSERT_BATCH_SIZE:
+                insert_pull_request_files(session, pr_file_rows)
+                pr_file_rows = []
+
+                save_checkpoint(PR_FILES_CHECKPOINT, repo_id, batch[-1]['pr_src_number'])
+
+        insert_pull_request_files(session, pr_file_rows)
+
+        clear_checkpoint(PR_FILES_CHECKPOINT, repo_id)
+
+
+def insert_pull_request_files(session, pr_file_rows):
+
+    if len(pr_file_rows) > 0:
+        session.logger.info(f"Inserting {len(pr_file_rows)} pull request files")
+        #Execute a bulk upsert with sqlalchemy 
+        pr_file_natural_keys = ["pull_request_id", "repo_id", "pr_file_path"]
+        session.insert_data(pr_file_rows, PullRequestFile, pr_file_natural_keys)
+
+
+def get_pull_request_files_batch(session, owner, name, repo_id, pr_infos):
+    """Gets the first page of files for several pull requests with one graphql query.
+
+    Args:
+        session: github task session used for the api keys and logging
+        owner: owner of the repo
+        name: name of the repo
+        repo_id: id of the repo the pull requests belong to
+        pr_infos: dicts with the pr_src_number and pull_request_id of each pull request
+
+    Returns:
+        the pull request file rows, and the pr_infos whose files did not fit on the first page
+    """
+
+    pr_fields = """
+        number
+        files(first: 100) {
+            edges {
+                node {
+                    additions
+                    deletions
+                    path
+                }
+            }
+            totalCount
+        }
+    """
+
+    query = build_pull_request_batch_query([pr_info['pr_src_number'] for pr_info in pr_infos], pr_fields)
+
+    params = {
+        'owner' : owner,
+        'repo'  : name
+    }
+
+    data = request_graphql_dict(session, "https://api.github.com/graphql", query, variables=params, query_name="pull_request_files_batch")
+
+    if not data or not data.get('data') or not data['data'].get('repository'):
+        raise KeyError(f"No data returned for pull request files batch: {data}")
+
+    repository = data['data']['repository']
+
+    pr_file_rows = []
+    incomplete_prs = []
+    for pr_info in pr_infos:
+
+        pr = repository.get(f"pr{pr_info['pr_src_number']}")
+
+        #pull requests that no longer exist on github come back as null
+        if not pr or not pr['files']:
+            continue
+
+        #same idea as repaginateIfIncomplete, we only paginate the prs we couldn't get all at once.
+        if pr['files']['totalCount'] > len(pr['files']['edges']):
+            incomplete_prs.append(pr_info)
+            continue
+
+        pr_file_rows += [
+            extract_pr_file_row(pr_info, edge['node'], repo_id)
+            for edge in pr['files']['edges'] if edge['node'] and 'path' in edge['node']
+        ]
+
+    return pr_file_rows, incomplete_prs
+
+
+def get_pull_request_files(session, owner, name, repo_id, pr_info):
+    """Paginates through all the files of a single pull request.
+
+    Returns:
+        the pull request file rows
+    """
+
+    query = """
+
+        query($repo: String!, $owner: String!,$pr_number: Int!, $numRecords: Int!, $cursor: String) {
+            repository(name: $repo, owner: $owner) {
+                pullRequest(number: $pr_number) {
+                    files ( first: $numRecords, after: $cursor)
+                    {
+                        edges {
+                            node {
+                                additions
+                                deletions
+                                path
                             }
                         }
+                        totalCount
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
                     }
                 }
-            """
-            
-            values = ("repository","pullRequest","files")
-            params = {
-                'owner' : owner,
-                'repo'  : name,
-                'pr_number' : pr_info['pr_src_number'],
-                'values' : values
             }
+        }
+    """
+    
+    values = ("repository","pullRequest","files")
+    params = {
+        'owner' : owner,
+        'repo'  : name,
+        'pr_number' : pr_info['pr_src_number'],
+        'values' : values
+    }
 
-            try:
-                file_collection = GraphQlPageCollection(query, session.oauths, session.logger,bind=params)
-
-                pr_file_rows += [{
-                    'pull_request_id': pr_info['pull_request_id'],
-                    'pr_file_additions': pr_file['additions'] if 'additions' in pr_file else None,
-                    'pr_file_deletions': pr_file['deletions'] if 'deletions' in pr_file else None,
-                    'pr_file_path': pr_file['path'],
-                    'data_source': 'GitHub API',
-                    'repo_id': repo_id, 
-                    } for pr_file in file_collection if pr_file and 'path' in pr_file]
-            except Exception as e:
-                logger.error(f"Ran into error with pull request #{index + 1} in repo {repo_id}")
-                logger.error(
-                ''.join(traceback.format_exception(None, e, e.__traceback__)))
+    file_collection = GraphQlPageCollection(query, session.oauths, session.logger,bind=params)
+
+    return [extract_pr_file_row(pr_info, pr_file, repo_id) for pr_file in file_collection if pr_file and 'path' in pr_file]
 
 
+def extract_pr_file_row(pr_info, pr_file, repo_id):
 
-        if len(pr_file_rows) > 0:
-            #Execute a bulk upsert with sqlalchemy 
-            pr_file_natural_keys = ["pull_request_id", "repo_id", "pr_file_path"]
-            session.insert_data(pr_file_rows, PullRequestFile, pr_file_natural_keys)
+    return {
+        'pull_request_id': pr_info['pull_request_id'],
+        'pr_file_additions': pr_file['additions'] if 'additions' in pr_file else None,
+        'pr_file_deletions': pr_file['deletions'] if 'deletions' in pr_file else None,
+        'pr_file_path': pr_file['path'],
+        'data_source': 'GitHub API',
+        'repo_id': repo_id, 
+    }
@@ -11,6 +11,8 @@ from augur.tasks.util.worker_util import remove_duplicate_dicts
 from augur.tasks.github.util.util import add_key_value_pair_to_dicts, get_owner_repo
 from augur.application.db.models import PullRequest, Message, PullRequestReview, PullRequestLabel, PullRequestReviewer, PullRequestEvent, PullRequestMeta, PullRequestAssignee, PullRequestReviewMessageRef, PullRequestMessageRef, Contributor, Repo
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
+from augur.tasks.util.repo_daily_activity import get_activity_dates, changed_activity_days, update_repo_daily_activity, PULL_REQUESTS
 
 
 platform_id = 1
@@ -97,6 +99,9 @@ def process_pull_requests(pull_requests, task_name, repo_id, logger):
         pr_natural_keys = ["repo_id", "pr_src_id"]
         pr_return_columns = ["pull_request_id", "pr_url"]
         pr_string_fields = ["pr_src_title", "pr_body"]
+
+        # the days the prs are counted on before they are updated, so only the days that change are recomputed
+        pr_dates = get_activity_dates(session, repo_id, PULL_REQUESTS, [pr["pr_src_id"] for pr in pr_dicts])
         pr_return_data = session.insert_data(pr_dicts, PullRequest, pr_natural_keys, 
                                 return_columns=pr_return_columns, string_fields=pr_string_fields)
 
@@ -156,6 +161,11 @@ def process_pull_requests(pull_requests, task_name, repo_id, logger):
         session.insert_data(pr_metadata_dicts, PullRequestMeta,
                             pr_metadata_natural_keys, string_fields=pr_metadata_string_fields)
 
+        update_repo_daily_activity(session, repo_id, PULL_REQUESTS, changed_activity_days(PULL_REQUESTS, pr_dates, pr_dicts))
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo_id)
+
 
 
 
@@ -267,7 +277,7 @@ def pull_request_review_comments(repo_git: str) -> None:
             )
         
         logger.info(f"Inserting {len(pr_review_comment_dicts)} pr review comments")
-        message_natural_keys = ["platform_msg_id"]
+        message_natural_keys = ["repo_id", "platform_msg_id"]
         message_return_columns = ["msg_id", "platform_msg_id"]
         message_return_data = session.insert_data(pr_review_comment_dicts, Message, message_natural_keys, message_return_columns)
 
@@ -159,7 +159,7 @@ def fetch_data(session, github_url, repo_id, tag_only = False):
 
     # Hit the graphql endpoint
     session.logger.info("Hitting endpoint: {} ...\n".format(url))
-    data = request_graphql_dict(session, url, query)
+    data = request_graphql_dict(session, url, query, query_name="releases")
 
     if 'data' in data:
         data = data['data']['repository']
@@ -2,6 +2,7 @@ from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.github.releases.core import *
 from augur.tasks.init.celery_app import celery_app as celery, engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 
 @celery.task
 def collect_releases():
@@ -12,4 +13,7 @@ def collect_releases():
         repos = execute_session_query(query, 'all')
 
         for repo in repos:
-            releases_model(session, repo.repo_git, repo.repo_id)
\ No newline at end of file
+            releases_model(session, repo.repo_git, repo.repo_id)
+
+            # let the api caches know this repo has new data
+            bump_repo_data_version(session, repo.repo_id)
@@ -6,12 +6,83 @@ import pandas as pd
 import sqlalchemy as s
 import httpx
 import logging
+from urllib.parse import urlparse, parse_qs
 from augur.tasks.github.util.github_paginator import GithubPaginator
 from augur.tasks.github.util.github_paginator import hit_api
 from augur.tasks.github.util.util import get_owner_repo
-from augur.tasks.github.util.gh_graphql_entities import hit_api_graphql
+from augur.tasks.github.util.gh_graphql_entities import hit_api_graphql, request_graphql_dict
 from augur.application.db.models import *
 from augur.tasks.github.util.github_task_session import *
+from augur.tasks.util.retry import RetryableError
+
+
+# fields collected for every repo, shared by the single repo and batched queries
+REPO_INFO_FIELDS = """
+                updatedAt
+                hasIssuesEnabled
+                issues(states:OPEN) {
+                    totalCount
+                }
+                hasWikiEnabled
+                forkCount
+                defaultBranchRef {
+                    name
+                }
+                watchers {
+                    totalCount
+                }
+                id
+                licenseInfo {
+                    name
+                    url
+                }
+                stargazers {
+                    totalCount
+                }
+                codeOfConduct {
+                    name
+                    url
+                }
+                issue_count: issues {
+                    totalCount
+                }
+                issues_closed: issues(states:CLOSED) {
+                    totalCount
+                }
+                pr_count: pullRequests {
+                    totalCount
+                }
+                pr_open: pullRequests(states: OPEN) {
+                    totalCount
+                }
+                pr_closed: pullRequests(states: CLOSED) {
+                    totalCount
+                }
+                pr_merged: pullRequests(states: MERGED) {
+                    totalCount
+                }
+                ref(qualifiedName: "master") {
+                    target {
+                        ... on Commit {
+                            history(first: 0){
+                                totalCount
+                            }
+                        }
+                    }
+                }
+"""
+
+# fields that replace the REST requests of is_forked and is_archived in the batched query
+REPO_FORK_ARCHIVE_FIELDS = """
+                isFork
+                parent {
+                    nameWithOwner
+                }
+                isArchived
+"""
+
+# number of repos whose info is requested in one graphql query
+REPO_INFO_BATCH_SIZE = 25
 
 
 def query_committers_count(session, owner, repo):
@@ -23,6 +94,33 @@ def query_committers_count(session, owner, repo):
     
     return len(contributors)
 
+def query_committers_count_from_header(session, owner, repo):
+    """Gets the number of contributors of a repo with a single request.
+
+    With one contributor per page the page number of the last link in the header is the number of contributors.
+    """
+
+    session.logger.info('Querying committers count\n')
+    url = f'https://api.github.com/repos/{owner}/{repo}/contributors?per_page=1&anon=false'
+
+    r = hit_api(session.oauths, url, session.logger, method="HEAD")
+
+    # github responds with 204 when a repo has no contributors
+    if r is not None and r.status_code == 204:
+        return 0
+
+    if r is None or r.status_code != 200:
+        session.logger.info(f"Could not get committers count from header for {owner}/{repo}, falling back to paginating")
+        return query_committers_count(session, owner, repo)
+
+    # a single page of one means there is only one contributor
+    if 'last' not in r.links.keys():
+        return 1
+
+    last_page_url = r.links['last']['url']
+
+    return int(parse_qs(urlparse(last_page_url).query)['page'][0])
+
 def get_repo_data(session, url, response):
     data = {}
     try:
@@ -110,62 +208,11 @@ def repo_info_model(session, repo_orm_obj):
     query = """
         {
             repository(owner:"%s", name:"%s"){
-                updatedAt
-                hasIssuesEnabled
-                issues(states:OPEN) {
-                    totalCount
-                }
-                hasWikiEnabled
-                forkCount
-                defaultBranchRef {
-                    name
-                }
-                watchers {
-                    totalCount
-                }
-                id
-                licenseInfo {
-                    name
-                    url
-                }
-                stargazers {
-                    totalCount
-                }
-                codeOfConduct {
-                    name
-                    url
-                }
-                issue_count: issues {
-                    totalCount
-                }
-                issues_closed: issues(states:CLOSED) {
-                    totalCount
-                }
-                pr_count: pullRequests {
-                    totalCount
-                }
-                pr_open: pullRequests(states: OPEN) {
-                    totalCount
-                }
-                pr_closed: pullRequests(states: CLOSED) {
-                    totalCount
-                }
-                pr_merged: pullRequests(states: MERGED) {
-                    totalCount
-                }
-                ref(qualifiedName: "master") {
-                    target {
-                        ... on Commit {
-                            history(first: 0){
-                                totalCount
-                            }
-                        }
-                    }
-                }
+                %s
             }
         }
 
-    """ % (owner, repo)
+    """ % (owner, repo, REPO_INFO_FIELDS)
 
     ##############################
     # {
@@ -236,7 +283,87 @@ def repo_info_model(session, repo_orm_obj):
 
     # Put all data together in format of the table
     session.logger.info(f'Inserting repo info for repo with id:{repo_orm_obj.repo_id}, owner:{owner}, name:{repo}\n')
-    rep_inf = {
+    rep_inf = extract_repo_info_row(repo_orm_obj, data, committers_count)
+
+    insert_repo_info(session, rep_inf)
+
+    # Note that the addition of information about where a repository may be forked from, and whether a repository is archived, updates the `repo` table, not the `repo_info` table.
+    forked = is_forked(session, owner, repo)
+    archived = is_archived(session, owner, repo)
+
+    update_repo_fork_and_archive(session, repo_orm_obj, forked, archived)
+
+    session.logger.info(f"Inserted info for {owner}/{repo}\n")
+
+
+def repo_info_batch_model(session, repo_orm_objs):
+    """Fills the repo_info model for several repos with one graphql query.
+
+    Each repository is aliased as repo<index> in the query, and the fork parent and archived flag
+    are taken from the same query instead of two REST requests per repo.
+    """
+
+    session.logger.info(f"Beginning filling the repo_info model for {len(repo_orm_objs)} repos\n")
+
+    owner_repos = [get_owner_repo(repo_orm_obj.repo_git) for repo_orm_obj in repo_orm_objs]
+
+    aliased_repos = "\n".join(
+        'repo%d: repository(owner:"%s", name:"%s"){ %s %s }' % (index, owner, repo, REPO_INFO_FIELDS, REPO_FORK_ARCHIVE_FIELDS)
+        for index, (owner, repo) in enumerate(owner_repos)
+    )
+
+    query = """
+        {
+            %s
+        }
+    """ % aliased_repos
+
+    url = 'https://api.github.com/graphql'
+
+    session.logger.info("Hitting endpoint: {} ...\n".format(url))
+    response = request_graphql_dict(session, url, query, query_name="repo_info_batch")
+
+    if not response or not response.get('data'):
+        raise Exception(f"Could not grab info for repos {[repo_orm_obj.repo_id for repo_orm_obj in repo_orm_objs]}: {response}")
+
+    for index, repo_orm_obj in enumerate(repo_orm_objs):
+
+        owner, repo = owner_repos[index]
+        data = response['data'].get(f"repo{index}")
+
+        # repos that no longer exist come back as null
+        if not data:
+            session.logger.error(f"Cannot access repo_info data for repo {repo_orm_obj.repo_id} ({owner}/{repo}). Skipping")
+            continue
+
+        try:
+            committers_count = query_committers_count_from_header(session, owner, repo)
+
+            session.logger.info(f'Inserting repo info for repo with id:{repo_orm_obj.repo_id}, owner:{owner}, name:{repo}\n')
+            rep_inf = extract_repo_info_row(repo_orm_obj, data, committers_count)
+
+            insert_repo_info(session, rep_inf)
+
+            if data['isFork']:
+                forked = data['parent']['nameWithOwner'] if data['parent'] else 'Parent not available'
+            else:
+                forked = False
+
+            archived = data['updatedAt'] if data['isArchived'] else False
+
+            update_repo_fork_and_archive(session, repo_orm_obj, forked, archived)
+        except RetryableError:
+            raise
+        except Exception as e:
+            session.logger.error(f"Could not add repo info for repo {repo_orm_obj.repo_id}\n Error: {e}")
+            continue
+
+        session.logger.info(f"Inserted info for {owner}/{repo}\n")
+
+
+def extract_repo_info_row(repo_orm_obj, data, committers_count):
+
+    return {
         'repo_id': repo_orm_obj.repo_id,
         'last_updated': data['updatedAt'] if 'updatedAt' in data else None,
         'issues_enabled': data['hasIssuesEnabled'] if 'hasIssuesEnabled' in data else None,
@@ -271,6 +398,9 @@ def repo_info_model(session, repo_orm_obj):
         'data_source': "Github"
     }
 
+
+def insert_repo_info(session, rep_inf):
+
     #result = session.insert_data(rep_inf,RepoInfo,['repo_info_id']) #result = self.db.execute(self.repo_info_table.insert().values(rep_inf))
     insert_statement = s.sql.text("""INSERT INTO repo_info (repo_id,last_updated,issues_enabled,
 			open_issues,pull_requests_enabled,wiki_enabled,pages_enabled,fork_count,
@@ -288,9 +418,9 @@ def repo_info_model(session, repo_orm_obj):
 
     session.execute_sql(insert_statement)
 
-    # Note that the addition of information about where a repository may be forked from, and whether a repository is archived, updates the `repo` table, not the `repo_info` table.
-    forked = is_forked(session, owner, repo)
-    archived = is_archived(session, owner, repo)
+
+def update_repo_fork_and_archive(session, repo_orm_obj, forked, archived):
+
     archived_date_collected = None
     if archived is not False:
         archived_date_collected = archived
@@ -301,7 +431,7 @@ def repo_info_model(session, repo_orm_obj):
     current_repo_dict = repo_orm_obj.__dict__
 
     #delete irrelevant sqlalchemy metadata
-    del current_repo_dict['_sa_instance_state']
+    current_repo_dict.pop('_sa_instance_state', None)
 
     rep_additional_data = {
         'forked_from': forked,
@@ -313,7 +443,3 @@ def repo_info_model(session, repo_orm_obj):
     result = session.insert_data(current_repo_dict, Repo, ['repo_id'])
     #result = self.db.execute(self.repo_table.update().where(
     #    self.repo_table.c.repo_id==repo_id).values(rep_additional_data))
-
-    session.logger.info(f"Inserted info for {owner}/{repo}\n")
-
-
@@ -2,6 +2,8 @@ from augur.tasks.github.util.github_task_session import GithubTaskSession
 from augur.tasks.github.repo_info.core import *
 from augur.tasks.init.celery_app import celery_app as celery, engine
 from augur.application.db.util import execute_session_query
+from augur.tasks.util.retry import RetryableError
+from augur.tasks.util.repo_data_versions import bump_repo_data_version
 import traceback
 
 @celery.task
@@ -14,7 +16,35 @@ def collect_repo_info(repo_git: str):
         repo = execute_session_query(query, 'one')
         try:
             repo_info_model(session, repo)
+        except RetryableError:
+            raise
         except Exception as e:
             session.logger.error(f"Could not add repo info for repo {repo.repo_id}\n Error: {e}")
             session.logger.error(
-                    ''.join(traceback.format_exception(None, e, e.__traceback__)))
\ No newline at end of file
+                    ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            return
+
+        # let the api caches know this repo has new data
+        bump_repo_data_version(session, repo.repo_id)
+
+@celery.task
+def collect_repo_info_batch(repo_git_list: list):
+
+    logger = logging.getLogger(collect_repo_info_batch.__name__)
+
+    with GithubTaskSession(logger, engine) as session:
+        query = session.query(Repo).filter(Repo.repo_git.in_(repo_git_list))
+        repos = execute_session_query(query, 'all')
+        try:
+            repo_info_batch_model(session, repos)
+        except RetryableError:
+            raise
+        except Exception as e:
+            session.logger.error(f"Could not add repo info for repos {[repo.repo_id for repo in repos]}\n Error: {e}")
+            session.logger.error(
+                    ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            return
+
+        # let the api caches know these repos have new data
+        for repo in repos:
+            bump_repo_data_version(session, repo.repo_id)
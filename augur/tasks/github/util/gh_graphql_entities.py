@@ -6,9 +6,18 @@ import httpx
 import json
 from random import choice
 import collections
+import bisect
 import time
 import traceback
 from augur.tasks.github.util.github_paginator import GithubApiResult, process_dict_response
+from augur.tasks.github.util.github_rate_limit import get_rate_limit_tracker, add_rate_limit_to_query
+from augur.tasks.util.retry import RetryableError
+
+#number of cheap pages in a row after which a shrunk page size is doubled again
+CHEAP_PAGES_BEFORE_GROWING = 5
+
+#number of pages kept for indexed access, older pages are requested again with their cursor
+PAGE_CACHE_SIZE = 10
 
 """
     Should be designed on a per entity basis that has attributes that call 
@@ -67,10 +76,13 @@ def hit_api_graphql(keyAuth,url,logger,query,variables={},timeout=40):
     
     return response
 
-def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
+def request_graphql_dict(session,url,query,variables={},timeout_wait=10,query_name="unnamed"):
     attempts = 0
     response_data = None
     success = False
+    rate_limit_tracker = get_rate_limit_tracker(session.oauths, session.logger)
+    #Ask github what the query costs so it can be recorded.
+    query = add_rate_limit_to_query(query)
     while attempts < 10:
         #self.logger.info(f"{attempts}")
         try:
@@ -94,7 +106,11 @@ def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
         #self.logger.info(f"api return: {response_data}")
 
         if type(response_data) == dict:
-            err = process_dict_response(session.logger, result, response_data)
+            err = process_dict_response(session.logger, result, response_data, session.oauths)
+
+            # the exhausted key was set aside, retrying with another key isn't counted as an attempt
+            if err == GithubApiResult.RATE_LIMIT_EXCEEDED:
+                continue
 
             if err and err != GithubApiResult.SUCCESS:
                 attempts += 1
@@ -107,18 +123,18 @@ def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
             session.logger.warning("Wrong type returned, trying again...")
             session.logger.info(f"Returned list: {response_data}")
         elif type(response_data) == str:
-            logger.info(
+            session.logger.info(
                 f"Warning! page_data was string: {response_data}")
             if "<!DOCTYPE html>" in response_data:
                 session.logger.info("HTML was returned, trying again...\n")
             elif len(response_data) == 0:
-                logger.warning("Empty string, trying again...\n")
+                session.logger.warning("Empty string, trying again...\n")
             else:
                 try:
                     # Sometimes raw text can be converted to a dict
                     response_data = json.loads(response_data)
                     session.logger.info(f"{response_data}")
-                    err = process_graphql_dict_response(logger,result,response_data)
+                    err = process_dict_response(session.logger, result, response_data, session.oauths)
 
                     #If we get an error message that's not None
                     if err and err != GithubApiResult.SUCCESS:
@@ -126,6 +142,8 @@ def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
                     
                     success = True
                     break
+                except RetryableError:
+                    raise
                 except:
                     pass
         attempts += 1
@@ -133,9 +151,69 @@ def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
     if not success:
         return None
 
+    rate_limit_tracker.record_graphql_rate_limit(result, get_rate_limit(response_data), query_name)
+
     return response_data
 
 
+def get_rate_limit(response_data):
+    """Gets the rateLimit object of a graphql response if it was requested."""
+
+    if not isinstance(response_data, dict) or not response_data.get('data'):
+        return None
+
+    return response_data['data'].get('rateLimit')
+
+
+def is_query_too_expensive(response_data):
+    """Determines if github rejected or timed out on a query because it asked for too much at once."""
+
+    if not isinstance(response_data, dict) or 'errors' not in response_data:
+        return False
+
+    for error in response_data['errors']:
+        if is_node_limit_error(error):
+            return True
+
+        if 'timeout' in str(error.get('message', '')):
+            return True
+
+    return False
+
+
+def is_node_limit_error(error):
+    """Determines if github rejected a query for the number of nodes it asks for, which fails the same way every time unlike a timeout."""
+
+    return error.get('type') in ('MAX_NODE_LIMIT_EXCEEDED', 'RESOURCE_LIMITS_EXCEEDED')
+
+
+def build_pull_request_batch_query(pr_numbers,pr_fields):
+    """Builds a query that selects the same fields on several pull requests of one repo in a single request.
+
+    Each pull request is aliased as pr<number> so the results can be told apart,
+    e.g. pr123: pullRequest(number: 123) { files(first: 100) {...} }
+
+    Args:
+        pr_numbers: numbers of the pull requests to query
+        pr_fields: graphql selection applied to every pull request
+
+    Returns:
+        query that expects the $owner and $repo variables
+    """
+
+    aliased_prs = "\n".join(
+        f"pr{number}: pullRequest(number: {int(number)}) {{ {pr_fields} }}" for number in pr_numbers
+    )
+
+    query = f"""
+        query($repo: String!, $owner: String!) {{
+            repository(name: $repo, owner: $owner) {{
+                {aliased_prs}
+            }}
+        }}
+    """
+
+    return query
 
 #Get data extraction logic for nested nodes in return data.
 
@@ -143,14 +221,37 @@ def request_graphql_dict(session,url,query,variables={},timeout_wait=10):
 class GraphQlPageCollection(collections.abc.Sequence):
     #Bind is needed for things like query by repo. Contains bind variables for the graphql query
     def __init__(self,query,keyAuth,logger,bind={},numPerPage=100,url="https://api.github.com/graphql",repaginateIfIncomplete=[]):
+        #numPerPage is the largest page size used. Pages shrink when github rejects a query as too expensive
+        #and grow back once the rateLimit cost shows they are cheap again.
         self.per_page = numPerPage
-        self.query = query
+        self.max_per_page = numPerPage
+        self.min_per_page = min(10, numPerPage)
+        #smallest page size github rejected for its number of nodes, pages never grow back to it.
+        self.rejected_per_page = None
+        #pages in a row that were cheap enough to grow the page size.
+        self.cheap_pages = 0
+        #Ask github what each page costs so the cost can be recorded and the page size tuned.
+        self.query = add_rate_limit_to_query(query)
         self.keyAuth = keyAuth
         self.logger = logger
 
+        self.rate_limit_tracker = get_rate_limit_tracker(keyAuth, logger)
+        #name the cost of the query is recorded under e.g. repository.pullRequest.files
+        self.query_name = ".".join(bind.get('values', ())) or "unnamed"
+        #rateLimit object of the last response
+        self.rate_limit = None
+
         self.url = url
 
-        self.page_cache = []
+        #nodes of the most recently used pages by page number, iterating doesn't keep more than PAGE_CACHE_SIZE pages.
+        self.page_cache = collections.OrderedDict()
+        #endCursor of each fetched page so any page can be requested again without starting over.
+        self.page_cursors = []
+        #index after the last node of each fetched page, pages differ in size when the page size is tuned.
+        self.page_ends = []
+        self.has_next_page = True
+        #totalCount taken from the first response, None if the query doesn't select it.
+        self.total_count = None
 
         self.bind = bind
 
@@ -199,7 +300,11 @@ class GraphQlPageCollection(collections.abc.Sequence):
             #self.logger.info(f"api return: {response_data}")
 
             if type(response_data) == dict:
-                err = process_dict_response(self.logger, result, response_data)
+                err = process_dict_response(self.logger, result, response_data, self.keyAuth)
+
+                # the exhausted key was set aside, retrying with another key isn't counted as an attempt
+                if err == GithubApiResult.RATE_LIMIT_EXCEEDED:
+                    continue
 
                 if err and err != GithubApiResult.SUCCESS:
                     attempts += 1
@@ -212,18 +317,18 @@ class GraphQlPageCollection(collections.abc.Sequence):
                 self.logger.warning("Wrong type returned, trying again...")
                 self.logger.info(f"Returned list: {response_data}")
             elif type(response_data) == str:
-                logger.info(
+                self.logger.info(
                     f"Warning! page_data was string: {response_data}")
                 if "<!DOCTYPE html>" in response_data:
                     self.logger.info("HTML was returned, trying again...\n")
                 elif len(response_data) == 0:
-                    logger.warning("Empty string, trying again...\n")
+                    self.logger.warning("Empty string, trying again...\n")
                 else:
                     try:
                         # Sometimes raw text can be converted to a dict
                         response_data = json.loads(response_data)
                         self.logger.info(f"{response_data}")
-                        err = process_graphql_dict_response(logger,result,response_data)
+                        err = process_dict_response(self.logger, result, response_data, self.keyAuth)
 
                         #If we get an error message that's not None
                         if err and err != GithubApiResult.SUCCESS:
@@ -231,6 +336,8 @@ class GraphQlPageCollection(collections.abc.Sequence):
                         
                         success = True
                         break
+                    except RetryableError:
+                        raise
                     except:
                         pass
             attempts += 1
@@ -238,6 +345,9 @@ class GraphQlPageCollection(collections.abc.Sequence):
         if not success:
             return None
 
+        self.rate_limit = get_rate_limit(response_data)
+        self.rate_limit_tracker.record_graphql_rate_limit(result, self.rate_limit, self.query_name)
+
         return response_data
 
     def hit_api(self,query,variables={}):
@@ -265,122 +375,191 @@ class GraphQlPageCollection(collections.abc.Sequence):
 
         return core
 
+    def fetch_next_page(self):
+        """Request the page after the last fetched one and cache its nodes.
 
-    def __getitem__(self, index):# -> dict:
-        #first try cache
-        try:
-            return self.page_cache[index]
-        except:
-            pass
-
-
-        #borrowed from the default github paginator
-        items_page = (index // self.per_page) + 1
+        Returns:
+            the nodes of the page, None if there was no further page to fetch
+        """
+        if not self.has_next_page:
+            return None
 
         params = {
             "numRecords" : self.per_page,
-            "cursor"    : None
+            "cursor"    : self.page_cursors[-1] if self.page_cursors else None
         }
-
         params.update(self.bind)
 
+        data = self.request_graphql_dict(variables=params)
+
+        #Retry with smaller pages when the page was too expensive for github to serve.
+        while is_query_too_expensive(data) and self.per_page > self.min_per_page:
+            if any(is_node_limit_error(error) for error in data['errors']):
+                self.rejected_per_page = min(self.rejected_per_page or self.per_page, self.per_page)
 
-        for page in range(items_page):
+            self.per_page = max(self.min_per_page, self.per_page // 2)
+            self.cheap_pages = 0
+            self.logger.info(f"Query {self.query_name} was too expensive, retrying with {self.per_page} records per page")
+
+            params['numRecords'] = self.per_page
             data = self.request_graphql_dict(variables=params)
-            #extract the content from the graphql query result
-            coreData = self.extract_paginate_result(data)
 
-            content = [data['node'] for data in list(coreData['edges'])]
+        coreData = self.extract_page(data, params)
 
-            if self.repaginate:
-                self.mark_for_repagination(content) 
+        #totalCount of the first response is enough to furfill len()
+        if self.total_count is None and 'totalCount' in coreData:
+            self.total_count = int(coreData['totalCount'])
 
-            self.page_cache.extend(content)
+        content = [edge['node'] for edge in list(coreData['edges'])]
 
-            #extract the pageinfo
-            pageInfo = coreData['pageInfo']
-            
-            #check if there is a next page to paginate. (graphql doesn't support random access)
-            if pageInfo['hasNextPage']:
-                params['cursor'] = pageInfo['endCursor']
-            else:
-                break
-        
+        if self.repaginate:
+            self.mark_for_repagination(content)
 
-        return self.page_cache[index]
-    
-    def __len__(self):
-        params = {
-            "numRecords" : 2,
-            "cursor"    : None
-        }
-        params.update(self.bind)
+        #extract the pageinfo and remember the cursor of this page so the next one can be requested.
+        pageInfo = coreData['pageInfo']
+        self.page_cursors.append(pageInfo['endCursor'])
+        self.page_ends.append(self.fetched_count() + len(content))
+        self.cache_page(len(self.page_ends) - 1, content)
 
-        #result = self.hit_api(self.query,variables=params)#self.client.execute(self.query,variable_values=params)
-        data = self.request_graphql_dict(variables=params)
-        coreData = self.extract_paginate_result(data)
+        #check if there is a next page to paginate. (graphql doesn't support random access)
+        self.has_next_page = bool(pageInfo['hasNextPage']) and len(content) > 0
 
-        totalCount = int(coreData['totalCount'])
+        self.adjust_page_size()
 
-        return totalCount
-    
-    def __iter__(self):
-        params = {
-            "numRecords" : self.per_page,
-            "cursor"    : None
-        }
-        params.update(self.bind)
+        return content
+
+    def extract_page(self, data, params):
 
-        #result = self.hit_api(self.query,variables=params)#self.client.execute(self.query,variable_values=params)
-        #self.logger.info(f"{params}")
-        data = self.request_graphql_dict(variables=params)
         try:
-            coreData = self.extract_paginate_result(data)
+            return self.extract_paginate_result(data)
         except KeyError as e:
             self.logger.error("Could not extract paginate result because there was no data returned")
             self.logger.error(
                 ''.join(traceback.format_exception(None, e, e.__traceback__)))
-            
+
+            self.logger.info(f"Trying again...")
             data = self.request_graphql_dict(variables=params)
-            coreData = self.extract_paginate_result(data)
+            return self.extract_paginate_result(data)
+
+    def get_page(self, page_number):
+        """Get the nodes of a page that was fetched before, requesting it again if it is no longer cached."""
+
+        if page_number in self.page_cache:
+            self.page_cache.move_to_end(page_number)
+            return self.page_cache[page_number]
+
+        start = self.page_ends[page_number - 1] if page_number > 0 else 0
+
+        params = {
+            "numRecords" : self.page_ends[page_number] - start,
+            "cursor"    : self.page_cursors[page_number - 1] if page_number > 0 else None
+        }
+        params.update(self.bind)
+
+        coreData = self.extract_page(self.request_graphql_dict(variables=params), params)
+
+        content = [edge['node'] for edge in list(coreData['edges'])]
+        self.cache_page(page_number, content)
+
+        return content
+
+    def cache_page(self, page_number, content):
+
+        self.page_cache[page_number] = content
+        self.page_cache.move_to_end(page_number)
+
+        while len(self.page_cache) > PAGE_CACHE_SIZE:
+            self.page_cache.popitem(last=False)
 
+    def fetched_count(self):
+        """Number of nodes in the pages fetched so far."""
 
-        if int(coreData['totalCount']) == 0:
-            yield None
+        return self.page_ends[-1] if self.page_ends else 0
+
+    def adjust_page_size(self):
+        """Grows the page size back towards numPerPage when the rateLimit cost shows pages are cheap.
+
+        The cost only shows the points github charged, not how close a page came to the node or time limits,
+        so the page size is only doubled after several cheap pages in a row, and never back to a size
+        that github rejected for its number of nodes.
+        """
+
+        if not self.rate_limit or self.per_page >= self.max_per_page:
             return
 
-        content = []
-        
-        #extract the content from the graphql query result 
-        for data in coreData['edges']:
-            yield data['node']
-            if self.repaginate:
-                content.append(data['node'])
+        #github charges one point for a request that asks for up to 100 nodes
+        if self.rate_limit['cost'] > 1:
+            self.cheap_pages = 0
+            return
 
-        if self.repaginate:
-                self.mark_for_repagination(content) 
+        self.cheap_pages += 1
 
-        while coreData['pageInfo']['hasNextPage']:
-            params['cursor'] = coreData['pageInfo']['endCursor']
+        per_page = min(self.max_per_page, self.per_page * 2)
 
-            try:
-                data = self.request_graphql_dict(variables=params)#self.client.execute(self.query,variable_values=params)
-            except Exception as e:
-                self.logger.error("Could not extract paginate result because there was no data returned")
-                self.logger.error(
-                    ''.join(traceback.format_exception(None, e, e.__traceback__)))
-                
-                self.logger.info(f"Trying again...")
-                data = self.request_graphql_dict(variables=params)
+        if self.rejected_per_page is not None and per_page >= self.rejected_per_page:
+            return
+
+        if self.cheap_pages >= CHEAP_PAGES_BEFORE_GROWING:
+            self.per_page = per_page
+            self.cheap_pages = 0
+
+    def __getitem__(self, index):# -> dict:
+
+        if isinstance(index, slice):
+            #Only fetch as far as the slice needs unless it is relative to the end.
+            if (index.start is not None and index.start < 0) or index.stop is None or index.stop < 0:
+                while self.fetch_next_page() is not None:
+                    pass
+            else:
+                while self.fetched_count() < index.stop and self.fetch_next_page() is not None:
+                    pass
+
+            return [self[position] for position in range(*index.indices(self.fetched_count()))]
 
-            coreData = self.extract_paginate_result(data)
+        if index < 0:
+            while self.fetch_next_page() is not None:
+                pass
+
+            index += self.fetched_count()
+
+        #Only request the pages after the ones we already have fetched.
+        while index >= self.fetched_count() and self.fetch_next_page() is not None:
+            pass
 
-            #print(coreData)
-            if len(coreData['edges']) == 0:
+        if index < 0 or index >= self.fetched_count():
+            raise IndexError("GraphQlPageCollection index out of range")
+
+        page_number = bisect.bisect_right(self.page_ends, index)
+        start = self.page_ends[page_number - 1] if page_number > 0 else 0
+
+        return self.get_page(page_number)[index - start]
+    
+    def __len__(self):
+
+        if not self.page_ends:
+            self.fetch_next_page()
+
+        #Without totalCount the pages are counted, which requests every page once.
+        if self.total_count is None:
+            while self.fetch_next_page() is not None:
+                pass
+
+            return self.fetched_count()
+
+        return self.total_count
+    
+    def __iter__(self):
+
+        #Pages are yielded as they are requested, so only the last PAGE_CACHE_SIZE pages stay in memory.
+        #The pages that were fetched before are taken from the cache or requested again with their cursor.
+        page_number = 0
+        while True:
+            while page_number < len(self.page_ends):
+                yield from self.get_page(page_number)
+                page_number += 1
+
+            if self.fetch_next_page() is None:
                 return
-            
-            for data in coreData['edges']:
-                yield data['node']
 
 
 #use httpx and pass random_key_auth
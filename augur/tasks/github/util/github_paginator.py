@@ -15,7 +15,10 @@ from enum import Enum
 
 
 from augur.tasks.github.util.github_random_key_auth import GithubRandomKeyAuth
+from augur.tasks.util.random_key_auth import RandomKeyAuth
+from augur.tasks.github.util.github_rate_limit import get_rate_limit_tracker
 from augur.tasks.github.util.util import parse_json_response
+from augur.tasks.util.retry import RetryableError, SECONDARY_RATE_LIMIT, RATE_LIMIT_EXCEEDED, ABUSE_MECHANISM_TRIGGERED
 
  
 def hit_api(key_manager, url: str, logger: logging.Logger, timeout: float = 10, method: str = 'GET', ) -> Optional[httpx.Response]:
@@ -49,19 +52,26 @@ def hit_api(key_manager, url: str, logger: logging.Logger, timeout: float = 10,
             time.sleep(round(timeout*1.5))
             return None
 
+    get_rate_limit_tracker(key_manager, logger).record_rest_response(response)
+
     return response 
 
 
-def process_dict_response(logger: logging.Logger, response: httpx.Response, page_data: dict) -> Optional[str]:
+def process_dict_response(logger: logging.Logger, response: httpx.Response, page_data: dict, key_manager: Optional[RandomKeyAuth] = None) -> Optional[str]:
     """Process dict response from the api and return the status.
 
     Args:
         logger: handles logging
         response: used to access the url of the request and the headers
         page_data: dict response from the api
+        key_manager: auth the request was made with. When the rate limit of its key is exceeded
+            the key is not used until it resets, and the request can be retried with another key
 
     Returns:
         A string explaining what happened is returned if what happened is determined, otherwise None is returned.
+
+    Raises:
+        RetryableError: if a rate limit or the abuse detection mechanism requires waiting before the next request
     """
     #logger.info("Request returned a dict: {}\n".format(page_data))
 
@@ -77,14 +87,11 @@ def process_dict_response(logger: logging.Logger, response: httpx.Response, page
 
     if "You have exceeded a secondary rate limit. Please wait a few minutes before you try again" in page_data['message']:
 
-        # sleeps for the specified amount of time that github says to retry after
+        # the task is retried after the amount of time that github says to retry after
         retry_after = int(response.headers["Retry-After"])
-        logger.info(
-            f'\n\n\n\nSleeping for {retry_after} seconds due to secondary rate limit issue.\n\n\n\n')
-        time.sleep(retry_after)
+        logger.info(f"Retrying in {retry_after} seconds due to secondary rate limit issue")
 
-        return GithubApiResult.SECONDARY_RATE_LIMIT
-        # return "do_not_increase_attempts"
+        raise RetryableError(f"Secondary rate limit exceeded on {response.url}", retry_after, SECONDARY_RATE_LIMIT)
     
     if "API rate limit exceeded for user" in page_data['message']:
 
@@ -96,21 +103,28 @@ def process_dict_response(logger: logging.Logger, response: httpx.Response, page
             logger.error(f"Key reset time was less than 0 setting it to 0.\nThe current epoch is {current_epoch} and the epoch that the key resets at is {epoch_when_key_resets}")
             key_reset_time = 0
             
-        logger.info(f"\n\n\nAPI rate limit exceeded. Sleeping until the key resets ({key_reset_time} seconds)")
-        time.sleep(key_reset_time)
+        # a key that can't be set aside would be picked again, so the request is only retried with another key if it was
+        if key_manager is not None and key_manager.mark_key_exhausted(response.request, epoch_when_key_resets):
+
+            if key_manager.get_available_keys():
+                logger.info("API rate limit exceeded for a key. Retrying with another key")
+                return GithubApiResult.RATE_LIMIT_EXCEEDED
+
+            key_reset_time = key_manager.get_seconds_until_key_resets()
 
-        return GithubApiResult.RATE_LIMIT_EXCEEDED
+        logger.info(f"API rate limit exceeded. Retrying when the key resets ({key_reset_time} seconds)")
+
+        raise RetryableError(f"API rate limit exceeded on {response.url}", key_reset_time, RATE_LIMIT_EXCEEDED)
 
     if "You have triggered an abuse detection mechanism." in page_data['message']:
         # self.update_rate_limit(response, temporarily_disable=True,platform=platform)
         
 
-        # sleeps for the specified amount of time that github says to retry after
+        # the task is retried after the amount of time that github says to retry after
         retry_after = int(response.headers["Retry-After"])
-        logger.info(f"Abuse mechanism detected sleeping for {retry_after} seconds")
-        time.sleep(retry_after)
+        logger.info(f"Abuse mechanism detected retrying in {retry_after} seconds")
 
-        return GithubApiResult.ABUSE_MECHANISM_TRIGGERED
+        raise RetryableError(f"Abuse detection mechanism triggered on {response.url}", retry_after, ABUSE_MECHANISM_TRIGGERED)
 
     if page_data['message'] == "Bad credentials":
         logger.error("\n\n\n\n\n\n\n Bad Token Detected \n\n\n\n\n\n\n")
@@ -371,7 +385,7 @@ class GithubPaginator(collections.abc.Sequence):
 
             # if the data is a dict then call process_dict_response, and 
             if isinstance(page_data, dict) is True:
-                dict_processing_result = process_dict_response(self.logger, response, page_data)
+                dict_processing_result = process_dict_response(self.logger, response, page_data, self.key_manager)
 
                 if dict_processing_result == GithubApiResult.NEW_RESULT:
                     self.logger.info(f"Encountered new dict response from api on url: {url}. Response: {page_data}")
@@ -380,12 +394,9 @@ class GithubPaginator(collections.abc.Sequence):
                 if dict_processing_result == GithubApiResult.REPO_NOT_FOUND:
                     return None, response, GithubApiResult.REPO_NOT_FOUND
 
-                if dict_processing_result in (GithubApiResult.SECONDARY_RATE_LIMIT, GithubApiResult.ABUSE_MECHANISM_TRIGGERED):
-                    continue
-
+                # the exhausted key was set aside, retrying with another key isn't counted as an attempt
                 if dict_processing_result == GithubApiResult.RATE_LIMIT_EXCEEDED:
-                    num_attempts = 0
-                    continue                    
+                    continue
 
             if isinstance(page_data, str) is True:
                 str_processing_result: Union[str, List[dict]] = self.process_str_response(page_data)
@@ -2,6 +2,7 @@
 
 from augur.tasks.util.random_key_auth import RandomKeyAuth
 from augur.tasks.github.util.github_api_key_handler import GithubApiKeyHandler
+from augur.tasks.github.util.github_rate_limit import GithubRateLimitTracker
 from augur.application.db.session import DatabaseSession
 from augur.tasks.init.celery_app import engine
 
@@ -9,6 +10,9 @@ from augur.tasks.init.celery_app import engine
 class GithubRandomKeyAuth(RandomKeyAuth):
     """Defines a github specific RandomKeyAuth class so 
     github collections can have a class randomly selects an api key for each request    
+
+    Attributes:
+        rate_limit_tracker (GithubRateLimitTracker): records the rate limits of the requests sent with the keys
     """
 
     def __init__(self, session: DatabaseSession):
@@ -31,4 +35,6 @@ class GithubRandomKeyAuth(RandomKeyAuth):
         header_name = "Authorization"
         key_format = "token {0}"
 
-        super().__init__(github_api_keys, header_name, session.logger, key_format)
\ No newline at end of file
+        super().__init__(github_api_keys, header_name, session.logger, key_format)
+
+        self.rate_limit_tracker = GithubRateLimitTracker(session.logger)
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""Defines the GithubRateLimitTracker class
+
+It keeps the rate limit budgets of the github api keys and the point cost of the graphql queries in redis,
+next to the api keys the GithubApiKeyHandler caches there, so both the REST and GraphQL budgets are visible in one place.
+"""
+import json
+import time
+import hashlib
+import logging
+
+from typing import Optional
+
+import httpx
+from redis import exceptions
+
+from augur.tasks.init.redis_connection import redis_connection as redis
+from augur.tasks.util.redis_stats import increment_stats, get_stats
+
+
+# selection that is added to graphql queries so github reports what they cost
+GRAPHQL_RATE_LIMIT_SELECTION = "rateLimit { cost remaining resetAt }"
+
+# the budgets are stored per key fingerprint, so they are shared by every process and kept across restarts
+RATE_LIMIT_BUDGETS_KEY = "github_rate_limit_budgets"
+GRAPHQL_QUERY_COSTS_KEY = "github_graphql_query_costs"
+
+# seconds the budgets and query costs are kept after they were last written, github rate limits reset every hour
+RATE_LIMIT_STATS_EXPIRE = 24 * 60 * 60
+
+
+def add_rate_limit_to_query(query: str) -> str:
+    """Adds the rateLimit selection to the top level of a graphql query
+
+    Args:
+        query: graphql query
+
+    Returns:
+        query that also requests its cost and the remaining budget of the key
+    """
+
+    if "rateLimit" in query:
+        return query
+
+    # the first brace opens the selection set of the operation
+    index = query.find("{")
+    if index == -1:
+        return query
+
+    return f"{query[:index + 1]}\n{GRAPHQL_RATE_LIMIT_SELECTION}\n{query[index + 1:]}"
+
+
+class GithubRateLimitTracker():
+    """Records the rate limit budgets and graphql query costs of the github api keys in redis
+
+    Attributes:
+        logger (logging.Logger): Handles all logs
+        budgets_redis_key (str): Key of the redis hash that stores the remaining budget of each api key per resource
+        query_costs_redis_key (str): Key of the redis hash that stores the total cost and number of requests per graphql query
+    """
+
+    def __init__(self, logger: logging.Logger):
+
+        self.logger = logger
+
+        self.budgets_redis_key = RATE_LIMIT_BUDGETS_KEY
+        self.query_costs_redis_key = GRAPHQL_QUERY_COSTS_KEY
+
+    def record_rest_response(self, response: httpx.Response) -> None:
+        """Records the REST budget of the key used for a request from the response headers
+
+        Args:
+            response: response of a request to the github REST api
+        """
+
+        headers = response.headers
+        if "X-RateLimit-Remaining" not in headers:
+            return
+
+        budget = {
+            "remaining": int(headers["X-RateLimit-Remaining"]),
+            "limit": int(headers.get("X-RateLimit-Limit", 0)),
+            "reset_at": int(headers.get("X-RateLimit-Reset", 0)),
+            "updated_at": int(time.time())
+        }
+
+        resource = headers.get("X-RateLimit-Resource", "core")
+
+        self._set_budget(resource, get_key_fingerprint(response), budget)
+
+    def record_graphql_rate_limit(self, response: httpx.Response, rate_limit: Optional[dict], query_name: str) -> None:
+        """Records the cost of a graphql query and the GraphQL budget of the key that was used
+
+        Args:
+            response: response of the graphql request
+            rate_limit: rateLimit object of the response data
+            query_name: name the cost of the query is recorded under
+        """
+
+        if not rate_limit:
+            return
+
+        budget = {
+            "remaining": rate_limit["remaining"],
+            "reset_at": rate_limit["resetAt"],
+            "updated_at": int(time.time())
+        }
+
+        self._set_budget("graphql", get_key_fingerprint(response), budget)
+
+        increment_stats(self.query_costs_redis_key, query_name, {"cost": rate_limit["cost"], "requests": 1}, expire=RATE_LIMIT_STATS_EXPIRE)
+
+    def get_budgets(self) -> dict:
+        """Gets the last known budget of every api key
+
+        Returns:
+            dict that maps each resource (core, search, graphql, ...) to a dict of key fingerprints and their budget
+        """
+
+        budgets = {}
+        for field, value in redis.hgetall(self.budgets_redis_key).items():
+
+            resource, fingerprint = field.split(":", 1)
+            budgets.setdefault(resource, {})[fingerprint] = json.loads(value)
+
+        return budgets
+
+    def get_query_costs(self) -> dict:
+        """Gets the total cost and number of requests of every graphql query that was recorded
+
+        Returns:
+            dict that maps query names to their total cost, number of requests and average cost
+        """
+
+        costs = {query_name: dict({"cost": 0, "requests": 0}, **stats) for query_name, stats in get_stats(self.query_costs_redis_key).items()}
+
+        for stats in costs.values():
+            stats["average_cost"] = stats["cost"] / stats["requests"] if stats["requests"] else 0
+
+        return costs
+
+    def _set_budget(self, resource: str, fingerprint: str, budget: dict) -> None:
+
+        try:
+            pipeline = redis.pipeline()
+            pipeline.hset(self.budgets_redis_key, f"{resource}:{fingerprint}", json.dumps(budget))
+            pipeline.expire(self.budgets_redis_key, RATE_LIMIT_STATS_EXPIRE)
+            pipeline.execute()
+        except exceptions.RedisError as e:
+            self.logger.debug(f"Unable to record {resource} rate limit budget: {e}")
+
+
+def get_rate_limit_tracker(key_manager, logger: logging.Logger) -> GithubRateLimitTracker:
+    """Gets the tracker of a key manager, so the requests of a collection share one tracker
+
+    Args:
+        key_manager: auth class the requests are sent with
+        logger: handles logging if the key manager has no tracker
+
+    Returns:
+        the tracker of the key manager, or a new tracker
+    """
+
+    return getattr(key_manager, "rate_limit_tracker", None) or GithubRateLimitTracker(logger)
+
+
+def get_key_fingerprint(response: httpx.Response) -> str:
+    """Gets a short identifier of the api key used for a request so the key itself is not stored again
+
+    Args:
+        response: response of a request to the github api
+
+    Returns:
+        first 12 characters of the sha256 of the key, or "unknown"
+    """
+
+    try:
+        auth_header = response.request.headers.get("Authorization")
+    except RuntimeError:
+        # the response has no request attached
+        return "unknown"
+
+    if not auth_header:
+        return "unknown"
+
+    return hashlib.sha256(auth_header.encode()).hexdigest()[:12]
@@ -1,17 +1,19 @@
 """Defines the Celery app."""
-from celery.signals import worker_process_init, worker_process_shutdown
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 import logging
 from typing import List, Dict
 import os
-from celery import Celery
+import random
+from celery import Celery, Task
 from celery import current_app 
 from celery.signals import after_setup_logger
 from sqlalchemy import create_engine, event
 
 
-from augur.application.logs import TaskLogConfig
+from augur.application.logs import TaskLogConfig, AugurLogger
 from augur.application.db.session import DatabaseSession
-from augur.application.db.engine import get_database_string
+from augur.application.db.engine import get_database_string, get_database_engine, set_worker_concurrency
+from augur.application.db.instrumentation import query_context, record_task_query_summary, SLOW_QUERY_LOGGER
 from augur.tasks.init import get_redis_conn_values
 
 logger = logging.getLogger(__name__)
@@ -40,10 +42,12 @@ data_analysis_tasks = ['augur.tasks.data_analysis.message_insights.tasks',
 
 materialized_view_tasks = ['augur.tasks.db.refresh_materialized_views']
 
+report_tasks = ['augur.tasks.reports.tasks']
+
 if os.environ.get('AUGUR_DOCKER_DEPLOY') != "1":
-    tasks = start_tasks + github_tasks + git_tasks + materialized_view_tasks + data_analysis_tasks
+    tasks = start_tasks + github_tasks + git_tasks + materialized_view_tasks + report_tasks + data_analysis_tasks
 else:
-    tasks = start_tasks + github_tasks + git_tasks + materialized_view_tasks
+    tasks = start_tasks + github_tasks + git_tasks + materialized_view_tasks + report_tasks
 
 redis_db_number, redis_conn_string = get_redis_conn_values()
 
@@ -51,11 +55,54 @@ redis_db_number, redis_conn_string = get_redis_conn_values()
 BROKER_URL = f'{redis_conn_string}{redis_db_number}'
 BACKEND_URL = f'{redis_conn_string}{redis_db_number+1}'
 
-celery_app = Celery('tasks', broker=BROKER_URL, backend=BACKEND_URL, include=tasks)
+# times a task is queued again for a RetryableError before it fails
+RETRYABLE_MAX_RETRIES = 10
+
+
+class AugurTask(Task):
+    """Base class of the augur tasks that queues a task again when it raises a RetryableError
+
+    The task is retried with the countdown the error carries, plus up to 10% so tasks that 
+    hit the same limit don't all start at once, and the retry is counted in the task retry stats.
+
+    The statements the task executes are attributed to it and to the repo it collects, 
+    and their totals are recorded when it ends (see augur.application.db.instrumentation).
+    """
+
+    def __call__(self, *args, **kwargs):
+
+        from augur.tasks.util.retry import RetryableError, record_task_retry
+
+        with query_context(task=self.name, repo=get_task_repo(args, kwargs)) as context:
+            try:
+                return super().__call__(*args, **kwargs)
+            except RetryableError as e:
+
+                countdown = e.countdown + random.randint(0, max(e.countdown // 10, 1))
+
+                logger.warning(f"Retrying {self.name} in {countdown} seconds ({e.reason}): {e}")
+                record_task_retry(self.name, e)
+
+                raise self.retry(exc=e, countdown=countdown, max_retries=RETRYABLE_MAX_RETRIES)
+            finally:
+                record_task_query_summary(context, logging.getLogger(self.name))
+
+
+def get_task_repo(args, kwargs):
+    """Get the repo a task collects, the collection tasks get the git url of the repo as their first argument"""
+
+    repo_git = kwargs.get("repo_git", args[0] if args else None)
+
+    return repo_git if isinstance(repo_git, str) and "://" in repo_git else None
+
+
+celery_app = Celery('tasks', broker=BROKER_URL, backend=BACKEND_URL, include=tasks, task_cls=AugurTask)
 
 # define the queues that tasks will be put in (by default tasks are put in celery queue)
 celery_app.conf.task_routes = {
-    'augur.tasks.git.facade_tasks.*': {'queue': 'cpu'}
+    'augur.tasks.git.facade_tasks.*': {'queue': 'cpu'},
+    # rendering drives a headless browser, which does not work in the eventlet pool
+    'augur.tasks.reports.tasks.render_report_image': {'queue': 'cpu'}
 }
 
 #Setting to be able to see more detailed states of running tasks
@@ -132,22 +179,40 @@ def setup_loggers(*args,**kwargs):
     
     TaskLogConfig(split_tasks_into_groups(augur_tasks))
 
+    # writes the sampled slow statements of the tasks to their own log file
+    AugurLogger(SLOW_QUERY_LOGGER)
 
+
+# the engine the tasks of a worker process share, it is created when a prefork worker process starts.
+# Modules that import it before that get None, their sessions use the same engine through get_database_engine
 engine = None
+
+
+@worker_init.connect
+def size_database_pool(sender=None, **kwargs):
+    """Size the database pool of the worker processes for the tasks each of them runs at once"""
+
+    # the green and thread pools run every task in the worker process, the prefork and solo pools one task per process
+    pool_module = getattr(sender.pool_cls, "__module__", str(sender.pool_cls))
+    if pool_module.endswith(("eventlet", "gevent", "thread")):
+        set_worker_concurrency(sender.concurrency)
+    else:
+        set_worker_concurrency(1)
+
+
 @worker_process_init.connect
 def init_worker(**kwargs):
 
     global engine
 
-    from augur.application.db.engine import create_database_engine
-
-    engine = create_database_engine()
+    engine = get_database_engine()
 
 
 @worker_process_shutdown.connect
 def shutdown_worker(**kwargs):
-    global engine
-    if engine:
-        logger.info('Closing database connectionn for worker')
-        engine.dispose()
+
+    from augur.application.db.engine import get_pool_stats, dispose_database_engine
+
+    logger.info(f'Closing database connections for worker, pool stats: {get_pool_stats()}')
+    dispose_database_engine()
 
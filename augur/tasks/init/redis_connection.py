@@ -5,3 +5,6 @@ from augur.tasks.init import get_redis_conn_values
 redis_db_number, redis_conn_string = get_redis_conn_values()
 
 redis_connection= redis.from_url(f'{redis_conn_string}{redis_db_number+2}', decode_responses=True)
+
+# connection for values that are not text, like the arrow and parquet bodies in the metric cache
+redis_binary_connection = redis.from_url(f'{redis_conn_string}{redis_db_number+2}', decode_responses=False)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import os
+import logging
+import tempfile
+
+import httpx
+
+from augur.tasks.init.celery_app import celery_app as celery
+from augur.application.db.session import DatabaseSession
+from augur.application.db.models import Repo
+from augur.tasks.util.repo_data_versions import get_data_versions, repo_field
+from augur.tasks.util.report_images import store_report_image, finish_rendering, get_prerendered_versions, record_prerendered_versions
+
+AUGUR_API_VERSION = 'api/unstable'
+
+# report endpoints whose default images are rendered after collection
+PRERENDERED_REPORT_ENDPOINTS = [
+    'pull_request_reports/average_commits_per_PR/',
+    'pull_request_reports/average_comments_per_PR/',
+    'pull_request_reports/PR_counts_by_merged_status/',
+    'pull_request_reports/mean_response_times_for_PR/',
+    'pull_request_reports/mean_days_between_PR_comments/',
+    'pull_request_reports/PR_time_to_first_response/',
+    'pull_request_reports/average_PR_events_for_closed_PRs/',
+    'pull_request_reports/Average_PR_duration/',
+    'contributor_reports/new_contributors_bar/',
+    'contributor_reports/new_contributors_stacked_bar/',
+    'contributor_reports/returning_contributors_pie_chart/',
+    'contributor_reports/returning_contributors_stacked_bar/'
+]
+
+
+@celery.task
+def render_report_image(image_id: str, document_json: str) -> None:
+    """Render the bokeh document of a report endpoint to a png with a headless browser and store it"""
+
+    logger = logging.getLogger(render_report_image.__name__)
+
+    # bokeh is only needed by the workers that render images
+    from bokeh.document import Document
+    from bokeh.io import export_png
+
+    try:
+        document = Document.from_json_string(document_json)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = export_png(document.roots[0], filename=os.path.join(directory, "report.png"), timeout=180)
+
+            with open(filename, "rb") as image_file:
+                png = image_file.read()
+
+        store_report_image(image_id, png)
+        logger.info(f"Rendered report image {image_id}")
+    finally:
+        finish_rendering(image_id)
+
+
+@celery.task
+def prerender_report_images() -> None:
+    """Request the default report images of the repos whose data changed since their images were last prerendered"""
+
+    logger = logging.getLogger(prerender_report_images.__name__)
+
+    with DatabaseSession(logger) as session:
+
+        host = session.config.get_value("Server", "host")
+        port = session.config.get_value("Server", "port")
+
+        repo_ids = [repo_id for repo_id, in session.query(Repo.repo_id).all()]
+
+    # the server listens on every interface when the host is 0.0.0.0
+    if host == "0.0.0.0":
+        host = "127.0.0.1"
+
+    base_url = f"http://{host}:{port}/{AUGUR_API_VERSION}"
+
+    data_versions = get_data_versions(repo_ids=repo_ids)
+    prerendered_versions = get_prerendered_versions(data_versions)
+
+    # the images of a repo are only requested again when collection bumped its data version
+    changed_repo_ids = [repo_id for repo_id in repo_ids
+                        if data_versions[repo_field(repo_id)] is not None
+                        and data_versions[repo_field(repo_id)] != prerendered_versions[repo_field(repo_id)]]
+
+    logger.info(f"Prerendering the report images of {len(changed_repo_ids)} of {len(repo_ids)} repos whose data changed")
+
+    with httpx.Client(timeout=60) as client:
+        for repo_id in changed_repo_ids:
+
+            prerendered = True
+            for endpoint in PRERENDERED_REPORT_ENDPOINTS:
+
+                # on a miss the api runs the report query and builds the bokeh layout before it queues the render,
+                # so each request takes as long as an uncached report
+                try:
+                    client.get(f"{base_url}/{endpoint}", params={"repo_id": repo_id})
+                except httpx.HTTPError as e:
+                    prerendered = False
+                    logger.warning(f"Unable to request {endpoint} for repo {repo_id}: {e}")
+
+            if prerendered:
+                record_prerendered_versions({repo_field(repo_id): data_versions[repo_field(repo_id)]})
@@ -16,11 +16,13 @@ if os.environ.get('AUGUR_DOCKER_DEPLOY') != "1":
     from augur.tasks.data_analysis import *
 from augur.tasks.github.detect_move.tasks import detect_github_repo_move
 from augur.tasks.github.releases.tasks import collect_releases
-from augur.tasks.github.repo_info.tasks import collect_repo_info
+from augur.tasks.github.repo_info.tasks import collect_repo_info, collect_repo_info_batch
+from augur.tasks.github.repo_info.core import REPO_INFO_BATCH_SIZE
 from augur.tasks.github.pull_requests.files_model.tasks import process_pull_request_files
 from augur.tasks.github.pull_requests.commits_model.tasks import process_pull_request_commits
 from augur.tasks.git.facade_tasks import *
 from augur.tasks.db.refresh_materialized_views import *
+from augur.tasks.reports.tasks import prerender_report_images
 # from augur.tasks.data_analysis import *
 from augur.tasks.init.celery_app import celery_app as celery
 from celery.result import allow_join_result
@@ -65,8 +67,9 @@ def repo_collect_phase():
     with DatabaseSession(logger) as session:
         query = session.query(Repo)
         repos = execute_session_query(query, 'all')
-        #Just use list comprehension for simple group
-        repo_info_tasks = [collect_repo_info.si(repo.repo_git) for repo in repos]
+        #One task collects the repo info of a whole batch of repos with a single graphql query
+        repo_gits = [repo.repo_git for repo in repos]
+        repo_info_tasks = [collect_repo_info_batch.si(repo_gits[i:i + REPO_INFO_BATCH_SIZE]) for i in range(0, len(repo_gits), REPO_INFO_BATCH_SIZE)]
 
         for repo in repos:
             first_tasks_repo = group(collect_issues.si(repo.repo_git),collect_pull_requests.si(repo.repo_git))
@@ -82,8 +85,14 @@ def repo_collect_phase():
             generate_facade_chain(logger),
             collect_releases.si()
         )
+
+        post_collection_tasks = [refresh_materialized_views.si()]
+
+        #Render the report images of the new data before anyone asks for them
+        if session.config.get_value("Server", "prerender_report_images"):
+            post_collection_tasks.append(prerender_report_images.si())
     
-    chain(repo_task_group, refresh_materialized_views.si()).apply_async()
+    chain(repo_task_group, *post_collection_tasks).apply_async()
 
 
 DEFINED_COLLECTION_PHASES = [prelim_phase, repo_collect_phase]
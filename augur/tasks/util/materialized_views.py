@@ -0,0 +1,323 @@
+"""This module refreshes the materialized views that the api reads.
+
+The views are refreshed in the order of their dependencies on each other, and the views that don't depend on
+each other are refreshed in parallel. A view is skipped if none of the tables it reads were written to since
+its last refresh, which is told by the write counters postgres keeps per table (pg_stat_user_tables).
+Views with a unique index are refreshed CONCURRENTLY, so the api can keep reading them while they are refreshed.
+
+The refresh stats are kept in a stats hash (see augur.tasks.util.redis_stats) that the api reads.
+"""
+import time
+import logging
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+
+import sqlalchemy as s
+from redis import exceptions
+
+from augur.tasks.init.redis_connection import redis_connection as redis
+from augur.tasks.util.redis_stats import increment_stats, set_stats, get_stats
+
+
+MATERIALIZED_VIEWS = [
+    "augur_data.api_get_all_repos_issues",
+    "augur_data.explorer_commits_and_committers_daily_count",
+    "augur_data.api_get_all_repos_commits",
+    "augur_data.augur_new_contributors",
+    "augur_data.explorer_contributor_actions",
+    "augur_data.explorer_libyear_all",
+    "augur_data.explorer_libyear_detail",
+    "augur_data.explorer_new_contributors",
+    "augur_data.explorer_libyear_summary"
+]
+
+MATERIALIZED_VIEW_REFRESH_KEY = "materialized_view_refresh"
+
+DEFAULT_REFRESH_WORKERS = 4
+
+REFRESHED = "refreshed"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+def get_refresh_levels(dependencies: Dict[str, Set[str]]) -> List[List[str]]:
+    """Group views into levels that can be refreshed in parallel
+
+    Args:
+        dependencies: maps each view to the views it reads, views outside of the dict are ignored
+
+    Returns:
+        list of levels, every view comes after the views it reads
+
+    Raises:
+        ValueError: if the views depend on each other in a cycle
+    """
+
+    remaining = {view: {dependency for dependency in view_dependencies if dependency in dependencies and dependency != view}
+                 for view, view_dependencies in dependencies.items()}
+
+    levels = []
+    while remaining:
+
+        level = sorted(view for view, view_dependencies in remaining.items() if not view_dependencies)
+        if not level:
+            raise ValueError(f"The materialized views {sorted(remaining)} depend on each other in a cycle")
+
+        levels.append(level)
+
+        for view in level:
+            del remaining[view]
+
+        for view_dependencies in remaining.values():
+            view_dependencies.difference_update(level)
+
+    return levels
+
+
+def get_view_info(connection, views: Iterable[str]) -> Dict[str, dict]:
+    """Get whether the views are populated and can be refreshed concurrently
+
+    Args:
+        connection: database connection
+        views: schema qualified names of the views
+
+    Returns:
+        dict that maps the views that exist to a dict with their populated and concurrent flags
+    """
+
+    # CONCURRENTLY needs a unique index on plain columns that covers all rows
+    info_sql = s.sql.text("""
+        SELECT schemaname || '.' || matviewname AS view, ispopulated AS populated,
+            EXISTS (
+                SELECT 1 FROM pg_index
+                WHERE indrelid = CAST(quote_ident(schemaname) || '.' || quote_ident(matviewname) AS regclass)
+                    AND indisunique AND indpred IS NULL AND indexprs IS NULL
+            ) AS concurrent
+        FROM pg_matviews
+        WHERE schemaname || '.' || matviewname = ANY(:views)
+    """)
+
+    return {row.view: {"populated": row.populated, "concurrent": row.concurrent}
+            for row in connection.execute(info_sql, views=list(views))}
+
+
+def get_view_sources(connection, views: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """Get the tables and materialized views each view reads, following the plain views it reads
+
+    Args:
+        connection: database connection
+        views: schema qualified names of the views
+
+    Returns:
+        dict that maps each view to a dict that maps its sources to their relkind
+    """
+
+    sources_sql = s.sql.text("""
+        WITH RECURSIVE sources AS (
+                SELECT ev_class AS view_oid, ev_class AS relation_oid, 0 AS depth
+                FROM pg_rewrite
+                WHERE ev_class = ANY(CAST(:views AS regclass[]))
+            UNION
+                SELECT sources.view_oid, pg_depend.refobjid, sources.depth + 1
+                FROM sources
+                    JOIN pg_class relation ON relation.oid = sources.relation_oid
+                    JOIN pg_rewrite ON pg_rewrite.ev_class = sources.relation_oid
+                    JOIN pg_depend ON pg_depend.objid = pg_rewrite.oid
+                        AND pg_depend.classid = CAST('pg_rewrite' AS regclass)
+                        AND pg_depend.refclassid = CAST('pg_class' AS regclass)
+                WHERE pg_depend.refobjid != sources.relation_oid
+                    AND (sources.depth = 0 OR relation.relkind = 'v')
+        )
+        SELECT DISTINCT view_namespace.nspname || '.' || view_class.relname AS view,
+            source_namespace.nspname || '.' || source_class.relname AS source,
+            source_class.relkind AS kind
+        FROM sources
+            JOIN pg_class view_class ON view_class.oid = sources.view_oid
+            JOIN pg_namespace view_namespace ON view_namespace.oid = view_class.relnamespace
+            JOIN pg_class source_class ON source_class.oid = sources.relation_oid
+            JOIN pg_namespace source_namespace ON source_namespace.oid = source_class.relnamespace
+        WHERE sources.depth > 0 AND source_class.relkind IN ('r', 'p', 'm')
+    """)
+
+    sources = {view: {} for view in views}
+    for row in connection.execute(sources_sql, views=list(views)):
+        sources[row.view][row.source] = row.kind
+
+    return sources
+
+
+def get_write_counts(connection, tables: Iterable[str]) -> Dict[str, int]:
+    """Get the number of rows that were inserted, updated and deleted in tables since the statistics were reset
+
+    The counts of partitioned tables are the sums of the counts of their partitions.
+
+    Args:
+        connection: database connection
+        tables: schema qualified names of the tables
+
+    Returns:
+        dict that maps each table to its write count
+    """
+
+    counts_sql = s.sql.text("""
+        SELECT parent_namespace.nspname || '.' || parent.relname AS table_name,
+            COALESCE(SUM(stats.n_tup_ins + stats.n_tup_upd + stats.n_tup_del), 0) AS writes
+        FROM pg_class parent
+            JOIN pg_namespace parent_namespace ON parent_namespace.oid = parent.relnamespace
+            LEFT JOIN pg_inherits ON pg_inherits.inhparent = parent.oid
+            JOIN pg_stat_user_tables stats ON stats.relid = COALESCE(pg_inherits.inhrelid, parent.oid)
+        WHERE parent.oid = ANY(CAST(:tables AS regclass[]))
+        GROUP BY parent_namespace.nspname, parent.relname
+    """)
+
+    tables = list(tables)
+    if not tables:
+        return {}
+
+    return {row.table_name: int(row.writes) for row in connection.execute(counts_sql, tables=tables)}
+
+
+def get_last_refresh_writes(views: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Get the write counts of the sources of views at their last refresh
+
+    Returns:
+        dict that maps each view to the write count, None if it is unknown
+    """
+
+    views = list(views)
+    if not views:
+        return {}
+
+    try:
+        values = redis.hmget(MATERIALIZED_VIEW_REFRESH_KEY, [f"{view}:writes" for view in views])
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get the write counts of the last materialized view refreshes: {e}")
+        return {view: None for view in views}
+
+    return {view: int(value) if value is not None else None for view, value in zip(views, values)}
+
+
+def record_refresh(view: str, writes: int, duration: float) -> None:
+
+    set_stats(MATERIALIZED_VIEW_REFRESH_KEY, view, {
+        "writes": writes,
+        "duration": round(duration, 3),
+        "refreshed_at": int(time.time())
+    })
+    increment_stats(MATERIALIZED_VIEW_REFRESH_KEY, view, {"refreshes": 1})
+
+
+def record_skip(view: str) -> None:
+
+    increment_stats(MATERIALIZED_VIEW_REFRESH_KEY, view, {"skips": 1})
+
+
+def get_materialized_view_stats() -> Dict[str, Dict[str, float]]:
+    """Get the duration of the last refresh, when it happened and how often each view was refreshed and skipped
+
+    Returns:
+        dict that maps each view to its stats
+    """
+
+    return get_stats(MATERIALIZED_VIEW_REFRESH_KEY, float_stats=("duration",))
+
+
+def refresh_view(engine, view: str, concurrent: bool) -> float:
+    """Refresh a materialized view
+
+    Args:
+        engine: database engine
+        view: schema qualified name of the view
+        concurrent: whether the view is refreshed without blocking its readers
+
+    Returns:
+        seconds the refresh took
+    """
+
+    schema, name = view.split(".", 1)
+
+    refresh_sql = s.sql.text(f'REFRESH MATERIALIZED VIEW {"CONCURRENTLY " if concurrent else ""}"{schema}"."{name}" WITH DATA')
+
+    start = time.perf_counter()
+
+    with engine.begin() as connection:
+        connection.execute(refresh_sql)
+
+    return time.perf_counter() - start
+
+
+def refresh_materialized_views(engine, views: List[str] = MATERIALIZED_VIEWS, workers: int = DEFAULT_REFRESH_WORKERS, force: bool = False) -> Dict[str, dict]:
+    """Refresh the materialized views whose sources changed since their last refresh
+
+    Args:
+        engine: database engine
+        views: schema qualified names of the views
+        workers: number of views that are refreshed at the same time
+        force: refresh the views even if their sources didn't change
+
+    Returns:
+        dict that maps each view to its status, whether it was refreshed concurrently and the seconds the refresh took
+    """
+
+    with engine.connect() as connection:
+
+        view_info = get_view_info(connection, views)
+
+        for view in views:
+            if view not in view_info:
+                logger.warning(f"Skipping the refresh of {view} because it doesn't exist")
+
+        if not view_info:
+            return {}
+
+        sources = get_view_sources(connection, view_info)
+
+        tables = {source for view_sources in sources.values() for source in view_sources}
+        write_counts = get_write_counts(connection, tables)
+
+    last_refresh_writes = get_last_refresh_writes(view_info)
+
+    dependencies = {view: set(view_sources) for view, view_sources in sources.items()}
+    levels = get_refresh_levels(dependencies)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+
+        for level in levels:
+
+            futures = {}
+            for view in level:
+
+                writes = sum(write_counts.get(source, 0) for source in sources[view])
+                # a view has to be refreshed after the views it reads were refreshed
+                dependency_refreshed = any(results.get(dependency, {}).get("status") == REFRESHED for dependency in dependencies[view])
+                # CONCURRENTLY can't be used until the view was populated once
+                concurrent = view_info[view]["concurrent"] and view_info[view]["populated"]
+
+                if not force and not dependency_refreshed and view_info[view]["populated"] and writes == last_refresh_writes[view]:
+                    logger.info(f"Skipping the refresh of {view} because its sources didn't change")
+                    record_skip(view)
+                    results[view] = {"status": SKIPPED, "concurrent": concurrent, "duration": 0}
+                    continue
+
+                # the context is copied so the statements stay attributed to the task
+                futures[view] = (executor.submit(contextvars.copy_context().run, refresh_view, engine, view, concurrent), writes, concurrent)
+
+            for view, (future, writes, concurrent) in futures.items():
+
+                try:
+                    duration = future.result()
+                except s.exc.SQLAlchemyError as e:
+                    logger.error(f"Unable to refresh {view}: {e}")
+                    results[view] = {"status": FAILED, "concurrent": concurrent, "duration": 0}
+                    continue
+
+                logger.info(f"Refreshed {view}{' concurrently' if concurrent else ''} in {duration:.2f} seconds")
+                record_refresh(view, writes, duration)
+                results[view] = {"status": REFRESHED, "concurrent": concurrent, "duration": duration}
+
+    return results
@@ -1,5 +1,7 @@
 """This module defines the RandomKeyAuth class"""
-from typing import List, Optional, Generator
+import time
+
+from typing import Dict, List, Optional, Generator
 
 from httpx import Auth, Request, Response
 from random import choice
@@ -13,6 +15,7 @@ class RandomKeyAuth(Auth):
         list_of_keys ([str]): list of keys which are randomly selected from on each request
         header_name (str): name of header that the keys need to be set to 
         key_format (str): format string that defines the structure of the key and leaves a {} for the key to be inserted
+        key_resets (Dict[str, int]): epoch at which the rate limit of each exhausted key resets
     """
     
     # pass a list of keys that are strings
@@ -25,6 +28,7 @@ class RandomKeyAuth(Auth):
         self.header_name = header_name
         self.key_format = key_format
         self.logger = logger
+        self.key_resets: Dict[str, int] = {}
 
     def auth_flow(self, request: Request) -> Generator[Request, Response, None]:
 
@@ -32,7 +36,8 @@ class RandomKeyAuth(Auth):
         # this gets a random key from the list
         
         if self.list_of_keys:
-            key_value = choice(self.list_of_keys)
+            # keys whose rate limit is exceeded are only used when every key is exhausted
+            key_value = choice(self.get_available_keys() or self.list_of_keys)
 
             # formats the key string into a format GitHub will accept
 
@@ -50,3 +55,40 @@ class RandomKeyAuth(Auth):
         # sends the request back with modified headers
         # basically it saves our changes to the request object
         yield request
+
+    def get_available_keys(self) -> List[str]:
+        """Get the keys whose rate limit is not exceeded"""
+
+        now = time.time()
+
+        return [key for key in self.list_of_keys if self.key_resets.get(key, 0) <= now]
+
+    def mark_key_exhausted(self, request: Request, reset_epoch: int) -> bool:
+        """Stop using the key of a request until its rate limit resets
+
+        Args:
+            request: request whose key exceeded its rate limit
+            reset_epoch: epoch at which the rate limit of the key resets
+
+        Returns:
+            whether the key of the request is one of the keys
+        """
+
+        key_string = request.headers.get(self.header_name)
+
+        for key in self.list_of_keys:
+            if (self.key_format.format(key) if self.key_format else key) == key_string:
+                self.key_resets[key] = reset_epoch
+                return True
+
+        return False
+
+    def get_seconds_until_key_resets(self) -> int:
+        """Get how long it takes until the first exhausted key can be used again"""
+
+        resets = [self.key_resets[key] for key in self.list_of_keys if key in self.key_resets]
+
+        if not resets:
+            return 0
+
+        return max(int(min(resets) - time.time()), 0)
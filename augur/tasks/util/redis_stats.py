@@ -0,0 +1,90 @@
+"""This module keeps counters that the celery workers and the api record in shared redis hashes.
+
+Each stats hash has a <name>:<stat> field per stat of a name, like the retries of a task or the refreshes of
+a materialized view, and get_stats groups the fields by name again.
+
+Note:
+    Unlike RedisList the hashes are not prefixed with the instance_id, so every process of an instance
+    adds to and reads the same counters. Different augur instances on one redis server already use
+    different databases (see Redis.cache_group).
+"""
+import logging
+
+from typing import Dict, Iterable, Optional, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+def increment_stats(key: str, name: str, stats: Dict[str, Union[int, float]], expire: Optional[int] = None) -> None:
+    """Add to the stats of a name in a stats hash
+
+    Args:
+        key: key of the stats hash
+        name: name the stats belong to
+        stats: maps each stat to the amount it is increased by, floats are added as floats
+        expire: seconds the hash is kept after this write, None keeps it until it is deleted
+    """
+
+    # imported here because the redis connection reads the config through the database modules that record stats
+    from redis import exceptions
+    from augur.tasks.init.redis_connection import redis_connection as redis
+
+    try:
+        pipeline = redis.pipeline()
+
+        for stat, amount in stats.items():
+            if isinstance(amount, float):
+                pipeline.hincrbyfloat(key, f"{name}:{stat}", amount)
+            else:
+                pipeline.hincrby(key, f"{name}:{stat}", amount)
+
+        if expire is not None:
+            pipeline.expire(key, expire)
+
+        pipeline.execute()
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to record the stats of {name} in {key}: {e}")
+
+
+def set_stats(key: str, name: str, stats: Dict[str, Union[int, float]]) -> None:
+    """Overwrite the stats of a name in a stats hash, for values like the duration of the last run
+
+    Args:
+        key: key of the stats hash
+        name: name the stats belong to
+        stats: maps each stat to its new value
+    """
+
+    from redis import exceptions
+    from augur.tasks.init.redis_connection import redis_connection as redis
+
+    try:
+        redis.hset(key, mapping={f"{name}:{stat}": value for stat, value in stats.items()})
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to record the stats of {name} in {key}: {e}")
+
+
+def get_stats(key: str, float_stats: Iterable[str] = ()) -> Dict[str, Dict[str, Union[int, float]]]:
+    """Get the stats of every name in a stats hash
+
+    Args:
+        key: key of the stats hash
+        float_stats: stats that are floats, the others are ints
+
+    Returns:
+        dict that maps each name to its stats
+    """
+
+    from augur.tasks.init.redis_connection import redis_connection as redis
+
+    float_stats = set(float_stats)
+
+    stats = {}
+    for field, value in redis.hgetall(key).items():
+
+        name, stat = field.rsplit(":", 1)
+
+        stats.setdefault(name, {})[stat] = float(value) if stat in float_stats else int(value)
+
+    return stats
@@ -0,0 +1,224 @@
+"""This module maintains the repo_daily_activity rollup table.
+
+Each collection task that changes the issues, pull requests, issue events or commits of a repo recomputes the
+days of that repo whose counts it changed, so the timeseries metrics only aggregate days instead of scanning the
+raw rows. A task reads the days its rows are currently counted on before it inserts them, and the days that
+differ from the collected data are the ones that are recomputed.
+
+Note:
+    First time openers and pull requests closed or merged are not rolled up. The first time metrics count the
+    first issue of a person within the requested range, and the closed and merged pull request metrics filter on
+    the creation date, so daily counts can't answer them. They still query the raw tables.
+"""
+import datetime
+import logging
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import sqlalchemy as s
+
+
+ISSUES = "issues"
+PULL_REQUESTS = "pull_requests"
+ISSUE_EVENTS = "issue_events"
+COMMITS = "commits"
+
+# the column that identifies a row of each raw table within its repo, and the date columns its days are counted by
+DAILY_ACTIVITY_DATES = {
+    ISSUES: ("gh_issue_id", ["created_at", "closed_at"]),
+    PULL_REQUESTS: ("pr_src_id", ["pr_created_at"]),
+    ISSUE_EVENTS: ("issue_event_src_id", ["created_at"]),
+    COMMITS: ("cmt_commit_hash", ["cmt_author_date"])
+}
+
+# maps each raw table to the queries that count the given days of it, and the columns of repo_daily_activity they fill
+DAILY_ACTIVITY_QUERIES = {
+    ISSUES: [
+        ("""
+            SELECT created_at::DATE AS day, COUNT(*) AS issues_opened
+            FROM augur_data.issues
+            WHERE repo_id = :repo_id AND pull_request IS NULL
+                AND created_at >= :first_day AND created_at::DATE = ANY(:days)
+            GROUP BY day
+        """, ["issues_opened"]),
+        ("""
+            SELECT closed_at::DATE AS day, COUNT(*) AS issues_closed
+            FROM augur_data.issues
+            WHERE repo_id = :repo_id AND pull_request IS NULL
+                AND closed_at >= :first_day AND closed_at::DATE = ANY(:days)
+            GROUP BY day
+        """, ["issues_closed"])
+    ],
+    PULL_REQUESTS: [
+        ("""
+            SELECT pr_created_at::DATE AS day, COUNT(*) AS pull_requests_opened
+            FROM augur_data.pull_requests
+            WHERE repo_id = :repo_id
+                AND pr_created_at >= :first_day AND pr_created_at::DATE = ANY(:days)
+            GROUP BY day
+        """, ["pull_requests_opened"])
+    ],
+    ISSUE_EVENTS: [
+        ("""
+            SELECT issue_events.created_at::DATE AS day, COUNT(*) AS issue_events
+            FROM augur_data.issue_events JOIN augur_data.issues ON issues.issue_id = issue_events.issue_id
+            WHERE issues.repo_id = :repo_id AND issues.pull_request IS NULL
+                AND issue_events.created_at >= :first_day AND issue_events.created_at::DATE = ANY(:days)
+            GROUP BY day
+        """, ["issue_events"])
+    ],
+    COMMITS: [
+        # the commits table has a row per file of a commit, and stores the author date as text
+        ("""
+            SELECT cmt_author_date::DATE AS day,
+                COUNT(DISTINCT cmt_commit_hash) AS commits,
+                COALESCE(SUM(cmt_added), 0) AS lines_added,
+                COALESCE(SUM(cmt_removed), 0) AS lines_removed
+            FROM augur_data.commits
+            WHERE repo_id = :repo_id AND cmt_author_date::DATE = ANY(:days)
+            GROUP BY day
+        """, ["commits", "lines_added", "lines_removed"])
+    ]
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_activity_dates(session, repo_id: int, table: str, keys: Optional[List[Any]] = None) -> Dict[Any, Tuple[Optional[datetime.date], ...]]:
+    """Get the days the rows of a repo are currently counted on
+
+    Args:
+        session: database session of the collection task
+        repo_id: id of the repo
+        table: raw table, one of DAILY_ACTIVITY_DATES
+        keys: only get the rows with these keys, usually the keys of the collected rows. Defaults to every row of the repo
+
+    Returns:
+        dict that maps the key of each row to its days, in the order of the date columns
+    """
+
+    key, date_columns = DAILY_ACTIVITY_DATES[table]
+
+    dates_sql = s.sql.text(f"""
+        SELECT DISTINCT "{key}", {", ".join(f'"{column}"::DATE' for column in date_columns)}
+        FROM augur_data."{table}"
+        WHERE repo_id = :repo_id {f'AND "{key}" = ANY(:keys)' if keys is not None else ""}
+    """)
+
+    params = {"repo_id": repo_id}
+    if keys is not None:
+        params["keys"] = list(keys)
+
+    with session.engine.connect() as connection:
+        rows = connection.execute(dates_sql, **params).fetchall()
+
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def get_activity_days(session, repo_id: int, table: str, keys: List[Any]) -> Set[datetime.date]:
+    """Get the days that rows of a repo are counted on, for rows that are about to be removed or were just added
+
+    Args:
+        session: database session of the collection task
+        repo_id: id of the repo
+        table: raw table, one of DAILY_ACTIVITY_DATES
+        keys: keys of the rows
+
+    Returns:
+        set of the days
+    """
+
+    if not keys:
+        return set()
+
+    return {day for days in get_activity_dates(session, repo_id, table, keys).values() for day in days if day is not None}
+
+
+def changed_activity_days(table: str, old_dates: Dict[Any, Tuple[Optional[datetime.date], ...]], rows: Iterable[dict]) -> Set[datetime.date]:
+    """Get the days whose counts change when the collected rows are inserted
+
+    A day changes when a new row is counted on it, or when a row moves to or from it.
+
+    Args:
+        table: raw table, one of DAILY_ACTIVITY_DATES
+        old_dates: days the rows are counted on before the insert, as returned by get_activity_dates
+        rows: collected rows that are inserted into the table
+
+    Returns:
+        set of the changed days
+    """
+
+    key, date_columns = DAILY_ACTIVITY_DATES[table]
+
+    days = set()
+    for row in rows:
+
+        new_days = tuple(_to_day(row.get(column)) for column in date_columns)
+        old_days = old_dates.get(row[key], (None,) * len(date_columns))
+
+        for old_day, new_day in zip(old_days, new_days):
+            if old_day != new_day:
+                days.update(day for day in (old_day, new_day) if day is not None)
+
+    return days
+
+
+def update_repo_daily_activity(session, repo_id: int, table: str, days: Iterable[datetime.date]) -> None:
+    """Recompute the daily counts of a repo that come from one raw table on the given days
+
+    The counts of the days are reset and rewritten in one transaction, so the metrics never see a partially updated day.
+
+    Args:
+        session: database session of the collection task
+        repo_id: id of the repo that was collected
+        table: raw table that changed, one of ISSUES, PULL_REQUESTS, ISSUE_EVENTS or COMMITS
+        days: days whose counts changed, see changed_activity_days
+    """
+
+    days = sorted(set(days))
+    if not days:
+        logger.info(f"The daily {table} activity of repo {repo_id} didn't change")
+        return
+
+    queries = DAILY_ACTIVITY_QUERIES[table]
+    columns = [column for _, query_columns in queries for column in query_columns]
+
+    reset_sql = s.sql.text(f"""
+        UPDATE augur_data.repo_daily_activity
+        SET {", ".join(f"{column} = 0" for column in columns)}
+        WHERE repo_id = :repo_id AND day = ANY(:days)
+    """)
+
+    with session.engine.begin() as connection:
+
+        connection.execute(reset_sql, repo_id=repo_id, days=days)
+
+        for query, query_columns in queries:
+
+            upsert_sql = s.sql.text(f"""
+                INSERT INTO augur_data.repo_daily_activity (repo_id, day, {", ".join(query_columns)})
+                SELECT :repo_id, day, {", ".join(query_columns)}
+                FROM ({query}) counts
+                ON CONFLICT (repo_id, day) DO UPDATE SET
+                    {", ".join(f"{column} = EXCLUDED.{column}" for column in query_columns)},
+                    data_collection_date = CURRENT_TIMESTAMP
+            """)
+
+            connection.execute(upsert_sql, repo_id=repo_id, days=days, first_day=days[0])
+
+    logger.info(f"Updated the daily {table} activity of repo {repo_id} on {len(days)} days")
+
+
+def _to_day(value) -> Optional[datetime.date]:
+    """Get the day of a collected timestamp, which is either an iso formatted string or a datetime"""
+
+    if not value:
+        return None
+
+    if isinstance(value, datetime.datetime):
+        return value.date()
+
+    if isinstance(value, datetime.date):
+        return value
+
+    return datetime.date.fromisoformat(str(value)[:10])
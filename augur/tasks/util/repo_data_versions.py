@@ -0,0 +1,149 @@
+"""This module keeps a data version counter per repo in redis.
+
+Collection tasks bump the version of a repo (and of its repo group) whenever they commit new data for it,
+so caches that include the versions of the repos they cover are invalidated exactly when the data changes.
+With every bump the wal position of the primary is recorded as well, so a read replica can be checked for having
+replayed the data of the current versions before a result read from it is cached under them.
+
+Note:
+    Unlike RedisList the keys are not prefixed with the instance_id, the celery workers and the
+    gunicorn workers are started as separate processes and need to see the same counters.
+    Different augur instances on one redis server already use different databases (see Redis.cache_group).
+"""
+import logging
+
+from typing import Iterable, Dict, Optional
+
+import sqlalchemy as s
+from redis import exceptions
+
+from augur.tasks.init.redis_connection import redis_connection as redis
+
+
+REPO_DATA_VERSIONS_KEY = "repo_data_versions"
+REPO_DATA_LSNS_KEY = "repo_data_lsns"
+
+# the wal positions are stored as zero padded hex, so the greater one is also the greater string
+LSN_FORMAT = "{:016X}"
+
+# recorded when the wal position of the primary can't be read, no replica ever replays up to it
+UNKNOWN_LSN = "F" * 16
+
+# only raises the recorded wal position, a bump that read its position earlier may finish later
+RECORD_LSN_SCRIPT = """
+for i, field in ipairs(ARGV) do
+    if i > 1 then
+        local current = redis.call('HGET', KEYS[1], field)
+        if not current or current < ARGV[1] then
+            redis.call('HSET', KEYS[1], field, ARGV[1])
+        end
+    end
+end
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def repo_field(repo_id) -> str:
+    return f"repo:{repo_id}"
+
+
+def repo_group_field(repo_group_id) -> str:
+    return f"repo_group:{repo_group_id}"
+
+
+def bump_repo_data_version(session, repo_id: int) -> None:
+    """Bump the data version of a repo and of the repo group it belongs to
+
+    Args:
+        session: database session used to look up the repo group of the repo
+        repo_id: id of the repo that new data was committed for
+    """
+
+    from augur.application.db.models import Repo
+
+    repo_group_id = session.query(Repo.repo_group_id).filter(Repo.repo_id == repo_id).scalar()
+
+    fields = [repo_field(repo_id)]
+    if repo_group_id is not None:
+        fields.append(repo_group_field(repo_group_id))
+
+    # the data was committed before the bump, so the current wal position of the primary is past it
+    try:
+        lsn = LSN_FORMAT.format(int(session.execute(s.sql.text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")).scalar()))
+    except s.exc.SQLAlchemyError as e:
+        logger.error(f"Unable to get the wal position of the primary for repo {repo_id}: {e}")
+        lsn = UNKNOWN_LSN
+
+    _bump(fields, lsn)
+
+
+def get_data_versions(repo_ids: Iterable = (), repo_group_ids: Iterable = ()) -> Dict[str, int]:
+    """Get the current data versions of repos and repo groups
+
+    Args:
+        repo_ids: ids of the repos
+        repo_group_ids: ids of the repo groups
+
+    Returns:
+        dict that maps the repo:<id> and repo_group:<id> fields to their version, 0 if they were never bumped
+    """
+
+    fields = [repo_field(repo_id) for repo_id in repo_ids] + [repo_group_field(repo_group_id) for repo_group_id in repo_group_ids]
+
+    return _get(fields)
+
+
+def get_data_lsn(fields: Iterable[str]) -> Optional[int]:
+    """Get the wal position of the primary that a read has to see to include the data of the current versions
+
+    Args:
+        fields: repo:<id> and repo_group:<id> fields, like the keys get_data_versions returns
+
+    Returns:
+        the greatest wal position recorded for the fields, 0 if they were never bumped,
+        None if redis can't be reached or the position of a bump is unknown
+    """
+
+    fields = list(fields)
+    if not fields:
+        return 0
+
+    try:
+        values = redis.hmget(REPO_DATA_LSNS_KEY, fields)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get the wal positions of {fields}: {e}")
+        return None
+
+    if UNKNOWN_LSN in values:
+        return None
+
+    return max(int(value, 16) if value is not None else 0 for value in values)
+
+
+def _bump(fields, lsn: str) -> None:
+
+    try:
+        # the position is recorded before the versions, a reader that sees a new version also sees its position
+        pipeline = redis.pipeline()
+        pipeline.eval(RECORD_LSN_SCRIPT, 1, REPO_DATA_LSNS_KEY, lsn, *fields)
+        for field in fields:
+            pipeline.hincrby(REPO_DATA_VERSIONS_KEY, field, 1)
+        pipeline.execute()
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to bump data versions of {fields}: {e}")
+
+
+def _get(fields) -> Dict[str, int]:
+
+    if not fields:
+        return {}
+
+    try:
+        values = redis.hmget(REPO_DATA_VERSIONS_KEY, fields)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get data versions of {fields}: {e}")
+        # None makes sure nothing is served from a cache when the versions are unknown
+        return {field: None for field in fields}
+
+    return {field: int(value) if value is not None else 0 for field, value in zip(fields, values)}
@@ -0,0 +1,137 @@
+"""This module stores the rendered png images of the report endpoints in redis.
+
+Images are content addressed by the endpoint, the request parameters and the data version of the repo, so an
+image is reused until collection commits new data for the repo, and the api and the celery workers that render
+the images agree on where an image goes without passing anything but its id.
+"""
+import json
+import hashlib
+import logging
+
+from typing import Dict, Iterable, Optional
+
+from redis import exceptions
+
+from augur.tasks.init.redis_connection import redis_binary_connection as redis
+
+
+REPORT_IMAGE_KEY_PREFIX = "report_image"
+
+# hash of the repo data versions the default images were last prerendered for
+PRERENDERED_VERSIONS_KEY = f"{REPORT_IMAGE_KEY_PREFIX}_prerendered_versions"
+
+# seconds a rendered image is kept, the data version in its id already changes when the data does
+REPORT_IMAGE_EXPIRE = 86400
+
+# seconds after which a render that never finished may be queued again
+RENDERING_EXPIRE = 600
+
+logger = logging.getLogger(__name__)
+
+
+def get_report_image_id(endpoint: str, params: dict, data_versions: dict) -> str:
+    """Get the content address of a report image
+
+    Args:
+        endpoint: path of the report endpoint
+        params: query parameters of the request
+        data_versions: data versions of the repos the report is about
+
+    Returns:
+        sha256 hex digest that is the same for requests that only differ in the order of their parameters
+    """
+
+    content = json.dumps([endpoint, params, data_versions], sort_keys=True, default=str)
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_report_image(image_id: str) -> Optional[bytes]:
+    """Get a rendered image, None if it was not rendered or redis can't be reached"""
+
+    try:
+        return redis.get(_image_key(image_id))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get report image {image_id}: {e}")
+        return None
+
+
+def store_report_image(image_id: str, png: bytes) -> None:
+
+    try:
+        redis.set(_image_key(image_id), png, ex=REPORT_IMAGE_EXPIRE)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to store report image {image_id}: {e}")
+
+
+def start_rendering(image_id: str) -> bool:
+    """Mark an image as being rendered
+
+    Returns:
+        True if the caller should queue the render, False if it is already queued
+    """
+
+    try:
+        return bool(redis.set(_rendering_key(image_id), 1, nx=True, ex=RENDERING_EXPIRE))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to mark report image {image_id} as rendering: {e}")
+        return False
+
+
+def is_rendering(image_id: str) -> bool:
+
+    try:
+        return bool(redis.exists(_rendering_key(image_id)))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to check if report image {image_id} is rendering: {e}")
+        return False
+
+
+def finish_rendering(image_id: str) -> None:
+
+    try:
+        redis.delete(_rendering_key(image_id))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to clear rendering mark of report image {image_id}: {e}")
+
+
+def get_prerendered_versions(fields: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Get the data versions the default images of repos were last prerendered for
+
+    Args:
+        fields: repo:<id> fields of the repos
+
+    Returns:
+        dict that maps each field to its version, None if the images of the repo were never prerendered
+    """
+
+    fields = list(fields)
+    if not fields:
+        return {}
+
+    try:
+        values = redis.hmget(PRERENDERED_VERSIONS_KEY, fields)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get the prerendered report image versions: {e}")
+        return {field: None for field in fields}
+
+    return {field: int(value) if value is not None else None for field, value in zip(fields, values)}
+
+
+def record_prerendered_versions(versions: Dict[str, int]) -> None:
+
+    if not versions:
+        return
+
+    try:
+        redis.hset(PRERENDERED_VERSIONS_KEY, mapping=versions)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to record the prerendered report image versions: {e}")
+
+
+def _image_key(image_id: str) -> str:
+    return f"{REPORT_IMAGE_KEY_PREFIX}_{image_id}"
+
+
+def _rendering_key(image_id: str) -> str:
+    return f"{REPORT_IMAGE_KEY_PREFIX}_rendering_{image_id}"
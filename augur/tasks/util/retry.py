@@ -0,0 +1,63 @@
+"""This module defines the exception collection code raises when it has to wait before it can make progress.
+
+Instead of sleeping in the worker, the code raises a RetryableError that carries how long to wait, and
+the celery task that runs it is queued again with that countdown (see AugurTask in augur.tasks.init.celery_app),
+so the worker slot goes to repos that can make progress in the meantime.
+"""
+from typing import Dict
+
+from augur.tasks.util.redis_stats import increment_stats, get_stats
+
+
+TASK_RETRY_STATS_KEY = "task_retry_stats"
+
+# reasons a RetryableError is raised for
+SECONDARY_RATE_LIMIT = "secondary_rate_limit"
+RATE_LIMIT_EXCEEDED = "rate_limit_exceeded"
+ABUSE_MECHANISM_TRIGGERED = "abuse_mechanism_triggered"
+DATABASE_UNAVAILABLE = "database_unavailable"
+STATEMENT_TIMEOUT = "statement_timeout"
+
+
+class RetryableError(Exception):
+    """Raised when work can only continue after waiting
+
+    Attributes:
+        countdown (int): seconds to wait before the work is retried
+        reason (str): why the work has to wait, one of the reasons defined in this module
+    """
+
+    def __init__(self, message: str, countdown: int, reason: str):
+
+        super().__init__(message)
+
+        self.countdown = max(int(countdown), 0)
+        self.reason = reason
+
+
+def record_task_retry(task_name: str, error: RetryableError) -> None:
+    """Count a retry of a task in redis
+
+    Args:
+        task_name: name of the celery task that is retried
+        error: the error the task is retried for
+    """
+
+    increment_stats(TASK_RETRY_STATS_KEY, f"{task_name}:{error.reason}", {"retries": 1, "countdown": error.countdown})
+
+
+def get_task_retry_stats() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """Get the number of retries and the total countdown of each task per reason
+
+    Returns:
+        dict that maps task names to dicts that map reasons to their retries and countdown
+    """
+
+    stats = {}
+    for name, reason_stats in get_stats(TASK_RETRY_STATS_KEY).items():
+
+        task_name, reason = name.rsplit(":", 1)
+
+        stats.setdefault(task_name, {})[reason] = reason_stats
+
+    return stats
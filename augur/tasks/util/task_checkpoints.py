@@ -0,0 +1,71 @@
+"""This module stores how far a task got through the items of a repo in redis.
+
+A task that raised a RetryableError is queued again, and without a checkpoint it starts over and spends the
+api budget of its first run a second time. Tasks that work through a long ordered list of items, like the
+pull requests of a repo, save the last item whose data they committed and skip everything up to it when they
+are retried.
+
+The checkpoints are shared by the workers of an instance, because a retry can run on any of them.
+"""
+import logging
+
+from typing import Optional
+
+from redis import exceptions
+
+from augur.tasks.init.redis_connection import redis_connection as redis
+
+
+TASK_CHECKPOINT_KEY_PREFIX = "task_checkpoint"
+
+# seconds a checkpoint is kept, long enough for every retry of a task that waits for a rate limit reset
+TASK_CHECKPOINT_EXPIRE = 86400
+
+logger = logging.getLogger(__name__)
+
+
+def get_checkpoint(name: str, repo_id: int) -> Optional[str]:
+    """Get the last item a task committed for a repo
+
+    Args:
+        name: name of the work the checkpoint is saved for
+        repo_id: id of the repo
+
+    Returns:
+        the saved item, None if there is no checkpoint or redis can't be reached
+    """
+
+    try:
+        return redis.get(_checkpoint_key(name, repo_id))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to get checkpoint of {name} for repo {repo_id}: {e}")
+        return None
+
+
+def save_checkpoint(name: str, repo_id: int, value) -> None:
+    """Save the last item a task committed for a repo
+
+    Args:
+        name: name of the work the checkpoint is saved for
+        repo_id: id of the repo
+        value: the item, stored as a string
+    """
+
+    try:
+        redis.set(_checkpoint_key(name, repo_id), str(value), ex=TASK_CHECKPOINT_EXPIRE)
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to save checkpoint of {name} for repo {repo_id}: {e}")
+
+
+def clear_checkpoint(name: str, repo_id: int) -> None:
+    """Remove the checkpoint of a task once it finished the repo"""
+
+    try:
+        redis.delete(_checkpoint_key(name, repo_id))
+    except exceptions.RedisError as e:
+        logger.error(f"Unable to clear checkpoint of {name} for repo {repo_id}: {e}")
+
+
+def _checkpoint_key(name: str, repo_id: int) -> str:
+
+    return f"{TASK_CHECKPOINT_KEY_PREFIX}:{name}:{repo_id}"
@@ -75,6 +75,25 @@ def remove_duplicates_by_uniques(data, uniques):
     return unique_data
 
 
+def sort_by_uniques(data, uniques):
+    """Sort dicts by the values of their unique keys
+
+    Concurrent upserts that lock rows in the same order wait on each other instead of deadlocking.
+    Missing and None values sort last, and the values are compared as strings if their types can't be compared.
+    """
+
+    if not uniques:
+        return data
+
+    def sort_key(x):
+        return tuple((x.get(unique) is None, x.get(unique)) for unique in uniques)
+
+    try:
+        return sorted(data, key=sort_key)
+    except TypeError:
+        return sorted(data, key=lambda x: tuple((x.get(unique) is None, str(x.get(unique))) for unique in uniques))
+
+
 
 
 def remove_duplicate_naturals(data, natural_keys):
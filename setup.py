@@ -45,6 +45,7 @@ setup(
         "Flask-Login==0.5.0",
         "Flask-WTF==1.0.0",
         "pandas==1.3.5", # 1.4.3
+        "pyarrow==8.0.0", # 8.0.0
         "numpy==1.21", # 1.23.2
         "requests==2.28.0", # 2.28.1
         "psycopg2-binary==2.9.3", #2.9.3 what is pscopg-binary 3.0.16
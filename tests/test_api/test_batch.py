@@ -0,0 +1,128 @@
+import json
+import threading
+
+from flask import Flask
+
+from augur.api.routes import batch
+
+BATCH_ROUTE = "/api/unstable/batch"
+
+
+class FakeConfig():
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def get_value(self, section, setting):
+        return self.settings.get(setting)
+
+
+class FakeServer():
+
+    def __init__(self, app, settings):
+        self.app = app
+        self.config = FakeConfig(settings)
+
+
+def create_app(settings):
+
+    app = Flask(__name__)
+    batch.create_routes(FakeServer(app, settings))
+
+    return app
+
+
+def post_batch(client, sub_requests):
+
+    response = client.post(BATCH_ROUTE, data=json.dumps(sub_requests))
+
+    assert response.status_code == 207
+
+    return json.loads(response.get_data())
+
+
+def test_identical_sub_requests_run_once():
+
+    app = create_app({"batch_workers": 2, "batch_timeout": 10})
+    calls = []
+
+    @app.route("/count")
+    def count():
+        calls.append(1)
+        return "counted"
+
+    results = post_batch(app.test_client(), [{"method": "GET", "path": "/count"}, {"method": "GET", "path": "/count"}])
+
+    assert len(calls) == 1
+    assert [result["status"] for result in results] == [200, 200]
+    assert [result["response"] for result in results] == ["counted", "counted"]
+
+
+def test_results_are_streamed_in_completion_order():
+
+    app = create_app({"batch_workers": 2, "batch_timeout": 10})
+    fast_done = threading.Event()
+
+    @app.route("/slow")
+    def slow():
+        fast_done.wait(5)
+        return "slow"
+
+    @app.route("/fast")
+    def fast():
+        fast_done.set()
+        return "fast"
+
+    results = post_batch(app.test_client(), [{"method": "GET", "path": "/slow"}, {"method": "GET", "path": "/fast"}])
+
+    assert [result["path"] for result in results] == ["/fast", "/slow"]
+
+
+def test_sub_requests_after_the_deadline_are_not_run():
+
+    app = create_app({"batch_workers": 1, "batch_timeout": 1})
+    release = threading.Event()
+    started = []
+
+    @app.route("/blocking")
+    def blocking():
+        release.wait(5)
+        return "blocking"
+
+    @app.route("/queued")
+    def queued():
+        started.append(1)
+        return "queued"
+
+    try:
+        results = post_batch(app.test_client(), [{"method": "GET", "path": "/blocking"}, {"method": "GET", "path": "/queued"}])
+    finally:
+        release.set()
+
+    assert {result["path"]: result["status"] for result in results} == {"/blocking": 504, "/queued": 504}
+    assert started == []
+
+
+def test_sub_requests_for_columnar_formats_are_rejected():
+
+    app = create_app({"batch_workers": 2, "batch_timeout": 10})
+    calls = []
+
+    @app.route("/metric")
+    def metric():
+        calls.append(1)
+        return "[]"
+
+    results = post_batch(app.test_client(), [{"method": "GET", "path": "/metric?format=parquet"}, {"method": "GET", "path": "/metric?format=json"}])
+
+    assert {result["path"]: result["status"] for result in results} == {"/metric?format=parquet": 406, "/metric?format=json": 200}
+    assert len(calls) == 1
+
+
+def test_nested_batches_are_rejected():
+
+    app = create_app({"batch_workers": 1, "batch_timeout": 10})
+
+    results = post_batch(app.test_client(), [{"method": "POST", "path": BATCH_ROUTE, "body": "[]"}])
+
+    assert [result["status"] for result in results] == [400]
@@ -0,0 +1,63 @@
+import os
+import logging
+
+import pytest
+import pandas as pd
+
+from augur.api.dataset_cache import DatasetCache
+
+logger = logging.getLogger(__name__)
+
+pytest.importorskip("pyarrow")
+
+
+def test_get_or_create(tmp_path):
+
+    cache = DatasetCache(logger, str(tmp_path), max_bytes=10 * 1024 * 1024)
+    data = pd.DataFrame({"repo_id": [1, 2], "pr_src_id": [10, 20]})
+    calls = []
+
+    def createfunc():
+        calls.append(1)
+        return data
+
+    assert cache.get_or_create("prs|repo_id=1", createfunc).equals(data)
+    assert cache.get_or_create("prs|repo_id=1", createfunc).equals(data)
+    assert len(calls) == 1
+
+
+def test_get_or_create_skips_uncacheable_datasets(tmp_path):
+
+    cache = DatasetCache(logger, str(tmp_path), max_bytes=10 * 1024 * 1024)
+    data = pd.DataFrame({"repo_id": [1, 2], "pr_src_id": [10, 20]})
+
+    assert cache.get_or_create("prs|repo_id=1", lambda: data, cacheable=lambda: False).equals(data)
+    assert cache.get("prs|repo_id=1") is None
+
+
+def test_expired_dataset_is_a_miss(tmp_path):
+
+    cache = DatasetCache(logger, str(tmp_path), max_bytes=10 * 1024 * 1024, expire=-1)
+    cache.set("prs|repo_id=1", pd.DataFrame({"repo_id": [1]}))
+
+    assert cache.get("prs|repo_id=1") is None
+
+
+def test_least_recently_used_datasets_are_evicted(tmp_path):
+
+    data = pd.DataFrame({"value": range(1000)})
+
+    cache = DatasetCache(logger, str(tmp_path), max_bytes=10 * 1024 * 1024)
+    cache.set("first", data)
+    size = os.path.getsize(cache._path("first"))
+
+    # room for two datasets
+    cache.max_bytes = size * 2
+
+    os.utime(cache._path("first"), (0, 0))
+    cache.set("second", data)
+    cache.set("third", data)
+
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+    assert cache.get("third") is not None
@@ -0,0 +1,154 @@
+import pytest
+import logging
+
+from augur.api.metric_cache import MetricCache
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRedis():
+    """Dict backed stand in for the few redis commands the metric cache uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def hincrby(self, key, field, amount):
+        hash_value = self.data.setdefault(key, {})
+        hash_value[field] = hash_value.get(field, 0) + amount
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline():
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def hincrby(self, key, field, amount):
+        self.commands.append((key, field, amount))
+
+    def execute(self):
+        for command in self.commands:
+            self.redis.hincrby(*command)
+
+
+@pytest.fixture
+def redis():
+    yield FakeRedis()
+
+
+def test_metric_cache_make_key_sorts_query_args():
+
+    first = MetricCache.make_key("issues_new", {"repo_id": "1"}, {"period": "week", "begin_date": "2020-01-01"})
+    second = MetricCache.make_key("issues_new", {"repo_id": "1"}, {"begin_date": "2020-01-01", "period": "week"})
+
+    assert first == second
+    assert first != MetricCache.make_key("issues_new", {"repo_id": "2"}, {"period": "week", "begin_date": "2020-01-01"})
+
+
+def test_metric_cache_make_key_changes_with_data_version():
+
+    first = MetricCache.make_key("issues_new", {"repo_id": "1"}, {}, {"repo:1": 3})
+    second = MetricCache.make_key("issues_new", {"repo_id": "1"}, {}, {"repo:1": 4})
+
+    assert first != second
+
+
+def test_metric_cache_get_or_create(redis):
+
+    cache = MetricCache(logger, redis=redis)
+    calls = []
+
+    def create():
+        calls.append(1)
+        return '[{"issues": 1}]'
+
+    assert cache.get_or_create("key", create, "issues_new") == b'[{"issues": 1}]'
+    assert cache.get_or_create("key", create, "issues_new") == b'[{"issues": 1}]'
+    assert len(calls) == 1
+
+    assert cache.get_stats()["issues_new"] == {"local_hit": 1, "redis_hit": 0, "miss": 1}
+
+
+def test_metric_cache_get_or_create_skips_uncacheable_results(redis):
+
+    cache = MetricCache(logger, redis=redis)
+    calls = []
+
+    def create():
+        calls.append(1)
+        return '[{"issues": 1}]'
+
+    assert cache.get_or_create("key", create, "issues_new", cacheable=lambda: False) == b'[{"issues": 1}]'
+    assert cache.get_or_create("key", create, "issues_new", cacheable=lambda: False) == b'[{"issues": 1}]'
+    assert len(calls) == 2
+    assert cache.get("key") is None
+
+
+def test_metric_cache_checks_cacheable_before_creating(redis):
+
+    cache = MetricCache(logger, redis=redis)
+    calls = []
+
+    def create():
+        calls.append("create")
+        return '[{"issues": 1}]'
+
+    def cacheable():
+        calls.append("cacheable")
+        return True
+
+    cache.get_or_create("key", create, "issues_new", cacheable=cacheable)
+    assert calls == ["cacheable", "create"]
+
+
+def test_metric_cache_shares_redis_tier(redis):
+
+    first_worker = MetricCache(logger, redis=redis)
+    second_worker = MetricCache(logger, redis=redis)
+
+    first_worker.set("key", b"[]")
+
+    assert second_worker.get("key", "issues_new") == b"[]"
+    assert second_worker.get_stats()["issues_new"]["redis_hit"] == 1
+
+
+def test_metric_cache_counts_stats_in_process(redis):
+
+    cache = MetricCache(logger, redis=redis)
+    cache.set("key", b"[]")
+
+    cache.get("key", "issues_new")
+    cache.get("key", "issues_new")
+
+    # local hits don't reach redis until the stats are flushed
+    assert cache.stats_redis_key not in redis.data
+
+    cache.flush_stats()
+
+    assert redis.data[cache.stats_redis_key] == {"issues_new:local_hit": 2}
+
+
+def test_metric_cache_evicts_least_recently_used():
+
+    cache = MetricCache(logger, max_entries=2)
+
+    cache.set("first", b"1")
+    cache.set("second", b"2")
+    cache.get("first")
+    cache.set("third", b"3")
+
+    assert cache.get("first") == b"1"
+    assert cache.get("second") is None
+    assert cache.get("third") == b"3"
@@ -0,0 +1,46 @@
+import io
+
+import pytest
+import pandas as pd
+from werkzeug.datastructures import MIMEAccept
+
+from augur.api.output_formats import UnsupportedFormatError, get_requested_format, dataframe_to_bytes
+
+
+def test_get_requested_format_query_parameter():
+
+    accept = MIMEAccept([("application/json", 1)])
+
+    assert get_requested_format("Parquet", accept) == "parquet"
+
+    with pytest.raises(UnsupportedFormatError):
+        get_requested_format("csv", accept)
+
+
+def test_get_requested_format_accept_header():
+
+    assert get_requested_format(None, MIMEAccept([("application/vnd.apache.arrow.stream", 1)])) == "arrow"
+    assert get_requested_format(None, MIMEAccept([("*/*", 1)])) == "json"
+    assert get_requested_format(None, MIMEAccept([("text/html", 1)])) == "json"
+
+
+def test_dataframe_to_bytes():
+
+    pa = pytest.importorskip("pyarrow")
+
+    data = pd.DataFrame({"repo_id": [1, 2], "issues": [3, 4]})
+
+    table = pa.ipc.open_stream(dataframe_to_bytes(data, "arrow")).read_all()
+    assert table.to_pandas().equals(data)
+
+    assert pd.read_parquet(io.BytesIO(dataframe_to_bytes(data, "parquet"))).equals(data)
+
+
+def test_dataframe_to_bytes_of_mixed_type_column():
+
+    pytest.importorskip("pyarrow")
+
+    data = pd.DataFrame({"repo_id": [1, 2], "value": ["a", 3]})
+
+    with pytest.raises(UnsupportedFormatError):
+        dataframe_to_bytes(data, "arrow")
@@ -0,0 +1,44 @@
+import datetime
+import decimal
+import json
+
+from augur.api.routes.util import get_page_clauses, json_default, add_repo_urls, get_base64_url
+
+
+def test_get_page_clauses_not_paginated():
+
+    clauses = get_page_clauses('repo.repo_id', 'repo_name', None, None)
+
+    assert clauses == {'page_filter': '', 'order_by': 'repo_name', 'page_limit': ''}
+
+
+def test_get_page_clauses_paginated():
+
+    clauses = get_page_clauses('repo.repo_id', 'repo_name', 100, 25)
+
+    assert clauses['page_filter'] == 'AND repo.repo_id > :after'
+    assert clauses['order_by'] == 'repo.repo_id'
+    assert clauses['page_limit'] == 'LIMIT :limit'
+
+
+def test_json_default():
+
+    row = {
+        'date': datetime.datetime(2022, 1, 2, 3, 4, 5),
+        'day': datetime.date(2022, 1, 2),
+        'open_day': decimal.Decimal('3')
+    }
+
+    assert json.loads(json.dumps(row, default=json_default)) == {
+        'date': '2022-01-02T03:04:05.000',
+        'day': '2022-01-02',
+        'open_day': 3.0
+    }
+
+
+def test_base64_url_is_str():
+
+    row = add_repo_urls({'url': 'https://github.com/chaoss/augur'})
+
+    assert row['url'] == 'github.com/chaoss/augur'
+    assert row['base64_url'] == get_base64_url('github.com/chaoss/augur') == 'Z2l0aHViLmNvbS9jaGFvc3MvYXVndXI='
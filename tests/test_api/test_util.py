@@ -0,0 +1,14 @@
+from augur.api.util import parse_repo_ids
+
+
+def test_parse_repo_ids():
+
+    assert parse_repo_ids("25,1,3") == [1, 3, 25]
+    assert parse_repo_ids("1, 2,,2") == [1, 2]
+
+
+def test_parse_repo_ids_invalid():
+
+    assert parse_repo_ids(None) is None
+    assert parse_repo_ids("") is None
+    assert parse_repo_ids("1,two") is None
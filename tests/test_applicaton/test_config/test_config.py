@@ -243,6 +243,36 @@ def test_config_update_settings(test_db_config, test_db_engine):
             connection.execute("""DELETE FROM augur_operations.config""")
 
 
+def test_config_snapshot_sees_updated_settings(test_db_config, test_db_engine):
+
+    try:
+        ip_standard = {"section_name": "Network", "setting_name": "ip_standard", "value": "ipv4"}
+
+        test_db_config.add_or_update_settings([ip_standard])
+
+        assert test_db_config.get_value("Network", "ip_standard") == "ipv4"
+
+        # rows written around the config are only seen once the snapshot is reloaded
+        with test_db_engine.connect() as connection:
+
+            connection.execute("""UPDATE augur_operations.config SET value = 'ipv6' WHERE setting_name = 'ip_standard'""")
+
+        assert test_db_config.get_value("Network", "ip_standard") == "ipv4"
+
+        ip_standard["value"] = "ipv6"
+        test_db_config.add_or_update_settings([ip_standard])
+
+        assert test_db_config.get_value("Network", "ip_standard") == "ipv6"
+
+        test_db_config.remove_section("Network")
+
+        assert test_db_config.get_section("Network") == {}
+
+    finally:
+        with test_db_engine.connect() as connection:
+            connection.execute("""DELETE FROM augur_operations.config""")
+
+
 def test_config_add_section_from_json(test_db_config, test_db_engine):
 
     try:
@@ -0,0 +1,63 @@
+import sqlite3
+import pytest
+import sqlalchemy as s
+
+from augur.application.db.engine import InstrumentedQueuePool
+
+
+def create_pool(**kwargs):
+
+    return InstrumentedQueuePool(lambda: sqlite3.connect(":memory:"), **kwargs)
+
+
+def test_pool_stats_count_checkouts():
+
+    pool = create_pool(pool_size=2, max_overflow=2)
+
+    connection_1 = pool.connect()
+    connection_2 = pool.connect()
+
+    stats = pool.get_stats()
+
+    assert stats["checkouts"] == 2
+    assert stats["checked_out"] == 2
+    assert stats["saturation"] == 0.5
+    assert stats["checkout_timeouts"] == 0
+    assert stats["max_checkout_wait"] >= stats["avg_checkout_wait"] >= 0
+
+    connection_1.close()
+    connection_2.close()
+
+    stats = pool.get_stats()
+
+    assert stats["checked_out"] == 0
+    assert stats["saturation"] == 0
+
+
+def test_pool_stats_count_timeouts():
+
+    pool = create_pool(pool_size=1, max_overflow=0, timeout=0.1)
+
+    connection = pool.connect()
+
+    with pytest.raises(s.exc.TimeoutError):
+        pool.connect()
+
+    stats = pool.get_stats()
+
+    assert stats["checkouts"] == 1
+    assert stats["checkout_timeouts"] == 1
+    assert stats["saturation"] == 1
+
+    connection.close()
+
+
+def test_recreated_pool_keeps_stats_class():
+
+    pool = create_pool(pool_size=1, max_overflow=0)
+    pool.connect().close()
+
+    recreated_pool = pool.recreate()
+
+    assert isinstance(recreated_pool, InstrumentedQueuePool)
+    assert recreated_pool.get_stats()["checkouts"] == 0
@@ -0,0 +1,72 @@
+import sqlalchemy as s
+
+from augur.application.db.index_advisor import find_covering_index, get_declared_indexes, check_indexes, NATURAL_KEY, LOOKUP
+from augur.application.db.models.base import Base
+import augur.application.db.models
+
+
+def make_index(name, columns, method="btree", unique=False, partial=False, valid=True):
+
+    return {"name": name, "columns": columns, "method": method, "unique": unique, "partial": partial, "valid": valid}
+
+
+def test_natural_key_needs_unique_index_on_exactly_its_columns():
+
+    indexes = [
+        make_index("repo_id_idx", ["repo_id"]),
+        make_index("wide_unique", ["repo_id", "pr_src_id", "pr_url"], unique=True),
+        make_index("unique_pr", ["pr_src_id", "repo_id"], unique=True)
+    ]
+
+    assert find_covering_index(indexes, ["repo_id", "pr_src_id"], NATURAL_KEY) == "unique_pr"
+    assert find_covering_index(indexes, ["repo_id"], NATURAL_KEY) is None
+
+
+def test_lookup_needs_index_that_starts_with_its_columns():
+
+    indexes = [
+        make_index("author_email_date", ["cmt_author_email", "cmt_author_date"]),
+        make_index("affiliation", ["cmt_committer_affiliation"], method="hash"),
+        make_index("email_brin", ["cmt_committer_email"], method="brin")
+    ]
+
+    assert find_covering_index(indexes, ["cmt_author_email"], LOOKUP) == "author_email_date"
+    assert find_covering_index(indexes, ["cmt_committer_affiliation"], LOOKUP) == "affiliation"
+    assert find_covering_index(indexes, ["cmt_author_date"], LOOKUP) is None
+    assert find_covering_index(indexes, ["cmt_committer_email"], LOOKUP) is None
+
+
+def test_partial_and_invalid_indexes_cover_nothing():
+
+    indexes = [
+        make_index("partial", ["pr_issue_url"], partial=True),
+        make_index("invalid", ["pr_issue_url"], valid=False)
+    ]
+
+    assert find_covering_index(indexes, ["pr_issue_url"], LOOKUP) is None
+
+
+def test_declared_indexes():
+
+    metadata = s.MetaData()
+    table = s.Table("issues", metadata,
+                    s.Column("issue_id", s.BigInteger, primary_key=True),
+                    s.Column("repo_id", s.BigInteger),
+                    s.Column("gh_issue_id", s.BigInteger),
+                    s.Column("issue_url", s.String, unique=True),
+                    s.UniqueConstraint("repo_id", "gh_issue_id", name="issue-unique"),
+                    s.Index("issue_repo", "repo_id"))
+
+    indexes = {index["name"]: index for index in get_declared_indexes(table)}
+
+    assert indexes["issues_pkey"]["columns"] == ["issue_id"]
+    assert indexes["issue-unique"]["unique"]
+    assert indexes["issues_issue_url_key"]["columns"] == ["issue_url"]
+    assert not indexes["issue_repo"]["unique"]
+
+
+def test_collection_keys_are_declared():
+
+    gaps = [result for result in check_indexes(Base.metadata) if result["declared_index"] is None]
+
+    assert gaps == []
@@ -0,0 +1,59 @@
+import pytest
+import sqlalchemy as s
+
+from augur.application.db.instrumentation import instrument_engine, query_context, get_query_stats, configure_slow_queries, DEFAULT_SLOW_QUERY_THRESHOLD_MS, DEFAULT_SLOW_QUERY_SAMPLE_RATE
+
+
+@pytest.fixture
+def engine():
+
+    engine = s.create_engine("sqlite://")
+    instrument_engine(engine)
+
+    yield engine
+
+    engine.dispose()
+
+
+def test_statements_are_attributed_to_the_context(engine):
+
+    with query_context(task="collect_issues", repo="https://github.com/chaoss/augur") as context:
+        with engine.connect() as connection:
+            connection.execute(s.text("CREATE TABLE repo (repo_id INTEGER)"))
+            connection.execute(s.text("INSERT INTO repo VALUES (1), (2)"))
+
+    summary = context.get_summary()
+
+    assert summary["queries"] == 2
+    assert summary["rows"] == 2
+    assert summary["duration"] >= summary["max_duration"] >= 0
+
+    assert get_query_stats()["task:collect_issues"]["queries"] >= 2
+
+
+def test_failed_statements_are_not_counted(engine):
+
+    with query_context(route="/api/unstable/repos") as context:
+        with engine.connect() as connection:
+            with pytest.raises(s.exc.OperationalError):
+                connection.execute(s.text("SELECT * FROM missing_table"))
+
+            connection.execute(s.text("SELECT 1"))
+
+    assert context.get_summary()["queries"] == 1
+    assert context.name == "route:/api/unstable/repos"
+
+
+def test_slow_statements_are_sampled(engine, caplog):
+
+    configure_slow_queries(0, 1.0)
+
+    try:
+        with query_context(task="collect_events") as context:
+            with engine.connect() as connection:
+                connection.execute(s.text("SELECT 1"))
+    finally:
+        configure_slow_queries(DEFAULT_SLOW_QUERY_THRESHOLD_MS, DEFAULT_SLOW_QUERY_SAMPLE_RATE)
+
+    assert context.get_summary()["slow_queries"] == 1
+    assert "collect_events" in caplog.text
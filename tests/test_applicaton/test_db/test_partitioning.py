@@ -0,0 +1,34 @@
+from augur.application.db.partitioning import suffixed_name, unsuffixed_name, repo_foreign_key_definition, PARTITIONED_SUFFIX, UNPARTITIONED_SUFFIX, MAX_IDENTIFIER_LENGTH
+
+
+def test_suffixed_name():
+
+    assert suffixed_name("commits", PARTITIONED_SUFFIX) == "commits_partitioned"
+    assert unsuffixed_name("commits_partitioned", PARTITIONED_SUFFIX) == "commits"
+
+    # names that don't have the suffix are kept
+    assert unsuffixed_name("commits_p0", PARTITIONED_SUFFIX) == "commits_p0"
+
+
+def test_suffixed_name_keeps_suffix_of_long_names():
+
+    name = "a" * MAX_IDENTIFIER_LENGTH
+
+    partitioned_name = suffixed_name(name, PARTITIONED_SUFFIX)
+    unpartitioned_name = suffixed_name(name, UNPARTITIONED_SUFFIX)
+
+    assert len(partitioned_name) == MAX_IDENTIFIER_LENGTH
+    assert partitioned_name.endswith(PARTITIONED_SUFFIX)
+    assert len(unpartitioned_name) == MAX_IDENTIFIER_LENGTH
+    assert unpartitioned_name.endswith(UNPARTITIONED_SUFFIX)
+
+
+def test_repo_foreign_key_definition_keeps_options():
+
+    definition = repo_foreign_key_definition("msg_id", "message", "msg_id", " ON UPDATE CASCADE ON DELETE RESTRICT DEFERRABLE INITIALLY DEFERRED NOT VALID")
+
+    assert definition == ('FOREIGN KEY ("msg_id", repo_id) REFERENCES augur_data."message" ("msg_id", repo_id) MATCH FULL '
+                          'ON UPDATE CASCADE ON DELETE RESTRICT DEFERRABLE INITIALLY DEFERRED NOT VALID')
+
+    assert repo_foreign_key_definition("cmt_id", "commits", "cmt_id") == \
+        'FOREIGN KEY ("cmt_id", repo_id) REFERENCES augur_data."commits" ("cmt_id", repo_id) MATCH FULL NOT VALID'
@@ -0,0 +1,71 @@
+from augur.application.db.statement_timeout import set_connection_statement_timeout, is_query_canceled, QUERY_CANCELED
+
+
+class FakeCursor():
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement):
+        self.connection.statements.append((statement, self.connection.autocommit))
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+
+    def __init__(self):
+        self.autocommit = False
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class QueryCanceled(Exception):
+
+    pgcode = QUERY_CANCELED
+
+
+def test_statement_timeout_is_set_outside_of_a_transaction():
+
+    connection = FakeConnection()
+    info = {}
+
+    set_connection_statement_timeout(connection, info, 30000)
+
+    assert connection.statements == [("SET SESSION statement_timeout = 30000", True)]
+    assert connection.autocommit is False
+    assert info["statement_timeout"] == 30000
+
+
+def test_statement_timeout_is_only_set_when_it_changes():
+
+    connection = FakeConnection()
+    info = {}
+
+    set_connection_statement_timeout(connection, info, 30000)
+    set_connection_statement_timeout(connection, info, 30000)
+    set_connection_statement_timeout(connection, info, 0)
+    set_connection_statement_timeout(connection, info, None)
+
+    assert [statement for statement, _ in connection.statements] == [
+        "SET SESSION statement_timeout = 30000",
+        "SET SESSION statement_timeout TO DEFAULT"
+    ]
+
+
+def test_connections_without_budget_keep_the_server_default():
+
+    connection = FakeConnection()
+
+    set_connection_statement_timeout(connection, {}, None)
+
+    assert connection.statements == []
+
+
+def test_only_cancelled_statements_are_query_canceled():
+
+    assert is_query_canceled(QueryCanceled())
+    assert not is_query_canceled(ValueError())
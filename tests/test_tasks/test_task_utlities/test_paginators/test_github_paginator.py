@@ -1,10 +1,12 @@
 import pytest
 import logging
 import httpx
+import time
 
-from augur.tasks.github.util.github_paginator import GithubPaginator, GithubApiResult
+from augur.tasks.github.util.github_paginator import GithubPaginator, GithubApiResult, process_dict_response
+from augur.tasks.util.retry import RetryableError, SECONDARY_RATE_LIMIT, RATE_LIMIT_EXCEEDED
+from augur.tasks.util.random_key_auth import RandomKeyAuth
 from augur.tasks.github.util.github_random_key_auth import GithubRandomKeyAuth
-# from augur.tasks.util.random_key_auth import RandomKeyAuth
 from augur.application.db.session import DatabaseSession
 
 logger = logging.getLogger(__name__)
@@ -106,3 +108,59 @@ def test_github_paginator_get_item(key_auth):
 
     assert contributors_list[5] is None
 
+
+def test_process_dict_response_raises_retryable_error_on_secondary_rate_limit():
+
+    request = httpx.Request("GET", "https://api.github.com/repos/chaoss/augur/pulls")
+    response = httpx.Response(403, headers={"Retry-After": "60"}, request=request)
+    page_data = {"message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again"}
+
+    with pytest.raises(RetryableError) as error:
+        process_dict_response(logger, response, page_data)
+
+    assert error.value.countdown == 60
+    assert error.value.reason == SECONDARY_RATE_LIMIT
+
+
+def rate_limited_response(key, reset_epoch):
+
+    request = httpx.Request("GET", "https://api.github.com/repos/chaoss/augur/pulls", headers={"Authorization": f"token {key}"})
+
+    return httpx.Response(403, headers={"X-RateLimit-Reset": str(reset_epoch)}, request=request)
+
+
+def test_process_dict_response_rotates_to_a_key_with_remaining_budget():
+
+    key_manager = RandomKeyAuth(["first", "second"], "Authorization", logger, "token {0}")
+    page_data = {"message": "API rate limit exceeded for user ID 1."}
+
+    result = process_dict_response(logger, rate_limited_response("first", int(time.time()) + 600), page_data, key_manager)
+
+    assert result == GithubApiResult.RATE_LIMIT_EXCEEDED
+    assert key_manager.get_available_keys() == ["second"]
+
+
+def test_process_dict_response_raises_when_every_key_is_exhausted():
+
+    key_manager = RandomKeyAuth(["first", "second"], "Authorization", logger, "token {0}")
+    page_data = {"message": "API rate limit exceeded for user ID 1."}
+
+    process_dict_response(logger, rate_limited_response("first", int(time.time()) + 600), page_data, key_manager)
+
+    with pytest.raises(RetryableError) as error:
+        process_dict_response(logger, rate_limited_response("second", int(time.time()) + 1200), page_data, key_manager)
+
+    # the task waits for the key that resets first
+    assert 590 <= error.value.countdown <= 600
+    assert error.value.reason == RATE_LIMIT_EXCEEDED
+
+
+def test_exhausted_keys_are_not_shared_between_key_managers():
+
+    key_manager = RandomKeyAuth(["first", "second"], "Authorization", logger, "token {0}")
+    other_key_manager = RandomKeyAuth(["first", "second"], "Authorization", logger, "token {0}")
+
+    key_manager.mark_key_exhausted(rate_limited_response("first", int(time.time()) + 600).request, int(time.time()) + 600)
+
+    assert key_manager.get_available_keys() == ["second"]
+    assert other_key_manager.get_available_keys() == ["first", "second"]
@@ -0,0 +1,211 @@
+import pytest
+import logging
+import json
+import httpx
+
+from augur.tasks.github.util import gh_graphql_entities
+from augur.tasks.github.util.gh_graphql_entities import GraphQlPageCollection, build_pull_request_batch_query
+from augur.tasks.github.util.github_rate_limit import add_rate_limit_to_query
+from augur.tasks.util.retry import RetryableError, SECONDARY_RATE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class FakePageCollection(GraphQlPageCollection):
+    """Serves pages of integers instead of hitting the github graphql api and counts the requests made."""
+
+    total = 250
+    # pages larger than this are rejected like github does for expensive queries
+    max_records = 100
+    # pages larger than this time out once
+    timeout_records = None
+    # cost of each page in the rateLimit object of the response, None leaves rateLimit out
+    rate_limit_cost = None
+    # whether the query selects totalCount
+    select_total_count = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+        self.rejected = []
+
+    def request_graphql_dict(self, variables={}, timeout_wait=10):
+
+        if variables["numRecords"] > self.max_records:
+            self.rejected.append(variables["numRecords"])
+            return {"errors": [{"type": "MAX_NODE_LIMIT_EXCEEDED", "message": "too many nodes"}]}
+
+        if self.timeout_records is not None and variables["numRecords"] > self.timeout_records:
+            self.timeout_records = None
+            self.rejected.append(variables["numRecords"])
+            return {"errors": [{"message": "Something went wrong while executing your query. This may be the result of a timeout"}]}
+
+        self.requests.append(variables["cursor"])
+
+        start = int(variables["cursor"] or 0)
+        end = min(start + variables["numRecords"], self.total)
+
+        data = {
+            "repository": {
+                "edges": [{"node": {"number": number}} for number in range(start, end)],
+                "pageInfo": {
+                    "hasNextPage": end < self.total,
+                    "endCursor": str(end)
+                }
+            }
+        }
+
+        if self.select_total_count:
+            data["repository"]["totalCount"] = self.total
+
+        if self.rate_limit_cost is not None:
+            data["rateLimit"] = {"cost": self.rate_limit_cost, "remaining": 4999, "resetAt": "2022-01-01T00:00:00Z"}
+
+        self.rate_limit = data.get("rateLimit")
+
+        return {"data": data}
+
+
+@pytest.fixture
+def collection():
+
+    params = {
+        "values": ("repository",)
+    }
+
+    yield FakePageCollection("query", None, logger, bind=params)
+
+
+def test_graphql_page_collection_len_uses_first_page(collection):
+
+    assert len(collection) == 250
+    assert collection.requests == [None]
+
+    assert collection[0]["number"] == 0
+    assert collection.requests == [None]
+
+
+def test_graphql_page_collection_get_item_reuses_cursor(collection):
+
+    assert collection[150]["number"] == 150
+    assert collection.requests == [None, "100"]
+
+    assert collection[120]["number"] == 120
+    assert collection[249]["number"] == 249
+    assert collection.requests == [None, "100", "200"]
+
+
+def test_graphql_page_collection_slice(collection):
+
+    assert [pr["number"] for pr in collection[5:10]] == [5, 6, 7, 8, 9]
+    assert collection.requests == [None]
+
+
+def test_graphql_page_collection_iter_reuses_cache(collection):
+
+    collection[150]
+
+    assert [pr["number"] for pr in collection] == list(range(250))
+    assert collection.requests == [None, "100", "200"]
+
+
+def test_graphql_page_collection_iter_without_total_count(collection):
+
+    collection.select_total_count = False
+
+    assert [pr["number"] for pr in collection] == list(range(250))
+    assert len(collection) == 250
+
+
+def test_graphql_page_collection_iter_of_empty_collection(collection):
+
+    collection.total = 0
+
+    assert list(collection) == []
+    assert len(collection) == 0
+
+
+def test_graphql_page_collection_only_caches_recent_pages(collection, monkeypatch):
+
+    monkeypatch.setattr(gh_graphql_entities, "PAGE_CACHE_SIZE", 2)
+
+    assert [pr["number"] for pr in collection] == list(range(250))
+    assert list(collection.page_cache) == [1, 2]
+
+    # the first page is requested again with its cursor
+    assert collection[5]["number"] == 5
+    assert collection.requests == [None, "100", "200", None]
+
+
+def test_build_pull_request_batch_query():
+
+    query = build_pull_request_batch_query([12, 345], "number")
+
+    assert "pr12: pullRequest(number: 12) { number }" in query
+    assert "pr345: pullRequest(number: 345) { number }" in query
+    assert "repository(name: $repo, owner: $owner)" in query
+
+
+def test_graphql_page_collection_shrinks_expensive_pages(collection):
+
+    collection.max_records = 30
+
+    assert collection[0]["number"] == 0
+    assert collection.per_page == 25
+    assert [pr["number"] for pr in collection] == list(range(250))
+
+
+def test_graphql_page_collection_does_not_grow_back_to_a_rejected_size(collection):
+
+    collection.max_records = 30
+    collection.rate_limit_cost = 1
+
+    assert [pr["number"] for pr in collection] == list(range(250))
+    assert collection.rejected == [100, 50]
+    assert collection.per_page == 25
+
+
+def test_graphql_page_collection_grows_after_cheap_pages_following_a_timeout(collection):
+
+    collection.total = 600
+    collection.timeout_records = 50
+    collection.rate_limit_cost = 1
+
+    assert [pr["number"] for pr in collection] == list(range(600))
+    assert collection.rejected == [100]
+    # five pages of 50 before the page size is doubled again
+    assert collection.requests == [None, "50", "100", "150", "200", "250", "350", "450", "550"]
+    assert collection.per_page == 100
+
+
+def test_add_rate_limit_to_query():
+
+    query = """
+        query($owner: String!) {
+            repository(owner: $owner) { name }
+        }
+    """
+
+    rate_limit_query = add_rate_limit_to_query(query)
+
+    assert "rateLimit { cost remaining resetAt }" in rate_limit_query
+    assert rate_limit_query.index("rateLimit") < rate_limit_query.index("repository")
+    assert add_rate_limit_to_query(rate_limit_query) == rate_limit_query
+
+
+def test_graphql_page_collection_raises_rate_limit_of_text_response(monkeypatch):
+
+    page_data = {"message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again"}
+
+    request = httpx.Request("POST", "https://api.github.com/graphql")
+    # github sometimes returns the error dict as a json encoded string
+    response = httpx.Response(403, headers={"Retry-After": "60"}, content=json.dumps(json.dumps(page_data)), request=request)
+
+    monkeypatch.setattr(gh_graphql_entities, "hit_api_graphql", lambda *args, **kwargs: response)
+
+    collection = GraphQlPageCollection("query", None, logger, bind={"values": ("repository",)})
+
+    with pytest.raises(RetryableError) as error:
+        collection.request_graphql_dict(variables={"numRecords": 100, "cursor": None})
+
+    assert error.value.reason == SECONDARY_RATE_LIMIT
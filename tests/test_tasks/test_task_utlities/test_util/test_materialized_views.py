@@ -0,0 +1,38 @@
+import pytest
+
+from augur.tasks.util.materialized_views import get_refresh_levels
+
+
+def test_independent_views_share_a_level():
+
+    dependencies = {
+        "augur_data.explorer_libyear_all": {"augur_data.repo_dependencies"},
+        "augur_data.explorer_libyear_detail": {"augur_data.repo_dependencies"}
+    }
+
+    assert get_refresh_levels(dependencies) == [["augur_data.explorer_libyear_all", "augur_data.explorer_libyear_detail"]]
+
+
+def test_views_come_after_the_views_they_read():
+
+    dependencies = {
+        "augur_data.explorer_libyear_summary": {"augur_data.explorer_libyear_detail"},
+        "augur_data.explorer_libyear_detail": {"augur_data.repo_dependencies"},
+        "augur_data.api_get_all_repos_commits": {"augur_data.commits"}
+    }
+
+    assert get_refresh_levels(dependencies) == [
+        ["augur_data.api_get_all_repos_commits", "augur_data.explorer_libyear_detail"],
+        ["augur_data.explorer_libyear_summary"]
+    ]
+
+
+def test_cyclic_views_are_rejected():
+
+    dependencies = {
+        "augur_data.a": {"augur_data.b"},
+        "augur_data.b": {"augur_data.a"}
+    }
+
+    with pytest.raises(ValueError):
+        get_refresh_levels(dependencies)
@@ -0,0 +1,40 @@
+import datetime
+
+from augur.tasks.util.repo_daily_activity import changed_activity_days, ISSUES, COMMITS
+
+
+def test_changed_activity_days_skips_unchanged_rows():
+
+    old_dates = {1: (datetime.date(2022, 1, 1), datetime.date(2022, 1, 3))}
+    rows = [{"gh_issue_id": 1, "created_at": "2022-01-01T10:00:00Z", "closed_at": "2022-01-03T12:00:00Z"}]
+
+    assert changed_activity_days(ISSUES, old_dates, rows) == set()
+
+
+def test_changed_activity_days_of_new_and_moved_rows():
+
+    old_dates = {
+        1: (datetime.date(2022, 1, 1), datetime.date(2022, 1, 3)),
+        2: (datetime.date(2022, 1, 2), None)
+    }
+    rows = [
+        # reopened
+        {"gh_issue_id": 1, "created_at": "2022-01-01T10:00:00Z", "closed_at": None},
+        # closed
+        {"gh_issue_id": 2, "created_at": "2022-01-02T10:00:00Z", "closed_at": "2022-02-01T08:00:00Z"},
+        # new
+        {"gh_issue_id": 3, "created_at": "2022-03-01T09:00:00Z", "closed_at": None}
+    ]
+
+    assert changed_activity_days(ISSUES, old_dates, rows) == {
+        datetime.date(2022, 1, 3),
+        datetime.date(2022, 2, 1),
+        datetime.date(2022, 3, 1)
+    }
+
+
+def test_changed_activity_days_accepts_dates():
+
+    rows = [{"cmt_commit_hash": "abc", "cmt_author_date": datetime.datetime(2022, 5, 4, 13, 0)}]
+
+    assert changed_activity_days(COMMITS, {}, rows) == {datetime.date(2022, 5, 4)}
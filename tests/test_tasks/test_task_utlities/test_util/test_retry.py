@@ -0,0 +1,32 @@
+import pytest
+
+from sqlalchemy.exc import OperationalError
+
+from augur.application.db.util import catch_operational_error, DATABASE_RETRY_COUNTDOWN
+from augur.tasks.util.retry import RetryableError, DATABASE_UNAVAILABLE
+
+
+def test_catch_operational_error_retries_once():
+
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("SELECT 1", {}, Exception("connection dropped"))
+        return "result"
+
+    assert catch_operational_error(func) == "result"
+    assert len(calls) == 2
+
+
+def test_catch_operational_error_raises_retryable_error():
+
+    def func():
+        raise OperationalError("SELECT 1", {}, Exception("database is down"))
+
+    with pytest.raises(RetryableError) as error:
+        catch_operational_error(func)
+
+    assert error.value.countdown == DATABASE_RETRY_COUNTDOWN
+    assert error.value.reason == DATABASE_UNAVAILABLE
@@ -29,4 +29,18 @@ def test_remove_duplicates_by_uniques(test_db_engine):
 
 
 
-    
\ No newline at end of file
+    
+
+def test_sort_by_uniques():
+
+    data_1 = {"repo_id": 2, "issue_url": "https://api.github.com/repos/chaoss/augur/issues/1"}
+    data_2 = {"repo_id": 1, "issue_url": "https://api.github.com/repos/chaoss/augur/issues/2"}
+    data_3 = {"repo_id": 1, "issue_url": "https://api.github.com/repos/chaoss/augur/issues/1"}
+    data_4 = {"repo_id": None, "issue_url": "https://api.github.com/repos/chaoss/augur/issues/1"}
+
+    assert sort_by_uniques([data_1, data_4, data_2, data_3], ["repo_id", "issue_url"]) == [data_3, data_2, data_1, data_4]
+
+    # values of different types are compared as strings
+    assert sort_by_uniques([{"cntrb_id": "b"}, {"cntrb_id": 1}], ["cntrb_id"]) == [{"cntrb_id": 1}, {"cntrb_id": "b"}]
+
+    assert sort_by_uniques([data_1, data_2], []) == [data_1, data_2]